@@ -0,0 +1,16 @@
+# ----------------------------------------------------------------------------
+# rbl2_sim
+# Accelerated-time host simulator of the robot (CPython)
+#
+#   python -m rbl2_sim --minutes 60 --sensor tof
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+from rbl2_sim.world import Arena, Walker, RangeSensor
+from rbl2_sim.sim import Simulation, print_results
+
+__version__ = "0.1.0.0"
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,33 @@
+# ----------------------------------------------------------------------------
+# __main__.py
+# Command line interface of the simulator
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import sys
+import argparse
+from rbl2_sim.sim import Simulation, print_results, SENSOR_TOF, SENSOR_EVO
+
+# ----------------------------------------------------------------------------
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Simulate the robot")
+  parser.add_argument("--minutes", type=float, default=10.,
+                      help="simulated time in minutes")
+  parser.add_argument("--sensor", choices=[SENSOR_TOF, SENSOR_EVO],
+                      default=SENSOR_TOF, help="distance sensor type")
+  parser.add_argument("--seed", type=int, default=0, help="random seed")
+  parser.add_argument("--verbose", action="store_true",
+                      help="show the output of the robot program")
+  args = parser.parse_args(argv)
+
+  sim = Simulation(args.minutes, args.sensor, seed=args.seed,
+                   verbose=args.verbose)
+  print_results(sim.run())
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,551 @@
+# ----------------------------------------------------------------------------
+# hw.py
+# Simulated MicroPython environment for CPython: virtual clock with timers and
+# stand-ins for the modules `machine`, `micropython`, `time` and `select`
+# (`rp2` is emulated by `pio.py`).
+#
+# Robot code is imported by a loader that emulates MicroPython's `const()`:
+# all names assigned by `X = const(...)` anywhere in a module (also in class
+# bodies) are visible module-wide, as with the MicroPython compiler.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import os
+import sys
+import ast
+import types
+import builtins
+import importlib.abc
+import importlib.machinery
+import time as _time
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+TICK_COST_US   = 1          # Time that passes with each `ticks_us()` call
+PULSE_T_US     = 10_000     # Period of pulse trains (PWM ToF sensors)
+UART_IRQ_US    = 1000       # Interval of checks for UART RX interrupts
+RP2_UNAME      = ("rp2", "rp2", "1.19.1", "v1.19.1 on 2022-06-18",
+                  "Raspberry Pi Pico with RP2040")
+# Modules that are replaced while the simulation is installed
+FAKE_MODULES   = ["machine", "micropython", "time", "select", "utime", "rp2"]
+# Robot modules (names and prefixes), which are removed after a simulation
+ROBOT_MODULES  = ("main", "robotling_lib")
+ROBOT_PREFIXES = ("rbl2_", "robotling_lib.")
+# pylint: enable=bad-whitespace
+
+_hw = None
+
+# ----------------------------------------------------------------------------
+class SimTimeout(Exception):
+  """Raised if the robot code does not end within the grace period after
+     the simulated time is up."""
+  pass
+
+class SimClock(object):
+  """Virtual time in [us]; advances only when the robot code sleeps (or,
+     marginally, when it reads the time) and fires due timers on the way."""
+
+  def __init__(self):
+    self.t_us = 0
+    self.t_end_us = None
+    self.grace_us = 60_000_000
+    self.on_advance = None
+    self._timers = []
+    self._interrupted = False
+
+  def ticks_us(self):
+    self.t_us += TICK_COST_US
+    return self.t_us
+
+  def ticks_ms(self):
+    return self.t_us //1000
+
+  def advance_us(self, dt_us):
+    """ Advance time by `dt_us`, calling timer callbacks when they are due and
+        `on_advance(t_us)` after each step
+    """
+    t_tgt = self.t_us +max(int(dt_us), 0)
+    while True:
+      tm = None
+      for t in self._timers:
+        if tm is None or t._due_us < tm._due_us:
+          tm = t
+      if tm is None or tm._due_us > t_tgt:
+        break
+      self.t_us = max(self.t_us, tm._due_us)
+      tm._fire()
+      if self.on_advance:
+        self.on_advance(self.t_us)
+    self.t_us = max(self.t_us, t_tgt)
+    if self.on_advance:
+      self.on_advance(self.t_us)
+    self._check_end()
+
+  def _check_end(self):
+    if self.t_end_us is None:
+      return
+    if not self._interrupted and self.t_us >= self.t_end_us:
+      # Ends the main loop of `main.py` like Ctrl-C
+      self._interrupted = True
+      raise KeyboardInterrupt
+    if self.t_us >= self.t_end_us +self.grace_us:
+      raise SimTimeout("Robot code did not end in time")
+
+  @property
+  def time_is_up(self):
+    return self._interrupted
+
+# ----------------------------------------------------------------------------
+class SimHardware(object):
+  """Hardware state seen by the fake `machine` module; the world model
+     registers input handlers here."""
+
+  def __init__(self, clock):
+    self.clock = clock
+    self.pwms = {}          # pin -> `PWM`
+    self.pin_values = {}    # pin -> value or callable()
+    self.pin_waves = {}     # pin -> callable(t_us) returning the level
+    self.adc_values = {}    # pin -> value or callable()
+    self.pulse_src = {}     # pin -> callable() returning pulse width [us]
+    self.uart_src = {}      # UART id -> callable(t_us) returning bytes
+    self.pulse_trains = {}  # pin -> `_PulseTrain` (pins with an IRQ handler)
+    self._saved = {}
+
+  def servo_us(self, pin):
+    """ Returns the pulse width (in [us]) of the PWM signal at `pin` or 0
+    """
+    pwm = self.pwms.get(pin)
+    if pwm is None or pwm._freq == 0:
+      return 0
+    return pwm._duty *1_000_000 /(65536 *pwm._freq)
+
+  def pin_level(self, pin, t_us=None):
+    """ Returns the level of input `pin` at time `t_us` (default: now)
+    """
+    wave = self.pin_waves.get(pin)
+    if wave:
+      return wave(self.clock.t_us if t_us is None else t_us)
+    return int(_value(self.pin_values.get(pin, 0)))
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def install(self, root):
+    """ Replace the MicroPython-specific modules, make robot code in `root`
+        importable and emulate an RP2040 platform
+    """
+    global _hw
+    _hw = self
+    for name in FAKE_MODULES:
+      self._saved[name] = sys.modules.get(name)
+    sys.modules["machine"] = _make_machine()
+    sys.modules["micropython"] = _make_micropython()
+    sys.modules["time"] = _make_time(self.clock)
+    sys.modules["utime"] = sys.modules["time"]
+    sys.modules["select"] = _make_select(self.clock)
+    from rbl2_sim.pio import make_rp2
+    sys.modules["rp2"] = make_rp2()
+    self._saved_builtins = {k: getattr(builtins, k, None)
+                            for k in ["const", "micropython"]}
+    builtins.const = sys.modules["micropython"].const
+    builtins.micropython = sys.modules["micropython"]
+    self._finder = _ConstFinder(root)
+    sys.meta_path.insert(0, self._finder)
+    sys.path.insert(0, root)
+    self._root = root
+    _remove_robot_modules()
+
+    # `platform.py` identifies the board via `os.uname()`
+    uname = os.uname
+    os.uname = lambda: RP2_UNAME
+    try:
+      importlib.import_module("robotling_lib.platform.platform")
+    finally:
+      os.uname = uname
+
+  def uninstall(self):
+    global _hw
+    _remove_robot_modules()
+    for name, mod in self._saved.items():
+      if mod is None:
+        sys.modules.pop(name, None)
+      else:
+        sys.modules[name] = mod
+    for k, v in self._saved_builtins.items():
+      if v is None:
+        delattr(builtins, k)
+      else:
+        setattr(builtins, k, v)
+    sys.meta_path.remove(self._finder)
+    sys.path.remove(self._root)
+    _hw = None
+
+def _remove_robot_modules():
+  for name in list(sys.modules.keys()):
+    if name in ROBOT_MODULES or name.startswith(ROBOT_PREFIXES):
+      del sys.modules[name]
+
+# ----------------------------------------------------------------------------
+# MicroPython `const()` emulation
+# ----------------------------------------------------------------------------
+def _collect_consts(src):
+  """ Returns a dictionary with all `NAME = const(expr)` assignments in the
+      source, evaluated in order of appearance
+  """
+  consts = {}
+  nodes = []
+  for node in ast.walk(ast.parse(src)):
+    if (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+        isinstance(node.targets[0], ast.Name) and
+        isinstance(node.value, ast.Call) and len(node.value.args) == 1):
+      f = node.value.func
+      if ((isinstance(f, ast.Name) and f.id == "const") or
+          (isinstance(f, ast.Attribute) and f.attr == "const")):
+        nodes.append(node)
+  nodes.sort(key=lambda n: (n.lineno, n.col_offset))
+  for node in nodes:
+    try:
+      expr = ast.Expression(node.value.args[0])
+      consts[node.targets[0].id] = eval(compile(expr, "<const>", "eval"),
+                                        {}, consts)
+    except Exception:
+      pass
+  return consts
+
+class _ConstLoader(importlib.machinery.SourceFileLoader):
+  def exec_module(self, module):
+    module.__dict__.update(_collect_consts(self.get_source(module.__name__)))
+    super().exec_module(module)
+
+class _ConstFinder(importlib.abc.MetaPathFinder):
+  def __init__(self, root):
+    self._root = os.path.abspath(root)
+
+  def find_spec(self, name, path, target=None):
+    spec = importlib.machinery.PathFinder.find_spec(name, path)
+    if spec is None or not spec.origin or not spec.origin.endswith(".py"):
+      return None
+    if not os.path.abspath(spec.origin).startswith(self._root):
+      return None
+    spec.loader = _ConstLoader(name, spec.origin)
+    return spec
+
+# ----------------------------------------------------------------------------
+# Fake modules
+# ----------------------------------------------------------------------------
+def _value(v):
+  return v() if callable(v) else v
+
+def _pin_id(pin):
+  return pin._id if isinstance(pin, _Pin) else pin
+
+class _Pin(object):
+  IN = 0
+  OUT = 1
+  OPEN_DRAIN = 2
+  ALT = 3
+  PULL_UP = 1
+  PULL_DOWN = 2
+  IRQ_FALLING = 4
+  IRQ_RISING = 8
+
+  def __init__(self, id, mode=-1, pull=-1, value=None):
+    self._id = _pin_id(id)
+    self._mode = mode
+    self._handler = None
+    self._trigger = 0
+    if value is not None:
+      self.value(value)
+
+  def init(self, mode=-1, pull=-1, value=None):
+    self._mode = mode
+    if value is not None:
+      self.value(value)
+
+  def value(self, v=None):
+    if v is None:
+      return _hw.pin_level(self._id)
+    if self._mode == _Pin.OUT:
+      _hw.pin_values[self._id] = 1 if v else 0
+
+  def on(self):
+    self.value(1)
+
+  def off(self):
+    self.value(0)
+
+  high = on
+  low = off
+
+  def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+    self._handler = handler
+    self._trigger = trigger
+    old = _hw.pulse_trains.pop(self._id, None)
+    if old:
+      old.stop()
+    src = _hw.pulse_src.get(self._id)
+    if handler and src:
+      _hw.pulse_trains[self._id] = _PulseTrain(self, src)
+
+  def __call__(self, v=None):
+    return self.value(v)
+
+class _PulseTrain(object):
+  """Drives an input pin with pulses from a pulse source (one per period)
+     and calls the pin's interrupt handler at the edges."""
+
+  def __init__(self, pin, src):
+    self._pin = pin
+    self._src = src
+    self._high = False
+    self._due_us = _hw.clock.t_us +PULSE_T_US
+    _hw.clock._timers.append(self)
+
+  def stop(self):
+    if self in _hw.clock._timers:
+      _hw.clock._timers.remove(self)
+    _hw.pin_values[self._pin._id] = 0
+
+  def _fire(self):
+    t0 = self._due_us
+    if self._high:
+      self._high = False
+      self._due_us = self._t_start +PULSE_T_US
+      edge = _Pin.IRQ_FALLING
+    else:
+      w = int(self._src())
+      if w <= 0 or w >= PULSE_T_US:
+        # No pulse in this period
+        self._due_us += PULSE_T_US
+        return
+      self._high = True
+      self._t_start = t0
+      self._due_us = t0 +w
+      edge = _Pin.IRQ_RISING
+    _hw.pin_values[self._pin._id] = int(self._high)
+    if self._pin._trigger & edge:
+      self._pin._handler(self._pin)
+
+class _ADC(object):
+  def __init__(self, pin):
+    self._id = _pin_id(pin)
+
+  def read_u16(self):
+    return int(_value(_hw.adc_values.get(self._id, 0)))
+
+class _PWM(object):
+  def __init__(self, pin):
+    self._id = _pin_id(pin)
+    self._freq = 0
+    self._duty = 0
+    _hw.pwms[self._id] = self
+
+  def freq(self, f=None):
+    if f is None:
+      return self._freq
+    self._freq = int(f)
+
+  def duty_u16(self, d=None):
+    if d is None:
+      return self._duty
+    self._duty = int(d)
+
+  def deinit(self):
+    self._duty = 0
+    _hw.pwms.pop(self._id, None)
+
+class _Timer(object):
+  ONE_SHOT = 0
+  PERIODIC = 1
+
+  def __init__(self, id=-1, **kwargs):
+    self._cb = None
+    self._period_us = 0
+    self._due_us = 0
+    self._mode = _Timer.PERIODIC
+    if kwargs:
+      self.init(**kwargs)
+
+  def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+    clk = _hw.clock
+    self.deinit()
+    self._mode = mode
+    self._cb = callback
+    self._period_us = period *1000 if period > 0 else int(1_000_000 /freq)
+    self._due_us = clk.t_us +self._period_us
+    clk._timers.append(self)
+
+  def deinit(self):
+    if self in _hw.clock._timers:
+      _hw.clock._timers.remove(self)
+
+  def _fire(self):
+    if self._mode == _Timer.PERIODIC:
+      self._due_us += self._period_us
+    else:
+      self.deinit()
+    if self._cb:
+      self._cb(self)
+
+class _UART(object):
+  IRQ_RXIDLE = 0x1000
+
+  def __init__(self, id, baudrate=9600, **kwargs):
+    self._id = id
+    self._baud = baudrate
+    self._rx = b""
+    self._handler = None
+    self._inIRQ = False
+
+  def init(self, baudrate=9600, **kwargs):
+    self._baud = baudrate
+
+  def deinit(self):
+    self.irq(None)
+
+  def irq(self, handler=None, trigger=0, hard=False):
+    # RX idle interrupt: checked every `UART_IRQ_US` (as a timer)
+    clk = _hw.clock
+    if self in clk._timers:
+      clk._timers.remove(self)
+    self._handler = handler
+    if handler:
+      self._due_us = clk.t_us +UART_IRQ_US
+      clk._timers.append(self)
+
+  def _fire(self):
+    self._due_us += UART_IRQ_US
+    n = len(self._rx)
+    self._fetch()
+    if len(self._rx) > n:
+      self._inIRQ = True
+      try:
+        self._handler(self)
+      finally:
+        self._inIRQ = False
+
+  def _fetch(self):
+    src = _hw.uart_src.get(self._id)
+    if src:
+      self._rx += src(_hw.clock.t_us)
+
+  def any(self):
+    self._fetch()
+    return len(self._rx)
+
+  def read(self, n=-1):
+    self._fetch()
+    if len(self._rx) == 0:
+      return None
+    n = len(self._rx) if n is None or n < 0 else n
+    res = self._rx[:n]
+    self._rx = self._rx[n:]
+    # Time it takes to transfer the bytes (already received in an interrupt)
+    if not self._inIRQ:
+      _hw.clock.advance_us(len(res) *10_000_000 //self._baud)
+    return res
+
+  def readinto(self, buf, n=-1):
+    res = self.read(len(buf) if n is None or n < 0 else min(n, len(buf)))
+    if not res:
+      return None
+    buf[:len(res)] = res
+    return len(res)
+
+  def write(self, buf):
+    return len(buf)
+
+def _time_pulse_us(pin, level, timeout_us=1_000_000):
+  src = _hw.pulse_src.get(_pin_id(pin))
+  if src is None:
+    _hw.clock.advance_us(timeout_us)
+    return -2
+  t = int(src())
+  if t < 0 or t > timeout_us:
+    _hw.clock.advance_us(timeout_us)
+    return -1
+  # Waiting for the start of the pulse plus the pulse itself
+  _hw.clock.advance_us(2 *t)
+  return t
+
+def _make_machine():
+  m = types.ModuleType("machine")
+  m.Pin = _Pin
+  m.ADC = _ADC
+  m.PWM = _PWM
+  m.Timer = _Timer
+  m.UART = _UART
+  m.time_pulse_us = _time_pulse_us
+  m.freq = lambda f=None: 125_000_000 if f is None else None
+  m.unique_id = lambda: b"\x00rbl2sim"
+  m.disable_irq = lambda: 0
+  m.enable_irq = lambda state=0: None
+  m.reset = lambda: None
+  m.idle = lambda: _hw.clock.advance_us(100)
+  return m
+
+def _make_micropython():
+  m = types.ModuleType("micropython")
+  m.const = lambda x: x
+  m.native = lambda f: f
+  m.viper = lambda f: f
+  m.alloc_emergency_exception_buf = lambda n: None
+  m.schedule = lambda f, arg: f(arg)
+  m.mem_info = lambda *args: None
+  m.opt_level = lambda *args: 0
+  return m
+
+def _make_time(clock):
+  m = types.ModuleType("time")
+  m.ticks_us = clock.ticks_us
+  m.ticks_ms = clock.ticks_ms
+  m.ticks_diff = lambda t1, t0: t1 -t0
+  m.ticks_add = lambda t, dt: t +dt
+  m.sleep_us = lambda dt: clock.advance_us(dt)
+  m.sleep_ms = lambda dt: clock.advance_us(dt *1000)
+  m.sleep = lambda dt: clock.advance_us(dt *1_000_000)
+  m.time = lambda: clock.t_us /1_000_000
+  m.__getattr__ = lambda name: getattr(_time, name)
+  return m
+
+class _Poll(object):
+  def __init__(self, clock):
+    self._clock = clock
+    self._objs = []
+
+  def register(self, obj, mask=1 | 4):
+    self._objs.append((obj, mask))
+
+  def unregister(self, obj):
+    self._objs = [(o, m) for o, m in self._objs if o is not obj]
+
+  def _ready(self):
+    res = []
+    for obj, mask in self._objs:
+      if hasattr(obj, "any"):
+        if mask & 1 and obj.any() > 0:
+          res.append((obj, 1))
+      elif mask & 4:
+        res.append((obj, 4))
+    return res
+
+  def poll(self, timeout=-1):
+    res = self._ready()
+    if not res and timeout > 0:
+      self._clock.advance_us(timeout *1000)
+      res = self._ready()
+    return res
+
+  ipoll = poll
+
+def _make_select(clock):
+  m = types.ModuleType("select")
+  m.POLLIN = 1
+  m.POLLOUT = 4
+  m.POLLERR = 8
+  m.POLLHUP = 16
+  m.poll = lambda: _Poll(clock)
+  return m
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,585 @@
+# ----------------------------------------------------------------------------
+# pio.py
+# Cycle-level stand-in for the `rp2` module: `asm_pio` assembles a PIO program
+# written in MicroPython's PIO assembler syntax into instruction objects and
+# `StateMachine` executes them cycle by cycle, in step with the simulated
+# clock. Input pins are read from `SimHardware.pin_waves` (level as function
+# of time) or `pin_values`.
+#
+# Usage (checks the multi-channel ToF capture driver against known pulses):
+#   python -m rbl2_sim.pio [--ms 200] [--seed 1] [--poll]
+#
+# Not covered: side-set, `out`/`pull` autopull, `exec`, PIO-wide IRQ waits
+# and clock divider jitter.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import sys
+import types
+import random
+import argparse
+from collections import deque
+import rbl2_sim.hw as hw
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+SYNC_US        = 50         # Interval in which state machines catch up [us]
+FIFO_DEPTH     = 4
+MASK32         = 0xFFFFFFFF
+# Condition, source and destination names of the PIO assembler
+_NAMES         = ["x", "y", "null", "isr", "osr", "pins", "pindirs", "pc",
+                  "exec", "status", "pin", "gpio", "block", "noblock",
+                  "iffull", "ifempty", "clear", "x_dec", "y_dec", "not_x",
+                  "not_y", "x_not_y", "not_osre"]
+# pylint: enable=bad-whitespace
+
+class PIOError(Exception):
+  pass
+
+# ----------------------------------------------------------------------------
+# Assembler
+# ----------------------------------------------------------------------------
+class _Instr(object):
+  """One PIO instruction; `[n]` sets the delay, `.side(v)` the side-set."""
+
+  def __init__(self, op, *args):
+    self.op = op
+    self.args = args
+    self.delay = 0
+    self.sideset = None
+
+  def __getitem__(self, delay):
+    self.delay = delay
+    return self
+
+  def side(self, v):
+    self.sideset = v
+    return self
+
+  def __repr__(self):
+    return "{0}{1}[{2}]".format(self.op, self.args, self.delay)
+
+class Program(object):
+  """Assembled program with its `asm_pio` options."""
+
+  def __init__(self, name, options):
+    self.name = name
+    self.options = options
+    self.instrs = []
+    self.labels = {}
+    self.wrap_target = 0
+    self.wrap = None
+
+  def _emit(self, op, *args):
+    ins = _Instr(op, *args)
+    self.instrs.append(ins)
+    return ins
+
+  def _namespace(self):
+    p = self
+    ns = {n: n for n in _NAMES}
+
+    def wrap_target():
+      p.wrap_target = len(p.instrs)
+
+    def wrap():
+      p.wrap = len(p.instrs) -1
+
+    def label(name):
+      p.labels[name] = len(p.instrs)
+
+    def jmp(cond, target=None):
+      if target is None:
+        cond, target = None, cond
+      return p._emit("jmp", cond, target)
+
+    def irq(*args):
+      # irq([block|clear], index)
+      mode = args[0] if len(args) > 1 else None
+      return p._emit("irq", mode, args[-1])
+
+    def in_(src, n):
+      return p._emit("in", src, n)
+
+    def out(dst, n):
+      return p._emit("out", dst, n)
+
+    def push(*args):
+      return p._emit("push", "noblock" not in args, "iffull" in args)
+
+    def pull(*args):
+      return p._emit("pull", "noblock" not in args, "ifempty" in args)
+
+    ns.update({
+        "wrap_target": wrap_target, "wrap": wrap, "label": label, "jmp": jmp,
+        "irq": irq, "in_": in_, "out": out, "push": push, "pull": pull,
+        "nop": lambda: p._emit("mov", "y", "y"),
+        "wait": lambda pol, src, idx: p._emit("wait", pol, src, idx),
+        "mov": lambda dst, src: p._emit("mov", dst, src),
+        "set": lambda dst, v: p._emit("set", dst, v),
+        "word": lambda v, label=None: p._emit("word", v),
+        "invert": lambda src: ("invert", src),
+        "reverse": lambda src: ("reverse", src),
+        "rel": lambda i: ("rel", i)
+      })
+    return ns
+
+  def assemble(self, f):
+    """ Runs the program function `f` with the assembler functions in its
+        globals (as MicroPython's `asm_pio` does)
+    """
+    g = f.__globals__
+    ns = self._namespace()
+    saved = {k: g[k] for k in ns if k in g}
+    g.update(ns)
+    try:
+      f()
+    finally:
+      for k in ns:
+        g.pop(k, None)
+      g.update(saved)
+    if self.wrap is None:
+      self.wrap = len(self.instrs) -1
+    if len(self.instrs) > 32:
+      raise PIOError("`{0}` has more than 32 instructions".format(self.name))
+    for ins in self.instrs:
+      if ins.op == "jmp" and ins.args[1] not in self.labels:
+        raise PIOError("Unknown label `{0}`".format(ins.args[1]))
+
+def asm_pio(**options):
+  def _dec(f):
+    prog = Program(f.__name__, options)
+    prog.assemble(f)
+    return prog
+  return _dec
+
+class PIO(object):
+  IN_LOW = 0
+  IN_HIGH = 1
+  OUT_LOW = 2
+  OUT_HIGH = 3
+  SHIFT_LEFT = 0
+  SHIFT_RIGHT = 1
+  JOIN_NONE = 0
+  JOIN_TX = 1
+  JOIN_RX = 2
+  IRQ_SM0 = 0x100
+  IRQ_SM1 = 0x200
+  IRQ_SM2 = 0x400
+  IRQ_SM3 = 0x800
+
+  def __init__(self, id):
+    self._id = id
+
+  def state_machine(self, id, *args, **kwargs):
+    return StateMachine(self._id *4 +id, *args, **kwargs)
+
+# ----------------------------------------------------------------------------
+# State machine
+# ----------------------------------------------------------------------------
+class StateMachine(object):
+  """Executes a `Program` one cycle at a time; it catches up with the
+     simulated clock whenever it is accessed and every `SYNC_US`."""
+
+  def __init__(self, id, prog=None, freq=-1, **kwargs):
+    self._id = id
+    self._prog = None
+    self._active = False
+    self._handler = None
+    self._pendIRQ = False
+    self._inHandler = False
+    self.stalls_us = 0
+    self.dropped = 0
+    if prog is not None:
+      self.init(prog, freq, **kwargs)
+
+  def init(self, prog, freq=-1, in_base=None, out_base=None, set_base=None,
+           jmp_pin=None, sideset_base=None, in_shiftdir=None,
+           out_shiftdir=None, push_thresh=None, pull_thresh=None):
+    opt = prog.options
+    self._prog = prog
+    self._freq = freq if freq > 0 else 125_000_000
+    self._inBase = hw._pin_id(in_base) if in_base is not None else 0
+    self._setBase = hw._pin_id(set_base) if set_base is not None else 0
+    self._jmpPin = hw._pin_id(jmp_pin) if jmp_pin is not None else 0
+    sdir = opt.get("in_shiftdir", 0) if in_shiftdir is None else in_shiftdir
+    self._inLeft = sdir == PIO.SHIFT_LEFT
+    self._autopush = opt.get("autopush", False)
+    self._pushThresh = (opt.get("push_thresh", 32) if push_thresh is None
+                        else push_thresh)
+    join = opt.get("fifo_join", PIO.JOIN_NONE)
+    self._rx = deque()
+    self._rxDepth = FIFO_DEPTH *(2 if join == PIO.JOIN_RX else 1)
+    self._tx = deque()
+    self._txDepth = FIFO_DEPTH *(2 if join == PIO.JOIN_TX else 1)
+    self.restart()
+
+  def restart(self):
+    self.pc = 0
+    self.x = self.y = 0
+    self.isr = self.osr = 0
+    self._isrCnt = 0
+    self._osrCnt = 32
+    self._delay = 0
+    self._rx.clear()
+    self.cycles = 0
+    self._t0_us = hw._hw.clock.t_us
+
+  def active(self, v=None):
+    if v is None:
+      return int(self._active)
+    clk = hw._hw.clock
+    if v and not self._active:
+      self._t0_us = clk.t_us -self.cycles *1e6 /self._freq
+      self._due_us = clk.t_us +SYNC_US
+      clk._timers.append(self)
+    elif not v and self._active:
+      self._sync()
+      if self in clk._timers:
+        clk._timers.remove(self)
+    self._active = bool(v)
+    return int(self._active)
+
+  def irq(self, handler=None, trigger=0 | 1, hard=False):
+    self._handler = handler
+
+  def rx_fifo(self):
+    self._sync()
+    return len(self._rx)
+
+  def tx_fifo(self):
+    self._sync()
+    return len(self._tx)
+
+  def get(self, buf=None, shift=0):
+    self._sync()
+    while not self._rx:
+      # Would block on the hardware; let the simulated time run
+      if not self._active:
+        raise PIOError("`get()` on an empty FIFO of a stopped state machine")
+      hw._hw.clock.advance_us(1)
+      self.stalls_us += 1
+    return self._rx.popleft() >> shift
+
+  def put(self, value, shift=0):
+    self._sync()
+    while len(self._tx) >= self._txDepth:
+      hw._hw.clock.advance_us(1)
+      self.stalls_us += 1
+    self._tx.append((value << shift) & MASK32)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _fire(self):
+    # Called by `SimClock` like a timer
+    self._due_us += SYNC_US
+    self._sync()
+
+  def _sync(self):
+    # Catch up with the clock; runs up to each IRQ, calls the handler and
+    # continues (the handler sees the state machine at the IRQ's cycle)
+    if not self._active or self._inHandler:
+      return
+    while True:
+      n = int((hw._hw.clock.t_us -self._t0_us) *self._freq /1e6) -self.cycles
+      if n <= 0:
+        break
+      self.run(n)
+      if self._pendIRQ:
+        self._pendIRQ = False
+        self._inHandler = True
+        try:
+          self._handler(self)
+        finally:
+          self._inHandler = False
+
+  def _pins(self, base, n=32):
+    t_us = self._t0_us +self.cycles *1e6 /self._freq
+    v = 0
+    for i in range(n):
+      if hw._hw.pin_level((base +i) %32, t_us):
+        v |= 1 << i
+    return v
+
+  def run(self, n):
+    """ Executes `n` cycles
+    """
+    prog = self._prog.instrs
+    while n > 0:
+      n -= 1
+      if self._delay > 0:
+        self._delay -= 1
+        self.cycles += 1
+        continue
+      ins = prog[self.pc]
+      nxt = self._exec(ins)
+      self.cycles += 1
+      if nxt is None:
+        # Stalled: the instruction is repeated in the next cycle
+        continue
+      self._delay = ins.delay
+      if nxt is True:
+        nxt = (self._prog.wrap_target if self.pc == self._prog.wrap
+               else self.pc +1)
+      self.pc = nxt
+      if self._pendIRQ:
+        break
+
+  def _src(self, src, n=32):
+    if isinstance(src, tuple) and src[0] == "invert":
+      return ~self._src(src[1], n) & MASK32
+    if isinstance(src, tuple) and src[0] == "reverse":
+      return int("{0:032b}".format(self._src(src[1], n))[::-1], 2)
+    if src == "pins":
+      return self._pins(self._inBase, n)
+    if src == "x":
+      return self.x
+    if src == "y":
+      return self.y
+    if src == "null":
+      return 0
+    if src == "isr":
+      return self.isr
+    if src == "osr":
+      return self.osr
+    if src == "status":
+      return MASK32 if len(self._tx) < 1 else 0
+    raise PIOError("Unsupported source `{0}`".format(src))
+
+  def _push(self, block):
+    if len(self._rx) >= self._rxDepth:
+      if block:
+        return False
+      self.dropped += 1
+    else:
+      self._rx.append(self.isr)
+    self.isr = 0
+    self._isrCnt = 0
+    return True
+
+  def _exec(self, ins):
+    """ Executes one instruction; returns the next pc, True for the next
+        instruction or None, if the state machine stalls
+    """
+    op, a = ins.op, ins.args
+    if op == "jmp":
+      cond, tgt = a
+      take = True
+      if cond == "not_x":
+        take = self.x == 0
+      elif cond == "x_dec":
+        take = self.x != 0
+        self.x = (self.x -1) & MASK32
+      elif cond == "not_y":
+        take = self.y == 0
+      elif cond == "y_dec":
+        take = self.y != 0
+        self.y = (self.y -1) & MASK32
+      elif cond == "x_not_y":
+        take = self.x != self.y
+      elif cond == "pin":
+        take = self._pins(self._jmpPin, 1) == 1
+      elif cond == "not_osre":
+        take = self._osrCnt < 32
+      return self._prog.labels[tgt] if take else True
+
+    if op == "wait":
+      pol, src, idx = a
+      if src == "pin":
+        v = self._pins((self._inBase +idx) %32, 1)
+      elif src == "gpio":
+        v = self._pins(idx, 1)
+      else:
+        raise PIOError("Unsupported wait source `{0}`".format(src))
+      return True if v == pol else None
+
+    if op == "in":
+      src, n = a
+      n = 32 if n == 0 else n
+      v = self._src(src, n) & ((1 << n) -1)
+      full = self._isrCnt +n >= self._pushThresh
+      if self._autopush and full and len(self._rx) >= self._rxDepth:
+        # Autopush to a full FIFO stalls the `in`
+        return None
+      if self._inLeft:
+        self.isr = ((self.isr << n) | v) & MASK32
+      else:
+        self.isr = (self.isr >> n) | (v << (32 -n)) & MASK32
+      self._isrCnt = min(self._isrCnt +n, 32)
+      if self._autopush and full:
+        self._push(False)
+      return True
+
+    if op == "push":
+      block, iffull = a
+      if iffull and self._isrCnt < self._pushThresh:
+        return True
+      return True if self._push(block) else None
+
+    if op == "pull":
+      block, ifempty = a
+      if not self._tx:
+        if block:
+          return None
+        self.osr = self.x
+      else:
+        self.osr = self._tx.popleft()
+      self._osrCnt = 0
+      return True
+
+    if op == "mov":
+      dst, src = a
+      v = self._src(src)
+      if dst == "x":
+        self.x = v
+      elif dst == "y":
+        self.y = v
+      elif dst == "isr":
+        self.isr = v
+        self._isrCnt = 0
+      elif dst == "osr":
+        self.osr = v
+        self._osrCnt = 0
+      elif dst == "pc":
+        return v & 0x1F
+      elif dst != "pins":
+        raise PIOError("Unsupported destination `{0}`".format(dst))
+      return True
+
+    if op == "set":
+      dst, v = a
+      if dst == "x":
+        self.x = v & 0x1F
+      elif dst == "y":
+        self.y = v & 0x1F
+      elif dst not in ("pins", "pindirs"):
+        raise PIOError("Unsupported destination `{0}`".format(dst))
+      return True
+
+    if op == "irq":
+      mode, idx = a
+      if mode == "clear":
+        return True
+      if isinstance(idx, tuple):
+        idx = (idx[1] +self._id) %4
+      if idx == self._id %4 and self._handler:
+        self._pendIRQ = True
+      return True
+
+    raise PIOError("Unsupported instruction `{0}`".format(ins))
+
+def make_rp2():
+  """ Returns the fake `rp2` module
+  """
+  m = types.ModuleType("rp2")
+  m.asm_pio = asm_pio
+  m.PIO = PIO
+  m.StateMachine = StateMachine
+  m.PIOASMError = PIOError
+  return m
+
+# ----------------------------------------------------------------------------
+# Check of the multi-channel ToF capture (`PololuTOFCapture`)
+# ----------------------------------------------------------------------------
+class _PulseWave(object):
+  """Pulse train with random widths (period `period_us`); remembers the
+     pulses for comparison."""
+
+  def __init__(self, rng, phase_us, period_us=10_000, w_min=1000, w_max=2600):
+    self.pulses = []
+    t = phase_us
+    while t < 10_000_000:
+      self.pulses.append((t, rng.randint(w_min, w_max)))
+      t += period_us
+    self._period = period_us
+
+  def __call__(self, t_us):
+    i = int(t_us //self._period)
+    if i >= len(self.pulses):
+      return 0
+    t0, w = self.pulses[i]
+    if t_us < t0 and i > 0:
+      t0, w = self.pulses[i -1]
+    return 1 if t0 <= t_us < t0 +w else 0
+
+  def latest(self, t_us):
+    """ Returns the latest pulse (start, width) completed at `t_us`
+    """
+    res = None
+    for t0, w in self.pulses:
+      if t0 +w > t_us:
+        break
+      res = (t0, w)
+    return res
+
+def check_capture(ms=200, seed=1, use_irq=True, read_ms=3):
+  """ Runs the capture driver on the cycle-level state machine against
+      three random pulse trains and compares what the driver reports with
+      the pulses; returns a dictionary with the results
+  """
+  rng = random.Random(seed)
+  clk = hw.SimClock()
+  sim = hw.SimHardware(clk)
+  from rbl2_sim.sim import ROBOT_ROOT
+  sim.install(ROBOT_ROOT)
+  try:
+    import robotling_lib.sensors.pololu_tof_ranging_pio as tp
+    pins = [3, 5, 4]
+    waves = [_PulseWave(rng, rng.randint(0, 9000)) for _ in pins]
+    for p, w in zip(pins, waves):
+      sim.pin_waves[p] = w
+    cap = tp.PololuTOFCapture(pins, 0, use_irq=use_irq)
+    sm = cap._sm
+    errs = []
+    nReads = nStale = 0
+    while clk.t_us < ms *1000:
+      clk.advance_us(read_ms *1000)
+      for i, sens in enumerate(cap.sensors):
+        v = sens.range_raw
+        nReads += 1
+        # The driver reports the latest pulse completed now or, with the
+        # IRQ, in the last sync interval
+        t = clk.t_us
+        ref = waves[i].latest(t -SYNC_US -2)
+        if v < 0 or ref is None:
+          nStale += 1
+          continue
+        cands = [w for t0, w in waves[i].pulses if sum(ref) <= t0 +w <= t]
+        errs.append(min(abs(v -w) for w in cands))
+    cap.deinit()
+    return {
+        "reads": nReads,
+        "stale": nStale,
+        "max_err_us": max(errs) if errs else None,
+        "words": cap.counters[0],
+        "rejected": cap.counters[1],
+        "dropped": sm.dropped,
+        "blocked_us": sm.stalls_us,
+        "cycles": sm.cycles
+      }
+  finally:
+    sim.uninstall()
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      description="Check the PIO multi-channel ToF capture")
+  parser.add_argument("--ms", type=int, default=200, help="duration in [ms]")
+  parser.add_argument("--seed", type=int, default=1, help="random seed")
+  parser.add_argument("--poll", action="store_true",
+                      help="drain the FIFO when reading, not in the IRQ")
+  args = parser.parse_args(argv)
+
+  res = check_capture(args.ms, args.seed, not args.poll)
+  for k, v in res.items():
+    print("{0:>12} : {1}".format(k, v))
+  ok = (res["max_err_us"] is not None and res["max_err_us"] <= 2 and
+        res["blocked_us"] == 0 and res["rejected"] == 0)
+  print("OK" if ok else "FAILED")
+  return 0 if ok else 1
+
+if __name__ == "__main__":
+  sys.exit(main())
+
+# ----------------------------------------------------------------------------
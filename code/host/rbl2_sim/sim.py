@@ -0,0 +1,285 @@
+# ----------------------------------------------------------------------------
+# sim.py
+# Runs the unmodified robot program (`main.py` with `rbl2_robot`, `rbl2_gait`,
+# `ServoManager`, ...) on CPython in simulated time against the world model
+# and collects performance metrics.
+#
+# Usage:
+#   from rbl2_sim import Simulation
+#   res = Simulation(minutes=60, sensor="tof", seed=1).run()
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import os
+import sys
+import time
+import random
+import runpy
+import importlib
+import contextlib
+from math import hypot, cos, sin
+from rbl2_sim.hw import SimClock, SimHardware, SimTimeout
+from rbl2_sim.world import Arena, Walker, tof_sensors, evo_sensors
+from rbl2_sim.world import BODY_RADIUS_MM
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+ROBOT_ROOT     = os.path.abspath(
+                   os.path.join(os.path.dirname(__file__), "..", "..",
+                                "micropython"))
+SENSOR_TOF     = "tof"
+SENSOR_EVO     = "evo"
+MISSED_US      = 2_000_000  # Hazard counts as missed w/o reaction after
+EVO_FRAME_US   = 10_000     # Evo Mini frame interval
+VSYS_V         = 5.0
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+def crc8(data):
+  """ CRC-8 (polynomial 0x07), as used by the TeraRanger sensors
+  """
+  c = 0
+  for b in data:
+    c ^= b
+    for _ in range(8):
+      c = ((c << 1) ^ 0x07) & 0xFF if c & 0x80 else (c << 1) & 0xFF
+  return c
+
+# ----------------------------------------------------------------------------
+class Simulation(object):
+  """One headless run of the robot program in simulated time."""
+
+  def __init__(self, minutes=10., sensor=SENSOR_TOF, arena=None, seed=0,
+               patches=None, setup=None, noise_mm=2., verbose=False):
+    """ `patches` is a dictionary of module names (e.g. "rbl2_config",
+        "rbl2_gait") each with a dictionary of attributes to override
+        before the robot program starts; `setup` is an optional function
+        that is called after that (with the robot modules importable)
+    """
+    self.minutes = minutes
+    self.sensor = sensor
+    self.arena = arena if arena else Arena.default()
+    self.seed = seed
+    self.patches = patches if patches else {}
+    self.setup = setup
+    self.noise_mm = noise_mm
+    self.verbose = verbose
+    self._rng = random.Random(seed)
+    self._clk = None
+    self._hw = None
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def run(self):
+    """ Run the robot program until the simulated time is up; returns a
+        dictionary with the metrics
+    """
+    self._clk = SimClock()
+    self._hw = SimHardware(self._clk)
+    self._walker = Walker(*self.arena.start)
+    self._sensors = tof_sensors() if self.sensor == SENSOR_TOF else evo_sensors()
+    self._reset_metrics()
+
+    wall = time.perf_counter()
+    self._hw.install(ROBOT_ROOT)
+    try:
+      self._setup_robot()
+      self._clk.t_end_us = int(self.minutes *60_000_000)
+      self._clk.on_advance = self._on_advance
+      out = sys.stdout if self.verbose else open(os.devnull, "w")
+      try:
+        with contextlib.redirect_stdout(out):
+          runpy.run_path(os.path.join(ROBOT_ROOT, "main.py"),
+                         run_name="__main__")
+      except SimTimeout:
+        self._aborted = True
+      finally:
+        if out is not sys.stdout:
+          out.close()
+      self._hw_cycles = self._robot.g_counter if self._robot else 0
+    finally:
+      self._hw.uninstall()
+    return self._results(time.perf_counter() -wall)
+
+  def _setup_robot(self):
+    cfg = importlib.import_module("rbl2_config")
+    cfg.HW_CORE = 0
+    cfg.RANDOM_SEED = self.seed
+    if self.sensor == SENSOR_TOF:
+      cfg.DEVICES = ["tof_pwm"]
+      cfg.TOFPWM_USE_PIO = False
+    else:
+      cfg.DEVICES = ["evo_mini"]
+    for mod, attrs in self.patches.items():
+      m = importlib.import_module(mod)
+      for k, v in attrs.items():
+        setattr(m, k, v)
+    if self.setup:
+      self.setup()
+    self._cfg = cfg
+    self._obj_mm = cfg.DIST_TOF_OBJ
+    self._cliff_mm = cfg.DIST_TOF_CLIFF
+    self._robot = None
+
+    # Inputs
+    from robotling_lib.platform.rp2 import board_rp2 as board
+    self._hw.adc_values[board.BAT] = int(VSYS_V /9.9 *65535)
+    self._hw.pin_values[board.VBUS] = 0
+    if self.sensor == SENSOR_TOF:
+      for i, pin in enumerate(cfg.TOFPWM_PINS):
+        self._hw.pulse_src[pin] = self._make_tof_src(i)
+    else:
+      self._tEvo = 0
+      self._hw.uart_src[cfg.EVOMINI_UART] = self._evo_src
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _measure(self, i, noise=True):
+    d = self._sensors[i].measure(self._walker, self.arena)
+    if noise and self.noise_mm > 0:
+      d += self._rng.gauss(0, self.noise_mm)
+    return max(d, 0.)
+
+  def _make_tof_src(self, i):
+    def _src():
+      # Pulse width in [us] (inverse of `PololuTOFRangingSensor.range_cm`)
+      d = self._measure(i)
+      self._note_hazard(d < self._obj_mm or (i != 1 and d > self._cliff_mm))
+      return 1000 +d /0.75
+    return _src
+
+  def _evo_src(self, t_us):
+    # Frames since the last call (at most two, the older ones are lost)
+    n = min((t_us -self._tEvo) //EVO_FRAME_US, 2)
+    if n <= 0:
+      return b""
+    self._tEvo = t_us
+    buf = b""
+    for _ in range(n):
+      d = [self._measure(i) for i in range(len(self._sensors))]
+      self._note_hazard(d[0] < 65 or d[1] < 80 or d[2] < 65 or d[3] < 80 or
+                        d[0] > 120 or d[2] > 120)
+      frm = bytearray(b"T")
+      for i, v in enumerate(d):
+        v = 0xFFFF if v >= self._sensors[i].max_mm else int(v)
+        frm += bytes([v >> 8, v & 0xFF])
+      frm.append(crc8(frm))
+      buf += frm
+    return buf
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _servo_angles(self):
+    cfg = self._cfg
+    res = list(self._angles)
+    for i, pin in enumerate(cfg.SRV_PIN):
+      t = self._hw.servo_us(pin)
+      if t > 0:
+        (u0, u1), (a0, a1) = cfg.SRV_RANGE_US[i], cfg.SRV_RANGE_DEG[i]
+        res[i] = a0 +(t -u0) *(a1 -a0) /(u1 -u0)
+    self._angles = res
+    return res
+
+  def _on_advance(self, t_us):
+    if self._robot is None:
+      self._robot = sys.modules.get("rbl2_robot")
+    w = self._walker
+    dx, dy, rot = w.update(self._servo_angles())
+    if dx or dy or rot:
+      # At an obstacle, only the movement along it remains
+      c, nx, ny = self.arena.clearance(w.x +dx, w.y +dy)
+      if c < BODY_RADIUS_MM:
+        if not self._blocked:
+          self._bumps += 1
+        self._blocked = True
+        dot = dx *nx +dy *ny
+        if dot < 0:
+          dx -= dot *nx
+          dy -= dot *ny
+        if self.arena.clearance(w.x +dx, w.y +dy)[0] < c:
+          dx = dy = 0.
+      else:
+        self._blocked = False
+      w.apply(dx, dy, rot)
+      self._path_mm += hypot(dx, dy)
+      self._fwd_mm += dx *cos(w.h) +dy *sin(w.h)
+      if not self.arena.on_table(w.x, w.y):
+        self._falls += 1
+        self._t_haz = None
+        w.reset(*self.arena.start)
+
+    # Reaction to a hazard that the robot has seen and time it takes to
+    # walk on again (escape)
+    walking = self._is_walking()
+    if walking != self._wasWalking:
+      if not walking:
+        self._t_stop = t_us
+      elif self._t_stop is not None:
+        self._escapes.append((t_us -self._t_stop) /1000)
+      self._wasWalking = walking
+    if self._t_haz is not None:
+      if not walking:
+        self._latencies.append((t_us -self._t_haz) /1000)
+        self._t_haz = None
+      elif t_us -self._t_haz > MISSED_US:
+        self._missed += 1
+        self._t_haz = None
+
+  def _is_walking(self):
+    import rbl2_global as glb
+    return self._robot is not None and self._robot.g_state == glb.STATE_WALKING
+
+  def _note_hazard(self, haz):
+    """ Called when a sensor reading is delivered to the robot program; the
+        reaction latency is the time from the first reading that shows a
+        hazard (obstacle or cliff) while walking until the robot leaves the
+        walking state
+    """
+    if haz and self._t_haz is None and self._is_walking():
+      self._t_haz = self._clk.t_us
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _reset_metrics(self):
+    self._angles = [0., 0., 0.]
+    self._path_mm = 0.
+    self._fwd_mm = 0.
+    self._falls = 0
+    self._bumps = 0
+    self._blocked = False
+    self._latencies = []
+    self._missed = 0
+    self._t_haz = None
+    self._escapes = []
+    self._t_stop = None
+    self._wasWalking = False
+    self._aborted = False
+    self._hw_cycles = 0
+
+  def _results(self, wall_s):
+    t_min = self._clk.t_us /60_000_000
+    lat = self._latencies
+    esc = self._escapes
+    return {
+        "sim_min": t_min,
+        "wall_s": wall_s,
+        "speedup": t_min *60 /wall_s if wall_s > 0 else 0.,
+        "path_mm_per_min": self._path_mm /t_min if t_min > 0 else 0.,
+        "fwd_mm_per_min": self._fwd_mm /t_min if t_min > 0 else 0.,
+        "falls": self._falls,
+        "bumps": self._bumps,
+        "reactions": len(lat),
+        "latency_ms_mean": sum(lat) /len(lat) if lat else 0.,
+        "latency_ms_max": max(lat) if lat else 0.,
+        "missed": self._missed,
+        "escape_ms_mean": sum(esc) /len(esc) if esc else 0.,
+        "hw_cycles": self._hw_cycles,
+        "aborted": self._aborted
+      }
+
+# ----------------------------------------------------------------------------
+def print_results(res):
+  for k, v in res.items():
+    s = "{0:.2f}".format(v) if isinstance(v, float) else str(v)
+    print("{0:>16} : {1}".format(k, s))
+
+# ----------------------------------------------------------------------------
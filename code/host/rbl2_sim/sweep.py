@@ -0,0 +1,197 @@
+# ----------------------------------------------------------------------------
+# sweep.py
+# Parameter sweeps: runs many headless simulations in a process pool (one
+# per configuration and seed) and ranks the configurations by a metric.
+#
+# Usage:
+#   python -m rbl2_sim.sweep --minutes 10 --seeds 4 \
+#     --param DIST_TOF_OBJ=30,35,40 --param TURN_OBJ=0.5,1.0 \
+#     --param gait_amp=0.8,1.0,1.2 --sort fwd_mm_per_min --csv sweep.csv
+#
+# Parameters are attributes of `rbl2_config.py` or one of the gait factors:
+#   gait_amp  : scales the leg servo positions in `GAIT_SEQ`
+#   gait_tilt : scales the tilt servo positions in `GAIT_SEQ`
+#   gait_dur  : scales the durations of the steps in `GAIT_SEQ`
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import sys
+import csv
+import ast
+import argparse
+import itertools
+import multiprocessing
+from rbl2_sim.sim import Simulation, SENSOR_TOF, SENSOR_EVO
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+GAIT_PARAMS    = ["gait_amp", "gait_tilt", "gait_dur"]
+TILT_SERVO     = 2
+# Metrics for which smaller is better
+ASCENDING      = ["falls", "bumps", "latency_ms_mean", "latency_ms_max",
+                  "missed", "escape_ms_mean"]
+# GS_xxx indices of `rbl2_gait.py`
+GS_SRV         = 0
+GS_POS         = 1
+GS_DUR         = 2
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+def scaled_gait(seq, amp=1., tilt=1., dur=1.):
+  """ Returns a copy of the gait sequence `seq` with scaled leg and tilt servo
+      positions and step durations
+  """
+  res = []
+  for step in seq:
+    pos = [p *(tilt if s == TILT_SERVO else amp)
+           for s, p in zip(step[GS_SRV], step[GS_POS])]
+    res.append((step[GS_SRV], pos, int(step[GS_DUR] *dur)) +tuple(step[3:]))
+  return res
+
+def _patches(params):
+  """ Splits a parameter set into the `patches` for `rbl2_config.py` and the
+      gait factors
+  """
+  cfg = {k: v for k, v in params.items() if k not in GAIT_PARAMS}
+  gait = {k: v for k, v in params.items() if k in GAIT_PARAMS}
+  return ({"rbl2_config": cfg} if cfg else {}), gait
+
+# ----------------------------------------------------------------------------
+def _run_one(job):
+  """ Worker: run one simulation; `job` is (index, params, seed, options)
+  """
+  iCfg, params, seed, opt = job
+  patches, gait = _patches(params)
+  setup = (lambda: _apply_gait(gait)) if gait else None
+  sim = Simulation(opt["minutes"], opt["sensor"], seed=seed, patches=patches,
+                   setup=setup)
+  try:
+    res = sim.run()
+  except Exception as e:
+    res = {"error": repr(e)}
+  return iCfg, seed, res
+
+def _apply_gait(gait):
+  import rbl2_gait  # the simulated robot's module
+  rbl2_gait.GAIT_SEQ = scaled_gait(
+      rbl2_gait.GAIT_SEQ, gait.get("gait_amp", 1.), gait.get("gait_tilt", 1.),
+      gait.get("gait_dur", 1.)
+    )
+
+def _parse_value(s):
+  try:
+    return ast.literal_eval(s)
+  except (ValueError, SyntaxError):
+    return s
+
+def grid(params):
+  """ Returns all combinations of the parameter values in `params`, a dict
+      with parameter names and lists of values
+  """
+  keys = list(params.keys())
+  return [dict(zip(keys, vals))
+          for vals in itertools.product(*[params[k] for k in keys])]
+
+def run_sweep(configs, seeds=1, minutes=10., sensor=SENSOR_TOF,
+              processes=None, progress=True):
+  """ Runs all configurations (list of parameter dicts) with `seeds` seeds
+      each in a process pool; returns a list of (params, mean metrics, n)
+  """
+  opt = {"minutes": minutes, "sensor": sensor}
+  jobs = [(i, p, s, opt) for i, p in enumerate(configs) for s in range(seeds)]
+  sums = [dict() for _ in configs]
+  cnts = [0]*len(configs)
+  nDone = 0
+  with multiprocessing.Pool(processes) as pool:
+    for iCfg, seed, res in pool.imap_unordered(_run_one, jobs):
+      nDone += 1
+      if "error" in res:
+        print("Config #{0}, seed {1}: {2}".format(iCfg, seed, res["error"]),
+              file=sys.stderr)
+        continue
+      cnts[iCfg] += 1
+      for k, v in res.items():
+        sums[iCfg][k] = sums[iCfg].get(k, 0) +v
+      if progress:
+        print("\r{0}/{1} runs".format(nDone, len(jobs)), end="",
+              file=sys.stderr)
+  if progress:
+    print(file=sys.stderr)
+  return [(configs[i], {k: v /cnts[i] for k, v in sums[i].items()}, cnts[i])
+          for i in range(len(configs)) if cnts[i] > 0]
+
+def rank(results, key):
+  """ Sorts the results by metric `key`; best first
+  """
+  return sorted(results, key=lambda r: r[1].get(key, 0),
+                reverse=key not in ASCENDING)
+
+def print_table(results, metrics):
+  if not results:
+    return
+  pNames = list(results[0][0].keys())
+  hdr = ["#"] +pNames +metrics
+  rows = [[str(i +1)] +["{0}".format(p[k]) for k in pNames] +
+          ["{0:.1f}".format(m.get(k, 0)) for k in metrics]
+          for i, (p, m, n) in enumerate(results)]
+  w = [max(len(hdr[j]), max(len(r[j]) for r in rows)) for j in range(len(hdr))]
+  print("  ".join(h.rjust(w[j]) for j, h in enumerate(hdr)))
+  for r in rows:
+    print("  ".join(c.rjust(w[j]) for j, c in enumerate(r)))
+
+def write_csv(results, fname):
+  pNames = list(results[0][0].keys())
+  mNames = list(results[0][1].keys())
+  with open(fname, "w", newline="") as f:
+    wr = csv.writer(f)
+    wr.writerow(pNames +mNames +["n"])
+    for p, m, n in results:
+      wr.writerow([p[k] for k in pNames] +[m[k] for k in mNames] +[n])
+
+# ----------------------------------------------------------------------------
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Sweep simulation parameters")
+  parser.add_argument("--param", action="append", default=[],
+                      metavar="NAME=V1,V2,...", help="parameter values")
+  parser.add_argument("--seeds", type=int, default=1,
+                      help="number of seeds per configuration")
+  parser.add_argument("--minutes", type=float, default=10.,
+                      help="simulated time per run in minutes")
+  parser.add_argument("--sensor", choices=[SENSOR_TOF, SENSOR_EVO],
+                      default=SENSOR_TOF, help="distance sensor type")
+  parser.add_argument("--processes", type=int, default=None,
+                      help="number of processes (default: all cores)")
+  parser.add_argument("--sort", default="fwd_mm_per_min",
+                      help="metric to rank configurations by")
+  parser.add_argument("--top", type=int, default=20,
+                      help="number of configurations to show")
+  parser.add_argument("--csv", help="write all results to this CSV file")
+  args = parser.parse_args(argv)
+
+  params = {}
+  for p in args.param:
+    name, _, vals = p.partition("=")
+    params[name.strip()] = [_parse_value(v) for v in vals.split(",")]
+  configs = grid(params) if params else [{}]
+  print("{0} configurations x {1} seeds, {2} processes"
+        .format(len(configs), args.seeds,
+                args.processes or multiprocessing.cpu_count()))
+
+  res = rank(run_sweep(configs, args.seeds, args.minutes, args.sensor,
+                       args.processes), args.sort)
+  metrics = [args.sort] +[k for k in ["fwd_mm_per_min", "escape_ms_mean",
+                                      "falls", "bumps", "latency_ms_mean"]
+                          if k != args.sort]
+  print_table(res[:args.top], metrics)
+  if args.csv and res:
+    write_csv(res, args.csv)
+    print("Written to `{0}`".format(args.csv))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
+
+# ----------------------------------------------------------------------------
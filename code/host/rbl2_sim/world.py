@@ -0,0 +1,216 @@
+# ----------------------------------------------------------------------------
+# world.py
+# 2-D world model: a table (polygon, its edges are cliffs) with obstacles,
+# the kinematics of the 3-servo walker and ray-cast distance sensors
+#
+# Walker model (top view, x forward, angles counter-clockwise):
+# - Servo 2 tilts the body; if tilted by more than `TILT_CONTACT_DEG`, one
+#   side's front and back legs are on the ground (right side for a positive
+#   tilt, left side for a negative one).
+# - Servos 0 (left) and 1 (right) swing the front and back legs of a side;
+#   only the side on the ground moves the body, by the change of the leg's
+#   projection, `LEG_MM *sin(angle)`.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+from math import sin, cos, tan, radians, hypot, pi
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+LEG_MM           = 35.      # Effective length of a leg
+TRACK_MM         = 90.      # Distance between left and right legs
+BODY_RADIUS_MM   = 55.      # Radius of the body for collisions
+TILT_CONTACT_DEG = 4.       # Tilt needed to lift the other side
+MAX_RANGE_MM     = 2000.    # Reported if nothing is in range
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+def _ray_segment(px, py, dx, dy, ax, ay, bx, by):
+  """ Returns the distance along the ray (p, d) to the segment (a, b) or None
+  """
+  ex = bx -ax
+  ey = by -ay
+  den = dx *ey -dy *ex
+  if abs(den) < 1e-12:
+    return None
+  t = ((ax -px) *ey -(ay -py) *ex) /den
+  u = ((ax -px) *dy -(ay -py) *dx) /den
+  if t >= 0 and 0 <= u <= 1:
+    return t
+  return None
+
+def _point_segment_dist(px, py, ax, ay, bx, by):
+  ex = bx -ax
+  ey = by -ay
+  l2 = ex *ex +ey *ey
+  u = 0 if l2 == 0 else max(0., min(1., ((px -ax) *ex +(py -ay) *ey) /l2))
+  qx = ax +u *ex
+  qy = ay +u *ey
+  return hypot(px -qx, py -qy), qx, qy
+
+def _edges(poly):
+  n = len(poly)
+  return [(poly[i][0], poly[i][1], poly[(i+1) %n][0], poly[(i+1) %n][1])
+          for i in range(n)]
+
+# ----------------------------------------------------------------------------
+class Arena(object):
+  """Table top (polygon in [mm]) with obstacles (list of polygons)."""
+
+  def __init__(self, table, obstacles=[], start=(0., 0., 0.)):
+    """ `start` is the start pose (x, y in [mm], heading in [°])
+    """
+    self.table = table
+    self.obstacles = obstacles
+    self.start = start
+    self._tEdges = _edges(table)
+    self._oEdges = []
+    for ob in obstacles:
+      self._oEdges += _edges(ob)
+
+  @classmethod
+  def default(cls):
+    """ A 1200 x 800 mm table with two boxes
+    """
+    table = [(0, 0), (1200, 0), (1200, 800), (0, 800)]
+    boxes = [[(700, 300), (800, 300), (800, 420), (700, 420)],
+             [(250, 550), (330, 550), (330, 630), (250, 630)]]
+    return cls(table, boxes, start=(300., 360., 0.))
+
+  def on_table(self, x, y):
+    """ Returns True if the point is on the table
+    """
+    inside = False
+    for ax, ay, bx, by in self._tEdges:
+      if (ay > y) != (by > y):
+        if x < ax +(y -ay) *(bx -ax) /(by -ay):
+          inside = not inside
+    return inside
+
+  def clearance(self, x, y):
+    """ Returns the distance of the point to the nearest obstacle and the unit
+        vector pointing from the obstacle to the point
+    """
+    dMin = MAX_RANGE_MM
+    nx = ny = 0.
+    for e in self._oEdges:
+      d, px, py = _point_segment_dist(x, y, *e)
+      if d < dMin:
+        dMin = d
+        if d > 0:
+          nx = (x -px) /d
+          ny = (y -py) /d
+    return dMin, nx, ny
+
+  def ray_obstacle(self, x, y, dx, dy):
+    """ Returns the distance to the nearest obstacle along the ray or None
+    """
+    return self._ray(self._oEdges, x, y, dx, dy)
+
+  def ray_table_edge(self, x, y, dx, dy):
+    """ Returns the distance to the table edge along the ray or None
+    """
+    return self._ray(self._tEdges, x, y, dx, dy)
+
+  @staticmethod
+  def _ray(edges, x, y, dx, dy):
+    dMin = None
+    for e in edges:
+      d = _ray_segment(x, y, dx, dy, *e)
+      if d is not None and (dMin is None or d < dMin):
+        dMin = d
+    return dMin
+
+# ----------------------------------------------------------------------------
+class Walker(object):
+  """Kinematic model of the 3-servo walker; servo angles in [°]."""
+
+  def __init__(self, x, y, heading_deg):
+    self.reset(x, y, heading_deg)
+
+  def reset(self, x, y, heading_deg):
+    self.x = x
+    self.y = y
+    self.h = radians(heading_deg)
+    self._last = None
+
+  def update(self, angles):
+    """ Returns the movement (dx, dy in [mm], rotation in [rad]) caused by
+        the change of the servo angles since the last call; `apply()` the
+        movement if it is possible
+    """
+    if self._last is None:
+      self._last = list(angles)
+      return 0., 0., 0.
+    aL, aR, tilt = angles
+    dL = LEG_MM *(sin(radians(aL)) -sin(radians(self._last[0])))
+    dR = LEG_MM *(sin(radians(aR)) -sin(radians(self._last[1])))
+    self._last = list(angles)
+    if tilt > TILT_CONTACT_DEG:
+      dL = 0.
+    elif tilt < -TILT_CONTACT_DEG:
+      dR = 0.
+      dL = -dL
+    else:
+      return 0., 0., 0.
+    fwd = (dL +dR) /2
+    rot = (dR -dL) /TRACK_MM
+    dx = fwd *cos(self.h +rot /2)
+    dy = fwd *sin(self.h +rot /2)
+    return dx, dy, rot
+
+  def apply(self, dx, dy, rot):
+    self.x += dx
+    self.y += dy
+    self.h = (self.h +rot) %(2 *pi)
+
+# ----------------------------------------------------------------------------
+class RangeSensor(object):
+  """Distance sensor mounted on the walker; the beam points `yaw_deg` to the
+     left and `pitch_deg` downwards, from `height_mm` above the table."""
+
+  def __init__(self, yaw_deg, pitch_deg, height_mm=45., fwd_mm=40.,
+               max_mm=MAX_RANGE_MM):
+    self.yaw = radians(yaw_deg)
+    self.pitch = radians(pitch_deg)
+    self.height = height_mm
+    self.fwd = fwd_mm
+    self.max_mm = max_mm
+
+  def measure(self, walker, arena):
+    """ Returns the distance (in [mm]) along the beam
+    """
+    h = walker.h
+    x = walker.x +self.fwd *cos(h)
+    y = walker.y +self.fwd *sin(h)
+    dx = cos(h +self.yaw)
+    dy = sin(h +self.yaw)
+    dObj = arena.ray_obstacle(x, y, dx, dy)
+    if self.pitch <= 0:
+      # Horizontal beam: only obstacles count
+      return min(dObj, self.max_mm) if dObj is not None else self.max_mm
+    dFloor = self.height /tan(self.pitch)
+    dEdge = arena.ray_table_edge(x, y, dx, dy)
+    if dObj is not None and dObj < dFloor and (dEdge is None or dObj < dEdge):
+      return dObj /cos(self.pitch)
+    if dEdge is None or dEdge < dFloor:
+      # Beam misses the table
+      return self.max_mm
+    return self.height /sin(self.pitch)
+
+# Sensor layouts; order as in `Robot.distances_mm`
+def tof_sensors():
+  """ Pololu ToF sensors: left, center, right
+  """
+  return [RangeSensor(30, 40), RangeSensor(0, 40), RangeSensor(-30, 40)]
+
+def evo_sensors():
+  """ Evo Mini pixels: left low, left high, right low, right high
+  """
+  return [RangeSensor(12, 35, 50), RangeSensor(12, 0, 50),
+          RangeSensor(-12, 35, 50), RangeSensor(-12, 0, 50)]
+
+# ----------------------------------------------------------------------------
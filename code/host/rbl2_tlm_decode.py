@@ -0,0 +1,124 @@
+# ----------------------------------------------------------------------------
+# rbl2_tlm_decode.py
+# Host-side (CPython) decoder for telemetry files written by the robot
+# (`robotling_lib/misc/telemetry.py`)
+#
+# Usage:
+#   python rbl2_tlm_decode.py tlm_0.tlm tlm_1.tlm --csv run.csv
+#
+#   import rbl2_tlm_decode as tlm
+#   data = tlm.load(["tlm_0.tlm", "tlm_1.tlm"])   # dict: name -> column
+#
+# Columns are NumPy arrays if NumPy is installed, otherwise lists.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import sys
+import csv
+import struct
+import argparse
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+TLM_MAGIC      = b"RBLTLM"
+TLM_VERSION    = 1
+TLM_BLK_HDR    = 4
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class TelemetryFile(object):
+  """Reads the header and records of a single telemetry file."""
+
+  def __init__(self, fname):
+    with open(fname, "rb") as f:
+      self._data = f.read()
+    self.fname = fname
+    d = self._data
+    if d[:len(TLM_MAGIC)] != TLM_MAGIC:
+      raise ValueError("`{0}` is not a telemetry file".format(fname))
+    i = len(TLM_MAGIC)
+    ver, self.seq, self.rec_size, self.blk_size, n = struct.unpack_from(
+        "<HHHHH", d, i
+      )
+    if ver != TLM_VERSION:
+      raise ValueError("`{0}`: unsupported version {1}".format(fname, ver))
+    i += 10
+    self.fmt = d[i:i +n].decode()
+    i += n
+    n = struct.unpack_from("<H", d, i)[0]
+    i += 2
+    self.names = d[i:i +n].decode().split(",")
+    if struct.calcsize(self.fmt) != self.rec_size:
+      raise ValueError("`{0}`: record size mismatch".format(fname))
+
+  def records(self):
+    """ Yields the records of all blocks as tuples; incomplete blocks at the
+        end of the file (e.g. after a power loss) are ignored
+    """
+    d = self._data
+    bs = self.blk_size
+    rs = self.rec_size
+    nMax = (bs -TLM_BLK_HDR) //rs
+    for i0 in range(bs, len(d) -bs +1, bs):
+      nRecs = struct.unpack_from("<H", d, i0)[0]
+      if nRecs > nMax:
+        continue
+      blk = d[i0 +TLM_BLK_HDR:i0 +TLM_BLK_HDR +nRecs *rs]
+      yield from struct.iter_unpack(self.fmt, blk)
+
+# ----------------------------------------------------------------------------
+def load(fnames):
+  """ Decode the given telemetry files, concatenated in the order of their
+      sequence numbers; returns a dictionary with one column per field
+  """
+  files = sorted([TelemetryFile(fn) for fn in fnames], key=lambda f: f.seq)
+  if len(files) == 0:
+    return {}
+  names = files[0].names
+  fmt = files[0].fmt
+  rows = []
+  for f in files:
+    if f.fmt != fmt or f.names != names:
+      raise ValueError("`{0}`: different record layout".format(f.fname))
+    rows.extend(f.records())
+  cols = list(zip(*rows)) if rows else [()]*len(names)
+  if np:
+    return {nm: np.array(c) for nm, c in zip(names, cols)}
+  return {nm: list(c) for nm, c in zip(names, cols)}
+
+def to_csv(data, fname):
+  """ Write the columns in `data` (as returned by `load()`) to a CSV file
+  """
+  names = list(data.keys())
+  with open(fname, "w", newline="") as f:
+    w = csv.writer(f)
+    w.writerow(names)
+    w.writerows(zip(*[data[nm] for nm in names]))
+
+# ----------------------------------------------------------------------------
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Decode robot telemetry files")
+  parser.add_argument("files", nargs="+", help="telemetry files (*.tlm)")
+  parser.add_argument("--csv", help="write records to this CSV file")
+  args = parser.parse_args(argv)
+
+  data = load(args.files)
+  n = len(next(iter(data.values()))) if data else 0
+  print("{0} records, fields: {1}".format(n, ", ".join(data.keys())))
+  if args.csv:
+    to_csv(data, args.csv)
+    print("Written to `{0}`".format(args.csv))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------
+# test_filter_bank.py
+# Tests of `FilterBank` (robotling_lib/misc/helpers.py), run on the host in
+# the simulated MicroPython environment
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import pytest
+from rbl2_sim.hw import SimClock, SimHardware
+from rbl2_sim.sim import ROBOT_ROOT
+
+# pylint: disable=bad-whitespace
+N_STEPS        = 100         # Number of samples after the step
+GAP            = 10          # A channel gets a sample every `GAP` calls
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+@pytest.fixture
+def helpers():
+  hw = SimHardware(SimClock())
+  hw.install(ROBOT_ROOT)
+  try:
+    import robotling_lib.misc.helpers as hlp
+    yield hlp
+  finally:
+    hw.uninstall()
+
+def _step_with_gaps(flt, ch, n_ch):
+  # Channel `ch` gets 300 once, then 100 every `GAP` calls, the other
+  # channels get a sample with every call
+  vals = [200]*n_ch
+  vals[ch] = 300
+  flt.update(vals)
+  for k in range(N_STEPS *GAP):
+    vals[ch] = 100 if k % GAP == 0 else -1
+    flt.update(vals)
+  return flt.out[ch]
+
+@pytest.mark.parametrize("kind", ["FLT_MEAN", "FLT_MEDIAN"])
+def test_step_with_gaps(helpers, kind):
+  flt = helpers.FilterBank(3, getattr(helpers, kind), n=5)
+  assert _step_with_gaps(flt, 1, 3) == 100
+  assert flt.out[0] == 200 and flt.out[2] == 200
+
+@pytest.mark.parametrize("kind", ["FLT_MEAN", "FLT_MEDIAN"])
+def test_update_ch(helpers, kind):
+  flt = helpers.FilterBank(2, getattr(helpers, kind), n=5)
+  flt.update([300, 300])
+  for _ in range(5):
+    flt.update_ch(0, 100)
+  assert flt.out[0] == 100
+  assert flt.out[1] == 300
+
+def test_outlier_rejection(helpers):
+  flt = helpers.FilterBank(1, helpers.FLT_MEAN, n=1, max_step=50,
+                           max_reject=2)
+  flt.update([100])
+  assert flt.update([500])[0] == 100
+  assert flt.update([500])[0] == 100
+  assert flt.update([500])[0] == 500
+  assert flt.rejected == 2
+
+def test_max_fail(helpers):
+  flt = helpers.FilterBank(1, helpers.FLT_MEDIAN, n=3, max_fail=3)
+  assert flt.out[0] == -1
+  flt.update([100])
+  assert flt.update([-1])[0] == 100
+  assert flt.update([-1])[0] == 100
+  assert flt.update([-1])[0] == -1
+  assert flt.update([150])[0] == 150
+
+# ----------------------------------------------------------------------------
@@ -8,6 +8,7 @@
 # 2021-03-28, v1.0
 # 2022-02-12, v1.1
 # 2022-04-08, v1.2, a few improvements and fixes
+# 2022-10-18, v1.3, behaviour parameters moved to `rbl2_config.py`
 # ----------------------------------------------------------------------------
 import gc
 import time
@@ -15,16 +16,13 @@ import random
 import rbl2_robot
 import rbl2_global as glb
 import rbl2_config as cfg
-from micropython import const
-
-# pylint: disable=bad-whitespace
-DIST_TOF_OBJ    = const(35)   # object if smaller than this distance
-DIST_TOF_CLIFF  = const(150)  # cliff if larger than this distance
-# pylint: enable=bad-whitespace
+from robotling_lib.misc import profiler
 
 # ----------------------------------------------------------------------------
 if __name__ == "__main__":
   # Initialize robot
+  if cfg.RANDOM_SEED is not None:
+    random.seed(cfg.RANDOM_SEED)
   is_gui = "display" in cfg.DEVICES
   Robot = rbl2_robot.Robot(core=cfg.HW_CORE, use_gui=is_gui)
   Robot.autoupdate_gui = True
@@ -58,11 +56,11 @@ if __name__ == "__main__":
       elif Robot.distance_sensor_type == cfg.STY_TOF:
         dL, dC, dR = Robot.distances_mm
         #print(dL, dC, dR)
-        objL = (dL > 0 and dL < DIST_TOF_OBJ)
-        objC = (dC > 0 and dC < DIST_TOF_OBJ)
-        objR = (dR > 0 and dR < DIST_TOF_OBJ)
-        clfL = dL > DIST_TOF_CLIFF
-        clfR = dR > DIST_TOF_CLIFF
+        objL = (dL > 0 and dL < cfg.DIST_TOF_OBJ)
+        objC = (dC > 0 and dC < cfg.DIST_TOF_OBJ)
+        objR = (dR > 0 and dR < cfg.DIST_TOF_OBJ)
+        clfL = dL > cfg.DIST_TOF_CLIFF
+        clfR = dR > cfg.DIST_TOF_CLIFF
         free = not objL and not objR and not objC and not clfL and not clfR
 
       if only_sensors:
@@ -81,29 +79,29 @@ if __name__ == "__main__":
 
         if clfL or clfR:
           if clfL and not clfR:
-            Robot.turn(+1)
+            Robot.turn(+cfg.TURN_CLIFF)
             Robot.show_message("Cliff_L__")
           elif not clfL and clfR:
-            Robot.turn(-1)
+            Robot.turn(-cfg.TURN_CLIFF)
             Robot.show_message("Cliff___R")
           elif clfL and clfR:
             Robot.move_backward()
             Robot.sleep_ms(2000)
-            Robot.turn(1 if random.random() > 0.5 else -1)
+            Robot.turn(cfg.TURN_CLIFF if random.random() > 0.5 else -cfg.TURN_CLIFF)
             Robot.show_message("Cliff_L_R")
           Robot.sleep_ms(2000)
 
         elif objL or objC or objR :
           if objL and not objR:
-            Robot.turn(+1)
+            Robot.turn(+cfg.TURN_OBJ)
             Robot.show_message("Objct_L__")
           elif not objL and objR:
-            Robot.turn(-1)
+            Robot.turn(-cfg.TURN_OBJ)
             Robot.show_message("Objct___R")
           elif objC:
             Robot.move_backward()
             Robot.sleep_ms(1000)
-            Robot.turn(1 if random.random() > 0.5 else -1)
+            Robot.turn(cfg.TURN_OBJ if random.random() > 0.5 else -cfg.TURN_OBJ)
             Robot.show_message("Objct__C_")
           Robot.sleep_ms(1000)
 
@@ -118,6 +116,9 @@ if __name__ == "__main__":
     pass
 
   # Clean up
+  Robot.print_stats()
+  if cfg.PROFILING:
+    profiler.dump()
   Robot.deinit()
 
 # ----------------------------------------------------------------------------
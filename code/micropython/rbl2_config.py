@@ -25,6 +25,47 @@ HW_CORE        = const(0)   # 1=hardware update runs on second core
 APPROX_SPIN_MS = const(5)   # core==0, approx. duration of hardware update
 MIN_UPDATE_MS  = const(20)  # core==0, minimal time between hardware updates
 PULSE_STEPS    = const(10)  # Number of steps for Pixel/RGB pulsing
+CORE1_SLEEP_MS = const(25)  # core==1, sleep between hardware updates
+
+# Cycle-time and jitter instrumentation of the hardware loop
+# (see `Robot.stats` and `Robot.print_stats()`)
+HW_STATS       = False
+HW_STATS_BINS  = const(16)  # Number of histogram bins per channel
+HW_STATS_BW_US = [2000, 250, 250, 1000, 100, 500]  # Bin width [us]
+
+# Profiling of functions decorated with `@profiled` (see `misc/profiler.py`)
+PROFILING      = False
+
+# Binary telemetry recorder (see `misc/telemetry.py`); decode the files on the
+# host with `code/host/rbl2_tlm_decode.py`
+TELEMETRY      = False
+TLM_PATH       = "tlm"      # Files are named `<TLM_PATH>_<index>.tlm`
+TLM_EVERY_N    = const(1)   # Record every n-th hardware loop cycle
+TLM_IDLE_MS    = const(20)  # Flush only in `sleep_ms()` of at least this
+TLM_N_BLOCKS   = const(8)   # Number of 512-byte blocks in RAM
+TLM_MAX_KB     = const(256) # Maximal size of a file
+TLM_MAX_FILES  = const(4)   # Number of files to rotate through
+
+# Recording of raw sensor streams for replay on the host (see
+# `sensors/sensor_replay.py`); use with `HW_CORE = 0`, as the trace buffer is
+# not shared safely between cores
+SENSOR_TRACE   = False
+TRACE_FILE     = "sensors.trc"
+
+# Behaviour (see `main.py`)
+DIST_TOF_OBJ   = const(35)  # object if smaller than this distance [mm]
+DIST_TOF_CLIFF = const(150) # cliff if larger than this distance [mm]
+TURN_OBJ       = 1.0        # Turning strength when avoiding objects ...
+TURN_CLIFF     = 1.0        # ... and cliffs (see `Robot.turn()`)
+RANDOM_SEED    = None       # Seed for random turn directions, if not None
+
+# Battery/VBUS monitor (see `sensors/battery_monitor.py`); the supply voltage
+# is sampled in the background, `BAT_CAL` corrects the reported voltage
+# (measured/reported)
+BAT_RATE_HZ    = const(10)  # Timer ticks per second ...
+BAT_N_OVER     = const(16)  # ... with this many ADC conversions each
+BAT_CAL        = 1.0
+BAT_LOW_MV     = const(3800) # Low-battery warning below this voltage [mV]
 
 # Sensor port pins (idenfiers on PCB)
 SPO_D0         = board.D3
@@ -74,7 +115,13 @@ STY_TOF        = const(1)
 STY_EVOMINI    = const(2)
 
 # Pololu tof distance sensor array w/ PWM output
+# (`TOFPWM_USE_IRQ`: non-blocking, pulses time-stamped by pin interrupts;
+#  `TOFPWM_PIO_CAP`: all sensors w/ one state machine, `TOFPWM_PIOS[0]`,
+#  the pins need to be consecutive)
 TOFPWM_USE_PIO = False
+TOFPWM_PIO_CAP = True
+TOFPWM_USE_IRQ = False
+TOFPWM_MAX_AGE = const(50_000) # older pulses are stale [us] (IRQ, PIO cap.)
 TOFPWM_PIOS    = [0, 1, 2]
 TOFPWM_PINS    = [SPO_D0, SPO_RX, SPO_TX]
 TOFPWM_MIN_MM  = const(10)
@@ -82,9 +129,32 @@ TOFPWM_MAX_MM  = const(200)
 TOFPWM_LEFT    = const(0)
 TOFPWM_CENTER  = const(1)
 TOFPWM_RIGHT   = const(2)
+# Smoothing of the distances w/ `FilterBank` (`helpers.py`): 0=none, 1=mean,
+# 2=median, 3=EMA, over `TOFPWM_FLT_N` samples; jumps > `TOFPWM_FLT_JMP` [mm]
+# are rejected as outliers (0=off). Failed readings are bridged with the last
+# valid value (a mean over 1 sample does only that, w/o delay), but at most
+# `TOFPWM_FLT_ERR` readings in a row; a distance whose last valid reading is
+# older than `TOFPWM_AGE_MS` is reported as invalid (-1)
+TOFPWM_FILTER  = const(1)
+TOFPWM_FLT_N   = const(1)
+TOFPWM_FLT_JMP = const(0)
+TOFPWM_FLT_ERR = const(3)
+TOFPWM_AGE_MS  = const(250)  # [ms]
+# The sensors are read in the hardware loop by a `SensorHub` (see
+# `sensors/sensor_hub.py`), each at its target rate; reads that do not fit
+# into the time budget of a cycle are deferred to the next one
+TOFPWM_RATE_HZ = const(25)   # Target read rate per sensor
+HUB_BUDGET_US  = const(3000) # Time for sensor reads per hardware cycle
+# Adaptive sampling: `TOFPWM_RATE_HZ` while walking (or stopping), a reduced
+# rate while turning or idle, and a boost for a sensor whose distance is
+# within `TOFPWM_NEAR_MM` of `DIST_TOF_OBJ` or `DIST_TOF_CLIFF` while moving
+TOFPWM_SLOW_HZ = const(10)
+TOFPWM_FAST_HZ = const(50)
+TOFPWM_NEAR_MM = const(20)
 
 # TeraRanger EvoMini (for "evo_mini" in `DEVICES`)
 EVOMINI_UART   = const(1)
+EVOMINI_IRQ    = True        # receive via UART interrupt, if available
 EVOMINI_TX     = board.D4
 EVOMINI_RX     = board.D5
 EVOMINI_MIN_MM = const(10)
@@ -15,6 +15,7 @@ import rbl2_config as cfg
 from micropython import const
 from robotling_lib.motors.servo import Servo
 from robotling_lib.motors.servo_manager import ServoManager
+from robotling_lib.misc.profiler import profiled
 
 # pylint: disable=bad-whitespace
 __version__  = "0.1.1.0"
@@ -103,6 +104,7 @@ class Gait(object):
     self.spin()
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @profiled("gait.spin", 1)
   def spin(self):
     """ Keep robot moving; needs to be called frequently
     """
@@ -159,6 +161,10 @@ class Gait(object):
   def state(self):
     return self._state
 
+  @property
+  def step(self):
+    return self._iStep
+
   @property
   def direction(self):
     return self._dir
@@ -6,9 +6,12 @@
 # The MIT License (MIT)
 # Copyright (c) 2021-2022 Thomas Euler
 # 2021-03-03, v1.0
+# 2022-10-18, v1.1, log ring buffer for non-blocking logging,
+#                   battery messages
 # ----------------------------------------------------------------------------
 from micropython import const
 import robotling_lib.misc.ansi_color as ansi
+from robotling_lib.misc.log_ring import LogRing
 
 # pylint: disable=bad-whitespace
 # General
@@ -34,8 +37,48 @@ CMD_MOVE            = const(2)
 CMD_POWER_DOWN      = const(3)
 # ...
 
+# Channels of hardware loop statistics (see `HW_STATS` in `rbl2_config.py`)
+STAT_PERIOD         = const(0)  # Period of hardware loop
+STAT_GAIT           = const(1)  # Work time of gait control
+STAT_SENSOR         = const(2)  # Work time of sensor updates
+STAT_GUI            = const(3)  # Work time of display update
+STAT_LED            = const(4)  # Work time of LED pulsing
+STAT_SRV_LATE       = const(5)  # Lateness of servo timer callback
+# ...
+STAT_STRS           = ["period", "gait", "sensor", "gui", "led", "srv_late"]
+
+# Messages for the log ring buffer (see `toLogQ()`); up to 4 integer
+# arguments can be used in the format strings
+LOG_RING_SIZE       = const(32)
+MSG_HW_THREAD_ENDED = const(0)
+MSG_BAT_LOW         = const(1)
+MSG_BAT_OK          = const(2)
+# ...
+MSG_STRS            = ["Hardware thread ended.",
+                       "Battery low ({0} mV).", "Battery ok ({0} mV)."]
+
 # pylint: enable=bad-whitespace
 
+# ----------------------------------------------------------------------------
+LogQ = LogRing(LOG_RING_SIZE, MSG_STRS)
+
+def toLogQ(msgID, errC=0, a0=0, a1=0, a2=0, a3=0):
+  """ Add message `msgID` (`MSG_xxx`) with up to 4 integer arguments to the
+      log ring buffer; cheap and non-blocking, therefore to be used in the
+      hardware loop. Messages are printed later by `drainLog()`.
+  """
+  LogQ.put(msgID, errC, a0, a1, a2, a3)
+
+def drainLog(max_n=4, force=False):
+  """ Print up to `max_n` (all, if < 0) messages from the log ring buffer,
+      as long as the output is ready to accept data (or `force` is True)
+  """
+  if LogQ.count > 0:
+    LogQ.drain(_emit, max_n, force)
+
+def _emit(sMsg, errC, t_ms):
+  toLog(sMsg, errC=errC)
+
 # ----------------------------------------------------------------------------
 def toLog(sMsg, sTopic="", errC=0, green=False, color=None, verbose=True):
   """ Print message to history
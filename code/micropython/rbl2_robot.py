@@ -8,19 +8,40 @@
 # 2021-04-03, v1.0
 # 2022-02-12, v1.1
 # 2022-04-08, v1.2, small fixes for MicroPython 1.18
+# 2022-10-18, v1.3, cycle-time and jitter statistics of the hardware loop,
+#                   optional binary telemetry and sensor trace recording,
+#                   background battery monitor; ToF sensors are read by a
+#                   `SensorHub` in the hardware loop, at rates that adapt
+#                   to the state and the distances
 # ----------------------------------------------------------------------------
 import time
 import array
-from machine import Pin, ADC
+try:
+  import struct
+except ImportError:
+  import ustruct as struct
+from machine import Pin
 import rbl2_config as cfg
 import rbl2_global as glb
 import rbl2_gait as gait
 import rbl2_gui
 from robotling_lib.platform.rp2 import board_rp2 as board
-from robotling_lib.misc.helpers import timed_function
+from robotling_lib.misc.helpers import timed_function, FilterBank
+from robotling_lib.misc.cycle_stats import CycleStats
+from robotling_lib.misc.profiler import profiled
+from robotling_lib.misc.telemetry import TelemetryRecorder
+from robotling_lib.sensors.battery_monitor import BatteryMonitor
+from robotling_lib.sensors.sensor_hub import SensorHub, DATA_NONE
 
 # pylint: disable=bad-whitespace
-__version__  = "0.1.3.0"
+__version__  = "0.1.4.4"
+
+# Telemetry record layout (see `_record_telemetry()`)
+TLM_FMT      = "<IHBBHHHhhhhHH"
+TLM_NAMES    = ["t_ms", "cycle", "state", "step",
+                "srv0_us", "srv1_us", "srv2_us",
+                "d0_mm", "d1_mm", "d2_mm", "d3_mm",
+                "vsys_mV", "period_us"]
 
 # Global variables to communicate with task on core 1
 # (Do not access other than via the `RobotBase` instance!!)
@@ -31,12 +52,21 @@ g_counter    = 0
 g_gui        = None
 g_dist_evo   = None
 g_dist_tof   = None
+g_dist_flt   = None
 g_dist_type  = cfg.STY_NONE
 g_gait       = None
 g_move_dir   = 0.
 g_move_vel   = 2
 g_move_rev   = False
 g_do_exit    = False
+g_stats      = None
+g_t_spin_us  = 0
+g_tlm        = None
+g_last_dist  = array.array("i", [0]*4)
+g_bat        = None
+g_hub        = None
+g_hub_seq    = None
+g_trace      = None
 g_led        = Pin(board.D11, Pin.OUT)
 # pylint: enable=bad-whitespace
 
@@ -45,8 +75,9 @@ class Robot(object):
   """Robot representation"""
 
   def __init__(self, core=1, use_gui=True, verbose=False, no_servos=False):
-    global g_state, g_gui, g_gait
-    global g_dist_evo, g_dist_tof, g_dist_type
+    global g_state, g_gui, g_gait, g_stats, g_tlm, g_bat, g_hub
+    global g_hub_seq
+    global g_dist_evo, g_dist_tof, g_dist_type, g_dist_flt, g_trace
 
     # Initializing ...
     glb.toLog("Initializing ...")
@@ -60,8 +91,10 @@ class Robot(object):
     self._user_abort = False
 
     # Initializing some hardware
-    self._pinVBUSPresent = Pin(board.VBUS, Pin.IN)
-    self._pinPower_V = ADC(Pin(board.BAT))
+    g_bat = BatteryMonitor(board.BAT, board.VBUS,
+        rate_hz=cfg.BAT_RATE_HZ, n_over=cfg.BAT_N_OVER, cal=cfg.BAT_CAL,
+        low_mV=cfg.BAT_LOW_MV, callback=_on_battery
+      )
 
     # Initialize display, if any
     if "display" in cfg.DEVICES:
@@ -76,13 +109,26 @@ class Robot(object):
     # (Has to happen after initializing (Pimoroni) display to re-claim pins)
     g_gait = gait.Gait()
 
+    # Statistics of the hardware loop, if requested
+    if cfg.HW_STATS:
+      g_stats = CycleStats(glb.STAT_STRS, cfg.HW_STATS_BW_US, cfg.HW_STATS_BINS)
+      g_gait._SM.set_stats(g_stats, glb.STAT_SRV_LATE)
+
+    # Telemetry recorder, if requested
+    if cfg.TELEMETRY:
+      g_tlm = TelemetryRecorder(TLM_FMT, TLM_NAMES, cfg.TLM_PATH,
+          n_blocks=cfg.TLM_N_BLOCKS, max_file_kb=cfg.TLM_MAX_KB,
+          max_files=cfg.TLM_MAX_FILES
+        )
+
     # Initialize devices
     if "evo_mini" in cfg.DEVICES:
       # 4-channel TeraRanger Evo Mini from Terabee
       from robotling_lib.sensors.teraranger_evomini import TeraRangerEvoMini
       g_dist_evo = TeraRangerEvoMini(
           cfg.EVOMINI_UART,
-          tx=Pin(cfg.EVOMINI_TX), rx=Pin(cfg.EVOMINI_RX)
+          tx=Pin(cfg.EVOMINI_TX), rx=Pin(cfg.EVOMINI_RX),
+          use_irq=cfg.EVOMINI_IRQ
         )
       time.sleep_ms(1000)
       g_dist_type = cfg.STY_EVOMINI
@@ -91,14 +137,50 @@ class Robot(object):
       # 3x 1-channel Time-of-flight sensors w/ PWM output from Pololu
       g_dist_type = cfg.STY_TOF
       g_dist_tof = []
-      if cfg.TOFPWM_USE_PIO:
+      if cfg.TOFPWM_USE_PIO and cfg.TOFPWM_PIO_CAP:
+        from robotling_lib.sensors.pololu_tof_ranging_pio import PololuTOFCapture
+        g_dist_tof = PololuTOFCapture(
+            cfg.TOFPWM_PINS, cfg.TOFPWM_PIOS[0], cfg.TOFPWM_MAX_AGE
+          ).sensors
+      elif cfg.TOFPWM_USE_PIO:
         from robotling_lib.sensors.pololu_tof_ranging_pio import PololuTOFRangingSensor
         for i, p in enumerate(cfg.TOFPWM_PINS):
           g_dist_tof.append(PololuTOFRangingSensor(p, cfg.TOFPWM_PIOS[i]))
+      elif cfg.TOFPWM_USE_IRQ:
+        from robotling_lib.sensors.pololu_tof_ranging_irq import PololuTOFRangingSensor
+        for p in cfg.TOFPWM_PINS:
+          g_dist_tof.append(PololuTOFRangingSensor(p, cfg.TOFPWM_MAX_AGE))
       else:
         from robotling_lib.sensors.pololu_tof_ranging import PololuTOFRangingSensor
         for p in cfg.TOFPWM_PINS:
           g_dist_tof.append(PololuTOFRangingSensor(p))
+      if cfg.TOFPWM_FILTER:
+        g_dist_flt = FilterBank(len(g_dist_tof), cfg.TOFPWM_FILTER,
+            n=cfg.TOFPWM_FLT_N, max_step=cfg.TOFPWM_FLT_JMP,
+            max_fail=cfg.TOFPWM_FLT_ERR
+          )
+
+    # Record raw sensor streams, if requested
+    if cfg.SENSOR_TRACE:
+      import robotling_lib.sensors.sensor_replay as rpl
+      if g_dist_evo:
+        g_trace = rpl.TraceRecorder(cfg.TRACE_FILE, [rpl.TRC_UART])
+        g_dist_evo._uart = rpl.RecordingUART(g_dist_evo._uart, g_trace, 0)
+      elif g_dist_tof:
+        g_trace = rpl.TraceRecorder(cfg.TRACE_FILE, [rpl.TRC_TOF]*len(g_dist_tof))
+        for i, tof in enumerate(g_dist_tof):
+          g_dist_tof[i] = rpl.RecordingTOF(tof, g_trace, i)
+
+    # Read the ToF sensors in the hardware loop, each at its own rate; the
+    # center sensor (looking ahead) first
+    if g_dist_tof:
+      g_hub = SensorHub(len(g_dist_tof), cfg.HUB_BUDGET_US)
+      for i, tof in enumerate(g_dist_tof):
+        g_hub.add(tof, _read_tof_mm, cfg.TOFPWM_RATE_HZ,
+                  1 if i == cfg.TOFPWM_CENTER else 0)
+      if g_dist_flt:
+        # New readings are filtered in the hardware loop, once per read
+        g_hub_seq = array.array("I", [0]*len(g_dist_tof))
 
     # Depending on `core`, the thread that updates the hardware either runs
     # on the second core (`core` == 1) or on the same core as the main program
@@ -124,17 +206,27 @@ class Robot(object):
   def deinit(self):
     global g_state, g_gui
 
-    glb.toLog("Deinit sensors ...")
-    if "tof_pwm" in cfg.DEVICES:
-      for sens in g_dist_tof:
-        sens.deinit()
-
+    # Stop the hardware loop first, as the sensor hub reads the sensors there
     if g_state is not glb.STATE_OFF:
       glb.toLog("Powering down ...")
       self.power_down()
       while g_state is not glb.STATE_OFF:
         self.sleep_ms(25)
 
+    glb.toLog("Deinit sensors ...")
+    if "tof_pwm" in cfg.DEVICES:
+      for sens in g_dist_tof:
+        sens.deinit()
+    glb.drainLog(-1, force=True)
+    if g_tlm:
+      glb.toLog("Closing telemetry ({0} records, {1} dropped) ..."
+                .format(*g_tlm.counters))
+      g_tlm.close()
+    if g_trace:
+      g_trace.close()
+    if g_bat:
+      g_bat.deinit()
+
     glb.toLog("Turning servos off ...")
     self.turn_servos_off()
     if g_gui:
@@ -161,8 +253,8 @@ class Robot(object):
   def distance_sensor_type(self):
     return g_dist_type
 
-  #@timed_function
   @property
+  @profiled("robot.distances_mm", 1)
   def distances_mm(self):
     """ Returns the distances (in [mm]) as an array. The lengths of the array
         depends on the sensor: e.g. the TeraRanger Evo mini reports 4 values.
@@ -177,28 +269,72 @@ class Robot(object):
         elif _d[i] == g_dist_evo.TERA_DIST_INVALID:
           _d[i] = -1
       self._last_dist = _d
+      _keep_dist(_d)
       return _d
     elif g_dist_tof:
-      _d = array.array("i", [0]*len(g_dist_tof))
-      for i, tof in enumerate(g_dist_tof):
-        _d[i] = int(tof.range_cm *10)
+      # Latest values, read (and filtered) in the hardware loop; a value
+      # whose last valid reading is too old is invalid
+      if g_dist_flt:
+        _d = array.array("i", g_dist_flt.out)
+      else:
+        _d = array.array("i", g_hub.values)
+      for i in range(len(_d)):
+        if (not g_dist_flt and not g_hub.valid[i] or
+            g_hub.age_ms(i) > cfg.TOFPWM_AGE_MS):
+          _d[i] = DATA_NONE
       self._last_dist = _d
+      _keep_dist(_d)
       return _d
     else:
       return []
 
+  @property
+  def stats(self):
+    """ Returns the `CycleStats` instance with the hardware loop statistics
+        (channels `STAT_xxx` in `rbl2_global.py`) or None, if `HW_STATS` is
+        not enabled in `rbl2_config.py`
+    """
+    return g_stats
+
+  @property
+  def hw_cycle_count(self):
+    """ Returns the number of hardware loop cycles so far
+    """
+    return g_counter
+
+  def print_stats(self, reset=False):
+    """ Print hardware loop statistics, if enabled, and the sensor rates,
+        and optionally reset them
+    """
+    if g_stats:
+      glb.toLog("Hardware loop statistics after {0} cycles:".format(g_counter))
+      g_stats.print()
+      if reset:
+        g_stats.reset()
+    if g_hub:
+      glb.toLog("Sensor rates:")
+      g_hub.print_rates()
+      if reset:
+        g_hub.reset_counters()
+
   @property
   def is_connected_via_usb(self):
     """ Returns True if connected via USB cable (and VSYS is present)
     """
-    return self._pinVBUSPresent.value()
+    return g_bat.vbus
 
   @property
   def power_V(self):
-    """ Returns the input voltage that powers the microcontroller
-        TODO: Fix reported voltage (unclear why not correct)
+    """ Returns the input voltage that powers the microcontroller; filtered
+        and cached by the battery monitor (calibrate with `BAT_CAL`)
     """
-    return self._pinPower_V.read_u16() *3 *3.3 /65535
+    return g_bat.voltage_V
+
+  @property
+  def is_battery_low(self):
+    """ Returns True if the voltage is below `BAT_LOW_MV` (w/o VBUS)
+    """
+    return g_bat.is_low
 
   @property
   def exit_requested(self):
@@ -233,8 +369,9 @@ class Robot(object):
     """ If display is connected, show important status information there
     """
     if g_gui:
-      vbus = self._pinVBUSPresent.value()
-      pw_V = self.power_V
+      t_us = time.ticks_us()
+      vbus = g_bat.vbus
+      pw_V = g_bat.voltage_V
       g_gui.show_general_info(glb.STATE_STRS[g_state],
           "{0:.1f}".format(g_move_dir) if g_state is glb.STATE_TURNING else "",
           vbus, pw_V
@@ -243,6 +380,8 @@ class Robot(object):
         g_gui.show_distance_evo(self._last_dist)
       if g_dist_tof:
         g_gui.show_distance_tof(self._last_dist)
+      if g_stats:
+        g_stats.add(glb.STAT_GUI, time.ticks_diff(time.ticks_us(), t_us))
 
   def show_message(self, msg):
     """ Show a message on the display
@@ -304,7 +443,16 @@ class Robot(object):
         e.g. "sleep_ms(period_ms=50, callback=myfunction)"" is setting it up,
              "sleep_ms(100)"" (~sleep for 100 ms) or "sleep_ms()" keeps it
              running.
+        Pending messages in the log ring buffer are printed, if the output
+        is ready, and telemetry blocks and sensor traces are written to flash,
+        if `dur_ms` is at least `TLM_IDLE_MS`.
     """
+    glb.drainLog()
+    if dur_ms >= cfg.TLM_IDLE_MS:
+      if g_tlm:
+        g_tlm.flush()
+      if g_trace:
+        g_trace.flush()
     if self._spin_period_ms > 0:
       p_ms = self._spin_period_ms
       p_us = p_ms *1000
@@ -376,7 +524,7 @@ class Robot(object):
         - It uses only global variables for external objects to stay
           compatible with the core-1 version below.
     """
-    global g_state_gait, g_state, g_counter
+    global g_state_gait, g_state, g_counter, g_t_spin_us
     global g_cmd, g_do_exit
     global g_move_dir, g_move_rev
     global g_dist_evo, g_led, g_gui
@@ -413,15 +561,34 @@ class Robot(object):
         g_state = glb.STATE_POWERING_DOWN
 
       # Spin everyone who needs spinning
+      t0_us = time.ticks_us()
       g_gait.spin()
       g_state_gait = g_gait.state
+      t1_us = time.ticks_us()
       if g_dist_evo:
         g_dist_evo.update(raw=True)
+      if g_hub:
+        _adapt_sampling()
+        if g_hub.update() and g_dist_flt:
+          _filter_dist()
+      t2_us = time.ticks_us()
       if g_gui:
         g_gui.spin()
       g_counter += 1
       g_led.value(0)
 
+      # Keep statistics and record telemetry, if requested
+      dt_us = time.ticks_diff(t0_us, g_t_spin_us) if g_t_spin_us else 0
+      if g_stats:
+        if dt_us:
+          g_stats.add(glb.STAT_PERIOD, dt_us)
+        g_stats.add(glb.STAT_GAIT, time.ticks_diff(t1_us, t0_us))
+        g_stats.add(glb.STAT_SENSOR, time.ticks_diff(t2_us, t1_us))
+        g_stats.add(glb.STAT_LED, time.ticks_diff(time.ticks_us(), t2_us))
+      if g_tlm and g_counter % cfg.TLM_EVERY_N == 0:
+        _record_telemetry(dt_us)
+      g_t_spin_us = t0_us
+
     else:
       # Finalize ...
       g_gait.deinit()
@@ -437,7 +604,7 @@ class Robot(object):
           core 0.
         - It communicates via global variables.
     """
-    global g_state_gait, g_state, g_counter
+    global g_state_gait, g_state, g_counter, g_t_spin_us
     global g_cmd, g_do_exit
     global g_move_dir, g_move_rev
     global g_dist_evo, g_led, g_gui
@@ -479,17 +646,36 @@ class Robot(object):
             g_state = glb.STATE_POWERING_DOWN
 
           # Spin everyone who needs spinning
+          t0_us = time.ticks_us()
           g_gait.spin()
           g_state_gait = g_gait.state
+          t1_us = time.ticks_us()
           if g_dist_evo:
             g_dist_evo.update(raw=False)
+          if g_hub:
+            _adapt_sampling()
+            if g_hub.update() and g_dist_flt:
+              _filter_dist()
+          t2_us = time.ticks_us()
           if g_gui:
             g_gui.spin()
           g_counter += 1
           g_led.value(0)
 
+          # Keep statistics and record telemetry, if requested
+          dt_us = time.ticks_diff(t0_us, g_t_spin_us) if g_t_spin_us else 0
+          if g_stats:
+            if dt_us:
+              g_stats.add(glb.STAT_PERIOD, dt_us)
+            g_stats.add(glb.STAT_GAIT, time.ticks_diff(t1_us, t0_us))
+            g_stats.add(glb.STAT_SENSOR, time.ticks_diff(t2_us, t1_us))
+            g_stats.add(glb.STAT_LED, time.ticks_diff(time.ticks_us(), t2_us))
+          if g_tlm and g_counter % cfg.TLM_EVERY_N == 0:
+            _record_telemetry(dt_us)
+          g_t_spin_us = t0_us
+
           # Wait for a little while
-          time.sleep_ms(25)
+          time.sleep_ms(cfg.CORE1_SLEEP_MS)
 
       except KeyboardInterrupt:
         pass
@@ -497,7 +683,76 @@ class Robot(object):
     finally:
       g_gait.deinit()
       g_led.value(0)
-      glb.toLog("Hardware thread ended.")
+      glb.toLogQ(glb.MSG_HW_THREAD_ENDED)
       g_state = glb.STATE_OFF
 
 # ----------------------------------------------------------------------------
+def _on_battery(bat, is_low):
+  """ Called by the battery monitor when the low-battery state changes
+  """
+  glb.toLogQ(glb.MSG_BAT_LOW if is_low else glb.MSG_BAT_OK, 1 if is_low else 0,
+             bat.voltage_mV)
+
+def _read_tof_mm(tof):
+  """ Read function for the sensor hub; distance in [mm] or DATA_NONE
+  """
+  r = tof.range_cm
+  return DATA_NONE if r < 0 else int(r *10)
+
+@micropython.native
+def _adapt_sampling():
+  """ Set the read rates of the distance sensors: full rate while walking
+      or stopping, reduced while turning or idle; a sensor close to the
+      object or cliff threshold is read faster while moving
+  """
+  s = g_state
+  if s in (glb.STATE_WALKING, glb.STATE_REVERSING, glb.STATE_STOPPING):
+    hz = cfg.TOFPWM_RATE_HZ
+  else:
+    hz = cfg.TOFPWM_SLOW_HZ
+  moving = s in (glb.STATE_WALKING, glb.STATE_REVERSING, glb.STATE_TURNING)
+  d = g_hub.values
+  ok = g_hub.valid
+  for i in range(g_hub.count):
+    if (moving and ok[i] and
+        (d[i] < cfg.DIST_TOF_OBJ +cfg.TOFPWM_NEAR_MM or
+         d[i] > cfg.DIST_TOF_CLIFF -cfg.TOFPWM_NEAR_MM)):
+      g_hub.set_rate(i, cfg.TOFPWM_FAST_HZ)
+    else:
+      g_hub.set_rate(i, hz)
+
+def _filter_dist():
+  """ Feed the new readings of the sensor hub into the filter bank, each
+      only once; the filter is not called for sensors w/o a new reading
+  """
+  seq = g_hub.sequences
+  ok = g_hub.valid
+  v = g_hub.values
+  for i in range(len(g_hub_seq)):
+    if seq[i] != g_hub_seq[i]:
+      g_hub_seq[i] = seq[i]
+      g_dist_flt.update_ch(i, v[i] if ok[i] else DATA_NONE)
+
+def _keep_dist(d):
+  """ Keep a copy of the last distance readings for the telemetry recorder
+  """
+  for i in range(min(len(d), len(g_last_dist))):
+    g_last_dist[i] = d[i]
+
+def _record_telemetry(period_us):
+  """ Pack a telemetry record (`TLM_FMT`) for the current hardware loop cycle
+      into the recorder's buffer; does not allocate
+  """
+  off = g_tlm.begin()
+  if off < 0:
+    return
+  pos = g_gait._SM.positions_us
+  d = g_last_dist
+  struct.pack_into(TLM_FMT, g_tlm.buffer, off,
+      time.ticks_ms() & 0x3FFFFFFF, g_counter & 0xFFFF, g_state,
+      g_gait.step & 0xFF, pos[0], pos[1], pos[2], d[0], d[1], d[2], d[3],
+      g_bat.voltage_mV, min(period_us, 0xFFFF)
+    )
+  g_tlm.commit()
+
+# ----------------------------------------------------------------------------
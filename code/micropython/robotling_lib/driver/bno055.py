@@ -5,6 +5,10 @@
 # The MIT License (MIT)
 # Copyright (c) 2020 Thomas Euler
 # 2020-09-07, v1
+# 2022-10-18, v1.1, burst read of the fusion data block into a preallocated
+#                   buffer, lazy decoding, data-ready gating; no `Struct`
+#                   descriptors anymore; calibration profile save/restore
+# 2022-10-18, v1.2, register access via `RegisterDevice`
 #
 # Based on the CircuitPython driver:
 # https://github.com/adafruit/Adafruit_CircuitPython_BNO055
@@ -38,21 +42,19 @@ try:
 except ImportError:
   import ustruct as struct
 
+import array
 from micropython import const
 import robotling_lib.misc.ansi_color as ansi
 from robotling_lib.platform.platform import platform
+from robotling_lib.platform.rp2.register import RegisterDevice
 if platform.languageID == platform.LNG_MICROPYTHON:
   import time
-  from robotling_lib.platform.esp32.register.i2c_struct \
-    import Struct, UnaryStruct
 elif platform.languageID == platform.LNG_CIRCUITPYTHON:
   import robotling_lib.platform.circuitpython.time as time
-  from robotling_lib.platform.circuitpython.register.i2c_struct \
-    import Struct, UnaryStruct
 else:
   print(ansi.RED +"ERROR: No matching libraries in `platform`." +ansi.BLACK)
 
-__version__ = "0.1.0.0"
+__version__ = "0.1.3.0"
 CHIP_NAME   = "bno055"
 CHAN_COUNT  = const(1)
 
@@ -145,64 +147,101 @@ _OFFSET_MAGNET_REGISTER = const(0x5B)
 _OFFSET_GYRO_REGISTER   = const(0x61)
 _RADIUS_ACCEL_REGISTER  = const(0x67)
 _RADIUS_MAGNET_REGISTER = const(0x69)
+_PROFILE_LEN            = const(22)    # Offsets and radii, 0x55..0x6A
+_PROFILE_MAGIC          = b"BNOC"
 _TRIGGER_REGISTER       = const(0x3F)
 _POWER_REGISTER         = const(0x3E)
 _ID_REGISTER            = const(0x00)
+_TEMP_REGISTER          = const(0x34)
+_INT_STA_REGISTER       = const(0x37)
+_INT_MSK_REGISTER       = const(0x0F)  # Page 1
+_INT_EN_REGISTER        = const(0x10)  # Page 1
+
+# Fusion data block (0x08..0x33), read in one burst
+_DATA_REGISTER          = const(0x08)
+_DATA_LEN               = const(44)
+_DATA_PERIOD_MS         = const(10)    # Fusion output data rate is 100 Hz
+_DRDY_MASK              = const(0x13)  # GYR_DRDY, MAG_DRDY, ACC_BSX_DRDY
+_DRDY_MAX_MISS          = const(10)    # Periods w/o data ready before
+                                       # falling back to the period only
+FLD_ACCEL               = const(0)     # Fields of the data block
+FLD_MAGNET              = const(1)
+FLD_GYRO                = const(2)
+FLD_EULER               = const(3)
+FLD_QUAT                = const(4)
+FLD_LINACC              = const(5)
+FLD_GRAVITY             = const(6)
 # pylint: enable=bad-whitespace
 
-# ----------------------------------------------------------------------------
-class _ScaledReadOnlyStruct(Struct):
-  # pylint: disable=too-few-public-methods
-  def __init__(self, register_address, struct_format, scale):
-    super(_ScaledReadOnlyStruct, self).__init__(register_address, struct_format)
-    self.scale = scale
-
-  def __get__(self, obj, objtype=None):
-    result = super(_ScaledReadOnlyStruct, self).__get__(obj, objtype)
-    return tuple(self.scale*v for v in result)
+# Offset in the data block, format and scaling of the fields
+_FIELDS = (
+  (0x00, "<hhh", 1 /100),
+  (0x06, "<hhh", 1 /16),
+  (0x0C, "<hhh", 0.001090830782496456),
+  (0x12, "<hhh", 1 /16),
+  (0x18, "<hhhh", 1 /(1 << 14)),
+  (0x20, "<hhh", 1 /100),
+  (0x26, "<hhh", 1 /100)
+)
+_NONE3 = (None, None, None)
+_NONE4 = (None, None, None, None)
 
-  def __set__(self, obj, value):
-    raise NotImplementedError()
-
-
-class _ReadOnlyUnaryStruct(UnaryStruct):
-  # pylint: disable=too-few-public-methods
-  def __set__(self, obj, value):
-    raise NotImplementedError()
-
-
-class _ModeStruct(Struct):
+# ----------------------------------------------------------------------------
+class _ModeStruct(object):
+  # Register(s) that can only be accessed in `mode` (e.g. CONFIG_MODE)
   # pylint: disable=too-few-public-methods
   def __init__(self, register_address, struct_format, mode):
-    super().__init__(register_address, struct_format)
+    self.address = register_address
+    self.format = struct_format
     self.mode = mode
+    self._buf = bytearray(struct.calcsize(struct_format))
 
   def __get__(self, obj, objtype=None):
     last_mode = obj.mode
-    obj.mode = self.mode
-    result = super().__get__(obj, objtype)
-    obj.mode = last_mode
+    if last_mode != self.mode:
+      obj.mode = self.mode
+    obj._read_block(self.address, self._buf)
+    if last_mode != self.mode:
+      obj.mode = last_mode
+    result = struct.unpack(self.format, self._buf)
     # single value comes back as a one-element tuple
-    return result[0] if isinstance(result, tuple) and len(result) == 1 else result
+    return result[0] if len(result) == 1 else result
 
   def __set__(self, obj, value):
     last_mode = obj.mode
-    obj.mode = self.mode
-    # underlying __set__() expects a tuple
+    if last_mode != self.mode:
+      obj.mode = self.mode
     set_val = value if isinstance(value, tuple) else (value,)
-    super().__set__(obj, set_val)
-    obj.mode = last_mode
+    struct.pack_into(self.format, self._buf, 0, *set_val)
+    obj._write_block(self.address, self._buf)
+    if last_mode != self.mode:
+      obj.mode = last_mode
 
 # ----------------------------------------------------------------------------
 class BNO055Base(object):
   """Base class for the BNO055 9DOF IMU sensor."""
 
-  def __init__(self, i2c=None):
-    """ Requires already initialized I2C bus instance.
+  def __init__(self, i2c=None, use_drdy=True, calib_file=None):
+    """ Requires already initialized I2C bus instance. With `use_drdy`, the
+        fusion data block is only read when the data-ready status is set
+        (otherwise, at most once per fusion output period). If `calib_file`
+        contains a calibration profile (see `save_calibration()`), it is
+        restored before fusion starts.
     """
     if i2c:
       self.i2c_device = i2c
     self._isReady = False
+    self._mode = CONFIG_MODE
+    self._data = bytearray(_DATA_LEN)
+    self._vals = [array.array("f", [0]*(struct.calcsize(f[1]) //2))
+                  for f in _FIELDS]
+    self._valid = 0
+    self._tData = 0
+    self._nReads = 0
+    self._nMiss = 0
+    self._useDRDY = False
+    self._profile = bytearray(_PROFILE_LEN)
+    self._isProfileRestored = False
     chip_id = self._read_register(_ID_REGISTER)
     if chip_id != _CHIP_ID:
       raise RuntimeError("Bad chip id ({0} != {1})".format(chip_id, _CHIP_ID))
@@ -213,8 +252,19 @@ class BNO055Base(object):
     self.accel_range = ACCEL_4G
     self.gyro_range = GYRO_2000_DPS
     self.magnet_rate = MAGNET_20HZ
+    if use_drdy:
+      # Data-ready status bits (no interrupt pin needed, status only)
+      self._write_register(_PAGE_REGISTER, 0x01)
+      self._write_register(_INT_MSK_REGISTER, _DRDY_MASK)
+      self._write_register(_INT_EN_REGISTER, _DRDY_MASK)
+      self._write_register(_PAGE_REGISTER, 0x00)
+      self._useDRDY = True
+    if calib_file:
+      # Still in CONFIG_MODE, hence no extra mode switches
+      self._isProfileRestored = self.load_calibration(calib_file)
     time.sleep_ms(10)
     self.mode = NDOF_MODE
+    self._tData = time.ticks_ms() -_DATA_PERIOD_MS
     time.sleep_ms(10)
 
     self._isReady = True
@@ -343,7 +393,7 @@ class BNO055Base(object):
           absolute orientation data is calculated from accelerometer,
           gyroscope and the magnetometer.
     """
-    return self._read_register(_MODE_REGISTER)
+    return self._mode
 
   @mode.setter
   def mode(self, new_mode):
@@ -352,6 +402,47 @@ class BNO055Base(object):
     if new_mode != CONFIG_MODE:
       self._write_register(_MODE_REGISTER, new_mode)
       time.sleep_ms(10)  # Table 3.6
+    self._mode = new_mode
+    self._valid = 0
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def update(self, force=False):
+    """ Reads the fusion data block (0x08..0x33) in one burst, if new data
+        is available (or `force` is True); returns True if it was read
+    """
+    if not force:
+      if time.ticks_diff(time.ticks_ms(), self._tData) < _DATA_PERIOD_MS:
+        return False
+      if self._useDRDY:
+        if not self._read_register(_INT_STA_REGISTER) & _DRDY_MASK:
+          self._nMiss += 1
+          if self._nMiss < _DRDY_MAX_MISS:
+            return False
+          # Status is not supported by the firmware, use period only
+          self._useDRDY = False
+        self._nMiss = 0
+    self._read_block(_DATA_REGISTER, self._data)
+    self._tData = time.ticks_ms()
+    self._valid = 0
+    self._nReads += 1
+    return True
+
+  def _field(self, iFld):
+    # Returns field `iFld` of the data block, decoded only once per read
+    self.update()
+    v = self._vals[iFld]
+    if not self._valid & (1 << iFld):
+      off, fmt, scale = _FIELDS[iFld]
+      for j, x in enumerate(struct.unpack_from(fmt, self._data, off)):
+        v[j] = x *scale
+      self._valid |= 1 << iFld
+    return v
+
+  @property
+  def read_count(self):
+    """ Number of burst reads of the data block so far
+    """
+    return self._nReads
 
   @property
   def calibration_status(self):
@@ -371,6 +462,65 @@ class BNO055Base(object):
     sys, gyro, accel, mag = self.calibration_status
     return sys == gyro == accel == mag == 0x03
 
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @property
+  def calibration_profile(self):
+    """ Offsets and radii of accelerometer, magnetometer and gyroscope as
+        22 bytes (registers 0x55..0x6A), read in one CONFIG_MODE session
+    """
+    last_mode = self._mode
+    if last_mode != CONFIG_MODE:
+      self.mode = CONFIG_MODE
+    self._read_block(_OFFSET_ACCEL_REGISTER, self._profile)
+    if last_mode != CONFIG_MODE:
+      self.mode = last_mode
+    return bytes(self._profile)
+
+  @calibration_profile.setter
+  def calibration_profile(self, prof):
+    if len(prof) != _PROFILE_LEN:
+      raise ValueError("Calibration profile must have 22 bytes")
+    last_mode = self._mode
+    if last_mode != CONFIG_MODE:
+      self.mode = CONFIG_MODE
+    self._write_block(_OFFSET_ACCEL_REGISTER, prof)
+    if last_mode != CONFIG_MODE:
+      self.mode = last_mode
+
+  def save_calibration(self, fname, force=False):
+    """ Writes the calibration profile to file `fname`, if the sensor is
+        fully calibrated (or `force` is True); returns True if written
+    """
+    if not force and not self.calibrated:
+      return False
+    prof = self.calibration_profile
+    with open(fname, "wb") as f:
+      f.write(_PROFILE_MAGIC)
+      f.write(prof)
+    return True
+
+  def load_calibration(self, fname):
+    """ Restores the calibration profile from file `fname`; returns False,
+        if there is no (valid) profile
+    """
+    try:
+      with open(fname, "rb") as f:
+        if f.read(len(_PROFILE_MAGIC)) != _PROFILE_MAGIC:
+          return False
+        n = f.readinto(self._profile)
+    except OSError:
+      return False
+    if n != _PROFILE_LEN:
+      return False
+    self.calibration_profile = self._profile
+    return True
+
+  @property
+  def profile_restored(self):
+    """ True if a calibration profile was restored at boot
+    """
+    return self._isProfileRestored
+
   @property
   def external_crystal(self):
     """ Switches the use of external crystal on or off.
@@ -395,11 +545,8 @@ class BNO055Base(object):
   def temperature(self):
     """ Measures the temperature of the chip in degrees Celsius.
     """
-    return self._temperature
-
-  @property
-  def _temperature(self):
-    raise NotImplementedError("Must be implemented.")
+    t = self._read_register(_TEMP_REGISTER)
+    return t -256 if t > 127 else t
 
   @property
   def acceleration(self):
@@ -407,13 +554,9 @@ class BNO055Base(object):
         Returns an empty tuple of length 3 when this property has been
         disabled by the current mode.
     """
-    if self.mode not in [0x00, 0x02, 0x03, 0x06]:
-      return self._acceleration
-    return (None, None, None)
-
-  @property
-  def _acceleration(self):
-    raise NotImplementedError("Must be implemented.")
+    if self._mode not in (0x00, 0x02, 0x03, 0x06):
+      return self._field(FLD_ACCEL)
+    return _NONE3
 
   @property
   def magnetic(self):
@@ -421,13 +564,9 @@ class BNO055Base(object):
         Returns an empty tuple of length 3 when this property has been
         disabled by the current mode.
     """
-    if self.mode not in [0x00, 0x03, 0x05, 0x08]:
-      return self._magnetic
-    return (None, None, None)
-
-  @property
-  def _magnetic(self):
-    raise NotImplementedError("Must be implemented.")
+    if self._mode not in (0x00, 0x03, 0x05, 0x08):
+      return self._field(FLD_MAGNET)
+    return _NONE3
 
   @property
   def gyro(self):
@@ -435,13 +574,9 @@ class BNO055Base(object):
         Returns an empty tuple of length 3 when this property has been
         disabled by the current mode.
     """
-    if self.mode not in [0x00, 0x01, 0x02, 0x04, 0x09, 0x0A]:
-      return self._gyro
-    return (None, None, None)
-
-  @property
-  def _gyro(self):
-    raise NotImplementedError("Must be implemented.")
+    if self._mode not in (0x00, 0x01, 0x02, 0x04, 0x09, 0x0A):
+      return self._field(FLD_GYRO)
+    return _NONE3
 
   @property
   def euler(self):
@@ -449,13 +584,9 @@ class BNO055Base(object):
         Returns an empty tuple of length 3 when this property has been
         disabled by the current mode.
     """
-    if self.mode in [0x09, 0x0B, 0x0C]:
-      return self._euler
-    return (None, None, None)
-
-  @property
-  def _euler(self):
-    raise NotImplementedError("Must be implemented.")
+    if self._mode in (0x09, 0x0B, 0x0C):
+      return self._field(FLD_EULER)
+    return _NONE3
 
   @property
   def quaternion(self):
@@ -463,13 +594,9 @@ class BNO055Base(object):
         Returns an empty tuple of length 3 when this property has been
         disabled by the current mode.
     """
-    if self.mode in [0x09, 0x0B, 0x0C]:
-      return self._quaternion
-    return (None, None, None, None)
-
-  @property
-  def _quaternion(self):
-    raise NotImplementedError("Must be implemented.")
+    if self._mode in (0x09, 0x0B, 0x0C):
+      return self._field(FLD_QUAT)
+    return _NONE4
 
   @property
   def linear_acceleration(self):
@@ -477,13 +604,9 @@ class BNO055Base(object):
         Returns an empty tuple of length 3 when this property has been
         disabled by the current mode.
     """
-    if self.mode in [0x09, 0x0B, 0x0C]:
-      return self._linear_acceleration
-    return (None, None, None)
-
-  @property
-  def _linear_acceleration(self):
-    raise NotImplementedError("Must be implemented.")
+    if self._mode in (0x09, 0x0B, 0x0C):
+      return self._field(FLD_LINACC)
+    return _NONE3
 
   @property
   def gravity(self):
@@ -491,13 +614,9 @@ class BNO055Base(object):
         Returns an empty tuple of length 3 when this property has been
         disabled by the current mode.
     """
-    if self.mode in [0x09, 0x0B, 0x0C]:
-      return self._gravity
-    return (None, None, None)
-
-  @property
-  def _gravity(self):
-    raise NotImplementedError("Must be implemented.")
+    if self._mode in (0x09, 0x0B, 0x0C):
+      return self._field(FLD_GRAVITY)
+    return _NONE3
 
   @property
   def accel_range(self):
@@ -683,19 +802,16 @@ class BNO055Base(object):
   def _read_register(self, register):
     raise NotImplementedError("Must be implemented.")
 
+  def _read_block(self, register, buf):
+    raise NotImplementedError("Must be implemented.")
+
+  def _write_block(self, register, buf):
+    raise NotImplementedError("Must be implemented.")
+
 # ----------------------------------------------------------------------------
 class BNO055(BNO055Base):
   """Driver for the BNO055 9DOF IMU sensor via I2C."""
 
-  _temperature = _ReadOnlyUnaryStruct(0x34, "b")
-  _acceleration = _ScaledReadOnlyStruct(0x08, "<hhh", 1 / 100)
-  _magnetic = _ScaledReadOnlyStruct(0x0E, "<hhh", 1 / 16)
-  _gyro = _ScaledReadOnlyStruct(0x14, "<hhh", 0.001090830782496456)
-  _euler = _ScaledReadOnlyStruct(0x1A, "<hhh", 1 / 16)
-  _quaternion = _ScaledReadOnlyStruct(0x20, "<hhhh", 1 / (1 << 14))
-  _linear_acceleration = _ScaledReadOnlyStruct(0x28, "<hhh", 1 / 100)
-  _gravity = _ScaledReadOnlyStruct(0x2E, "<hhh", 1 / 100)
-
   # Calibration offsets for the accelerometer, magnometer and gyroscope
   offsets_accelerometer = _ModeStruct(_OFFSET_ACCEL_REGISTER, "<hhh", CONFIG_MODE)
   offsets_magnetometer = _ModeStruct(_OFFSET_MAGNET_REGISTER, "<hhh", CONFIG_MODE)
@@ -705,19 +821,22 @@ class BNO055(BNO055Base):
   radius_accelerometer = _ModeStruct(_RADIUS_ACCEL_REGISTER, "<h", CONFIG_MODE)
   radius_magnetometer = _ModeStruct(_RADIUS_MAGNET_REGISTER, "<h", CONFIG_MODE)
 
-  def __init__(self, i2c, address=ADDRESS_BNO055):
+  def __init__(self, i2c, address=ADDRESS_BNO055, use_drdy=True,
+               calib_file=None):
     self._i2c_addr = address
-    super().__init__(i2c)
+    self._regs = RegisterDevice(i2c, address)
+    super().__init__(i2c, use_drdy, calib_file)
 
   def _write_register(self, register, value):
-    buf = bytearray([register, value])
-    with self.i2c_device as i2c:
-      i2c.writeto(self._i2c_addr, buf)
+    self._regs.write_u8(register, value)
 
   def _read_register(self, register):
-    buf = bytearray([register, 0])
-    with self.i2c_device as i2c:
-      i2c.write_then_readinto(self._i2c_addr, buf, buf, out_end=1, in_start=1)
-    return buf[1]
+    return self._regs.read_u8(register)
+
+  def _read_block(self, register, buf):
+    self._regs.read_into(register, buf)
+
+  def _write_block(self, register, buf):
+    self._regs.write_from(register, buf)
 
 # ----------------------------------------------------------------------------
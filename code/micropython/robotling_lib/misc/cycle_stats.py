@@ -0,0 +1,123 @@
+# ----------------------------------------------------------------------------
+# cycle_stats.py
+# Low-overhead cycle-time and jitter statistics with preallocated histograms
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import array
+from micropython import const
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+N_BINS         = const(16)
+MAX_US         = const(0x3FFFFFFF)
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class CycleStats(object):
+  """Accumulates durations (in [us]) for a fixed set of channels, e.g. the
+     period of a loop and the time spent in its subsystems. All storage is
+     preallocated, `add()` uses only small integers and does not allocate."""
+
+  def __init__(self, names, bin_us, n_bins=N_BINS):
+    """ `names` is a list of channel names, `bin_us` a list with the width of
+        the histogram bins (in [us]) for each channel; the last bin of each
+        histogram collects everything beyond `(n_bins-1) *bin_us`.
+    """
+    n = len(names)
+    self._names = names
+    self._nCh = n
+    self._nBins = max(n_bins, 2)
+    self._binW = array.array("I", bin_us)
+    self._hist = array.array("I", [0]*(n *self._nBins))
+    self._count = array.array("I", [0]*n)
+    self._min = array.array("I", [0]*n)
+    self._max = array.array("I", [0]*n)
+    self._last = array.array("I", [0]*n)
+    self._sum_us = array.array("I", [0]*n)
+    self._sum_s = array.array("I", [0]*n)
+    self.reset()
+
+  def reset(self):
+    """ Clear all statistics
+    """
+    for i in range(len(self._hist)):
+      self._hist[i] = 0
+    for i in range(self._nCh):
+      self._count[i] = 0
+      self._min[i] = MAX_US
+      self._max[i] = 0
+      self._last[i] = 0
+      self._sum_us[i] = 0
+      self._sum_s[i] = 0
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @micropython.native
+  def add(self, ch, dt_us):
+    """ Add a duration `dt_us` (in [us]) to channel `ch`
+    """
+    if dt_us < 0:
+      dt_us = 0
+    elif dt_us > MAX_US:
+      dt_us = MAX_US
+    nb = self._nBins
+    ib = dt_us //self._binW[ch]
+    if ib >= nb:
+      ib = nb -1
+    self._hist[ch *nb +ib] += 1
+    self._count[ch] += 1
+    self._last[ch] = dt_us
+    if dt_us < self._min[ch]:
+      self._min[ch] = dt_us
+    if dt_us > self._max[ch]:
+      self._max[ch] = dt_us
+    s = self._sum_us[ch] +dt_us
+    if s >= 1_000_000:
+      self._sum_s[ch] += s //1_000_000
+      s %= 1_000_000
+    self._sum_us[ch] = s
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @property
+  def channel_names(self):
+    return self._names
+
+  @property
+  def counts(self):
+    return self._count
+
+  @property
+  def last_us(self):
+    return self._last
+
+  def mean_us(self, ch):
+    """ Returns the mean duration of channel `ch` in [us]
+    """
+    n = self._count[ch]
+    if n == 0:
+      return 0
+    return (self._sum_s[ch] *1_000_000 +self._sum_us[ch]) /n
+
+  def histogram(self, ch):
+    """ Returns a memoryview on the histogram of channel `ch`
+    """
+    nb = self._nBins
+    return memoryview(self._hist)[ch *nb:(ch +1) *nb]
+
+  def print(self):
+    """ Print statistics of all channels as a table
+    """
+    print("{0:>10} {1:>7} {2:>8} {3:>8} {4:>8} {5:>7} histogram"
+          .format("channel", "n", "mean_us", "min_us", "max_us", "bin_us"))
+    for ch in range(self._nCh):
+      n = self._count[ch]
+      mn = self._min[ch] if n > 0 else 0
+      h = " ".join(["{0}".format(v) for v in self.histogram(ch)])
+      print("{0:>10} {1:>7} {2:>8.0f} {3:>8} {4:>8} {5:>7} {6}"
+            .format(self._names[ch], n, self.mean_us(ch), mn,
+                    self._max[ch], self._binW[ch], h))
+
+# ----------------------------------------------------------------------------
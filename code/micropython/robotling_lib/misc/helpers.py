@@ -6,8 +6,13 @@
 # Copyright (c) 2018 Thomas Euler
 # 2018-09-13, v1
 # 2018-12-22, v1.1 - Added TimeTracker class
+# 2022-10-18, v1.2 - Added FilterBank class; running sum in TemporalFilter
+# 2022-10-18, v1.3 - FilterBank: history index per channel, advanced only
+#                    when the channel takes a sample; `update_ch()`;
+#                    output is invalid after `max_fail` failed samples
 # ----------------------------------------------------------------------------
 import array
+from micropython import const
 
 from robotling_lib.platform.platform import platform as pf
 if pf.languageID == pf.LNG_MICROPYTHON:
@@ -15,7 +20,14 @@ if pf.languageID == pf.LNG_MICROPYTHON:
 else:
   from robotling_lib.platform.circuitpython.time import ticks_us, ticks_diff
 
-__version__ = "0.1.1.0"
+__version__ = "0.1.3.1"
+
+# pylint: disable=bad-whitespace
+# Filter types of `FilterBank`
+FLT_MEAN       = const(1)
+FLT_MEDIAN     = const(2)
+FLT_EMA        = const(3)
+# pylint: enable=bad-whitespace
 
 # ----------------------------------------------------------------------------
 class TemporalFilter(object):
@@ -25,14 +37,149 @@ class TemporalFilter(object):
     self._n = max(n, 2)
     self._i = 0
     self._buf = array.array(typeStr, [initVal]*self._n)
+    self._sum = initVal *self._n
 
   def mean(self, newVal):
+    self._sum += newVal -self._buf[self._i]
     self._buf[self._i] = newVal
     self._i = self._i+1 if self._i < self._n-1 else 0
-    av = 0
-    for i in range(self._n):
-      av += self._buf[i]
-    return av /self._n
+    return self._sum /self._n
+
+# ----------------------------------------------------------------------------
+class FilterBank(object):
+  """Streaming filters for `n_ch` integer channels (e.g. distances in [mm]),
+     all updated with one call; all state is kept in preallocated arrays.
+     - FLT_MEAN   : running mean over `n` samples, O(1)
+     - FLT_MEDIAN : median of the last `n` samples (odd, small), kept in an
+                    incrementally sorted window, O(n)
+     - FLT_EMA    : exponential moving average, alpha = `ema_num`/2^`ema_shift`
+     With `max_step` > 0, a sample that differs by more than that from the
+     last accepted one is rejected as outlier, unless this happens `max_reject`
+     times in a row (then it is a real change). Negative samples (errors) are
+     ignored, the channel keeps its last output; with `max_fail` > 0, after
+     that many errors in a row, the output becomes the (negative) error value
+     until the next valid sample. Before the first valid sample, the output
+     is -1. Each channel has its own
+     history, hence channels can be sampled at different rates (see
+     `update_ch()`)."""
+
+  def __init__(self, n_ch, kind=FLT_MEDIAN, n=3, ema_num=1, ema_shift=2,
+               max_step=0, max_reject=3, max_fail=0):
+    self._nCh = n_ch
+    self._kind = kind
+    self._n = max(n, 1) if kind != FLT_MEDIAN else max(n, 1) | 1
+    self._emaNum = ema_num
+    self._emaShift = ema_shift
+    self._emaHalf = (1 << ema_shift) >> 1
+    self._maxStep = max_step
+    self._maxRej = max_reject
+    self._maxFail = max_fail
+    nw = n_ch *self._n if kind != FLT_EMA else 0
+    self._hist = array.array("i", [0]*nw)
+    self._sorted = array.array("i", [0]*(nw if kind == FLT_MEDIAN else 0))
+    self._sums = array.array("i", [0]*n_ch)
+    self._nRej = array.array("i", [0]*n_ch)
+    self._nFail = array.array("i", [0]*n_ch)
+    self._last = array.array("i", [0]*n_ch)
+    self._primed = bytearray(n_ch)
+    self._iHist = array.array("B", [0]*n_ch)
+    self._nRejected = 0
+    self.out = array.array("i", [-1]*n_ch)
+
+  def reset(self):
+    for i in range(self._nCh):
+      self._primed[i] = 0
+      self._nRej[i] = 0
+      self._nFail[i] = 0
+
+  @property
+  def rejected(self):
+    """ Returns the number of samples rejected as outliers
+    """
+    return self._nRejected
+
+  def _prime(self, ch, x):
+    n = self._n
+    for j in range(ch *n, (ch +1) *n if self._kind != FLT_EMA else 0):
+      self._hist[j] = x
+      if self._kind == FLT_MEDIAN:
+        self._sorted[j] = x
+    self._sums[ch] = x *n
+    self.out[ch] = x
+    self._last[ch] = x
+    self._primed[ch] = 1
+
+  @micropython.native
+  def update(self, vals, res=None):
+    """ Filters one sample per channel (`vals`); returns the filtered values
+        (the array `out` or, if given, `res`, into which they are copied)
+    """
+    for ch in range(self._nCh):
+      self.update_ch(ch, vals[ch])
+    out = self.out
+    if res is None:
+      return out
+    for ch in range(self._nCh):
+      res[ch] = out[ch]
+    return res
+
+  @micropython.native
+  def update_ch(self, ch, x):
+    """ Filters sample `x` of channel `ch` only; returns the channel's
+        filtered value
+    """
+    out = self.out
+    if x < 0:
+      if self._maxFail > 0 and self._primed[ch]:
+        self._nFail[ch] += 1
+        if self._nFail[ch] >= self._maxFail:
+          # Do not bridge a sensor that stopped delivering
+          self._primed[ch] = 0
+          out[ch] = x
+      return out[ch]
+    self._nFail[ch] = 0
+    if not self._primed[ch]:
+      self._prime(ch, x)
+      return x
+    if self._maxStep > 0 and abs(x -self._last[ch]) > self._maxStep:
+      if self._nRej[ch] < self._maxRej:
+        self._nRej[ch] += 1
+        self._nRejected += 1
+        return out[ch]
+    self._nRej[ch] = 0
+    self._last[ch] = x
+
+    if self._kind == FLT_EMA:
+      y = out[ch]
+      out[ch] = y +(((x -y) *self._emaNum +self._emaHalf) >> self._emaShift)
+      return out[ch]
+
+    n = self._n
+    i = self._iHist[ch]
+    self._iHist[ch] = i +1 if i < n -1 else 0
+    b = ch *n
+    old = self._hist[b +i]
+    self._hist[b +i] = x
+    if self._kind == FLT_MEAN:
+      self._sums[ch] += x -old
+      out[ch] = self._sums[ch] //n
+    else:
+      # Replace `old` by `x` in the sorted window
+      s = self._sorted
+      p = b
+      while s[p] != old:
+        p += 1
+      if x > old:
+        while p < b +n -1 and s[p +1] < x:
+          s[p] = s[p +1]
+          p += 1
+      else:
+        while p > b and s[p -1] > x:
+          s[p] = s[p -1]
+          p -= 1
+      s[p] = x
+      out[ch] = s[b +(n >> 1)]
+    return out[ch]
 
 # ----------------------------------------------------------------------------
 class TimeTracker(object):
@@ -68,6 +215,8 @@ class TimeTracker(object):
 # ----------------------------------------------------------------------------
 def timed_function(f, *args, **kwargs):
   """ Use as decorator to measure the duration of a function call
+      NOTE: Prints on every call, which can take longer than the function
+      itself; for accumulated statistics use `misc.profiler.profiled`
   """
   myname = str(f).split(' ')[1]
   def new_func(*args, **kwargs):
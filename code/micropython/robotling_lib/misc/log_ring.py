@@ -0,0 +1,127 @@
+# ----------------------------------------------------------------------------
+# log_ring.py
+# Fixed-size ring buffer for compact log records; formatting and printing is
+# deferred to `drain()`, which can be called when there is time to spare.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import array
+from time import ticks_ms
+from micropython import const
+
+try:
+  import _thread
+  _LOCK = True
+except ImportError:
+  _LOCK = False
+try:
+  import select
+  import sys
+except ImportError:
+  select = None
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+N_ARGS         = const(4)   # Max. number of integer arguments per record
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class LogRing(object):
+  """Ring buffer of log records, each consisting of a time stamp, an error
+     code (level), a message ID and up to `N_ARGS` integer arguments."""
+
+  def __init__(self, n, messages):
+    """ `n` is the number of records the buffer can hold, `messages` a list
+        of format strings, indexed by message ID
+    """
+    self._n = max(n, 2)
+    self._msgs = messages
+    self._t_ms = array.array("I", [0]*self._n)
+    self._errC = array.array("b", [0]*self._n)
+    self._msgID = array.array("H", [0]*self._n)
+    self._args = array.array("i", [0]*(self._n *N_ARGS))
+    self._iWr = 0
+    self._iRd = 0
+    self._nDropped = 0
+    self._nDeferred = 0
+    self._lock = _thread.allocate_lock() if _LOCK else None
+    self._poll = None
+    if select:
+      try:
+        self._poll = select.poll()
+        self._poll.register(sys.stdout, select.POLLOUT)
+      except (AttributeError, OSError, TypeError):
+        self._poll = None
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def put(self, msgID, errC=0, a0=0, a1=0, a2=0, a3=0):
+    """ Add a record; no string formatting, no allocation. If the buffer is
+        full, the record is dropped and counted.
+    """
+    lk = self._lock
+    if lk:
+      lk.acquire()
+    i = self._iWr
+    iN = i +1 if i < self._n -1 else 0
+    if iN == self._iRd:
+      self._nDropped += 1
+    else:
+      self._t_ms[i] = ticks_ms() & 0x3FFFFFFF
+      self._errC[i] = errC
+      self._msgID[i] = msgID
+      j = i *N_ARGS
+      ar = self._args
+      ar[j] = a0
+      ar[j+1] = a1
+      ar[j+2] = a2
+      ar[j+3] = a3
+      self._iWr = iN
+    if lk:
+      lk.release()
+
+  def drain(self, emit, max_n=-1, force=False):
+    """ Format and emit up to `max_n` records (all, if < 0) by calling
+        `emit(msg, errC, t_ms)`. Stops early if the output (`sys.stdout`) is
+        not ready to accept data, unless `force` is True. Returns the number
+        of records emitted.
+    """
+    n = 0
+    while self._iRd != self._iWr and (max_n < 0 or n < max_n):
+      if not force and self._poll and not self._poll.poll(0):
+        self._nDeferred += 1
+        break
+      i = self._iRd
+      j = i *N_ARGS
+      ar = self._args
+      try:
+        s = self._msgs[self._msgID[i]].format(ar[j], ar[j+1], ar[j+2], ar[j+3])
+      except IndexError:
+        s = "Unknown message #{0}".format(self._msgID[i])
+      emit(s, self._errC[i], self._t_ms[i])
+      self._iRd = i +1 if i < self._n -1 else 0
+      n += 1
+    return n
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @property
+  def count(self):
+    """ Number of records waiting to be emitted
+    """
+    return (self._iWr -self._iRd) %self._n
+
+  @property
+  def dropped(self):
+    """ Number of records dropped because the buffer was full
+    """
+    return self._nDropped
+
+  @property
+  def deferred(self):
+    """ Number of times `drain()` stopped because the output was busy
+    """
+    return self._nDeferred
+
+# ----------------------------------------------------------------------------
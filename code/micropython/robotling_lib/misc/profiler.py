@@ -0,0 +1,203 @@
+# ----------------------------------------------------------------------------
+# profiler.py
+# Low-overhead profiling registry; a replacement for `helpers.timed_function`
+# that accumulates statistics instead of printing on every call.
+#
+# Usage:
+#   from robotling_lib.misc.profiler import profiled, ProfileSite, dump
+#
+#   @profiled("gait.spin", 1)   # name and number of positional arguments
+#   def spin(self): ...         # (incl. `self`); -1 for any
+#
+#   _ps = ProfileSite("sensors")
+#   with _ps:
+#     ...
+#   dump()
+#
+# Profiling is enabled by `PROFILING = True` in `rbl2_config.py`; otherwise
+# `profiled` returns the undecorated function and `ProfileSite` does nothing.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import array
+from micropython import const
+from time import ticks_us, ticks_diff
+
+try:
+  from rbl2_config import PROFILING as ENABLED
+except ImportError:
+  ENABLED = False
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+MAX_SITES      = const(32)
+N_BINS         = const(16)  # bin 0: 0 us, bin i: [2^(i-1), 2^i) us
+MAX_US         = const(0x3FFFFFFF)
+# pylint: enable=bad-whitespace
+
+_names = []
+_count = array.array("I", [0]*MAX_SITES)
+_sum_us = array.array("I", [0]*MAX_SITES)
+_sum_s = array.array("I", [0]*MAX_SITES)
+_min = array.array("I", [MAX_US]*MAX_SITES)
+_max = array.array("I", [0]*MAX_SITES)
+_hist = array.array("I", [0]*(MAX_SITES *N_BINS))
+
+# ----------------------------------------------------------------------------
+def site(name):
+  """ Returns the index of the profiling site `name`; registers the site, if
+      it does not exist yet
+  """
+  if name in _names:
+    return _names.index(name)
+  assert len(_names) < MAX_SITES, "Too many profiling sites"
+  _names.append(name)
+  return len(_names) -1
+
+@micropython.native
+def record(i, dt_us):
+  """ Add a duration `dt_us` (in [us]) to the profiling site with index `i`
+  """
+  if dt_us < 0:
+    dt_us = 0
+  elif dt_us > MAX_US:
+    dt_us = MAX_US
+  _count[i] += 1
+  if dt_us < _min[i]:
+    _min[i] = dt_us
+  if dt_us > _max[i]:
+    _max[i] = dt_us
+  s = _sum_us[i] +dt_us
+  if s >= 1_000_000:
+    _sum_s[i] += s //1_000_000
+    s %= 1_000_000
+  _sum_us[i] = s
+
+  # Log-scale histogram bin (floor(log2(dt_us)) +1)
+  v = dt_us
+  ib = 0
+  if v >= 0x10000:
+    v >>= 16
+    ib += 16
+  if v >= 0x100:
+    v >>= 8
+    ib += 8
+  if v >= 0x10:
+    v >>= 4
+    ib += 4
+  if v >= 0x4:
+    v >>= 2
+    ib += 2
+  if v >= 0x2:
+    v >>= 1
+    ib += 1
+  ib += v
+  if ib >= N_BINS:
+    ib = N_BINS -1
+  _hist[i *N_BINS +ib] += 1
+
+def reset():
+  """ Clear statistics of all sites (the sites remain registered)
+  """
+  for i in range(MAX_SITES):
+    _count[i] = 0
+    _sum_us[i] = 0
+    _sum_s[i] = 0
+    _min[i] = MAX_US
+    _max[i] = 0
+  for i in range(len(_hist)):
+    _hist[i] = 0
+
+# ----------------------------------------------------------------------------
+def profiled(name, n_args=-1):
+  """ Decorator that records the duration of each call of the function under
+      `name`. If the number of positional arguments `n_args` (0..3, incl.
+      `self`) is given, a wrapper is used that does not allocate memory for
+      argument tuples. When profiling is disabled, the function is returned
+      unchanged.
+  """
+  def _decorator(f):
+    if not ENABLED:
+      return f
+    i = site(name)
+    if n_args == 0:
+      def _wrapper():
+        t = ticks_us()
+        res = f()
+        record(i, ticks_diff(ticks_us(), t))
+        return res
+    elif n_args == 1:
+      def _wrapper(a):
+        t = ticks_us()
+        res = f(a)
+        record(i, ticks_diff(ticks_us(), t))
+        return res
+    elif n_args == 2:
+      def _wrapper(a, b):
+        t = ticks_us()
+        res = f(a, b)
+        record(i, ticks_diff(ticks_us(), t))
+        return res
+    elif n_args == 3:
+      def _wrapper(a, b, c):
+        t = ticks_us()
+        res = f(a, b, c)
+        record(i, ticks_diff(ticks_us(), t))
+        return res
+    else:
+      def _wrapper(*args, **kwargs):
+        t = ticks_us()
+        res = f(*args, **kwargs)
+        record(i, ticks_diff(ticks_us(), t))
+        return res
+    return _wrapper
+  return _decorator
+
+# ----------------------------------------------------------------------------
+class ProfileSite(object):
+  """Context manager that records the duration of a code block; create the
+     instance once (e.g. at module level) and reuse it."""
+
+  def __init__(self, name):
+    self._i = site(name) if ENABLED else -1
+    self._t = 0
+
+  def __enter__(self):
+    if ENABLED:
+      self._t = ticks_us()
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    if ENABLED:
+      record(self._i, ticks_diff(ticks_us(), self._t))
+    return False
+
+# ----------------------------------------------------------------------------
+def dump(sort_by_total=True):
+  """ Print a report of all profiling sites, sorted by total time (or by
+      name, if `sort_by_total` is False)
+  """
+  if not ENABLED:
+    print("Profiling disabled (set `PROFILING = True` in `rbl2_config.py`)")
+    return
+  n = len(_names)
+  tot = [_sum_s[i] *1_000 +_sum_us[i] /1_000 for i in range(n)]
+  idx = list(range(n))
+  if sort_by_total:
+    idx.sort(key=lambda i: tot[i], reverse=True)
+  else:
+    idx.sort(key=lambda i: _names[i])
+  print("{0:<20} {1:>7} {2:>10} {3:>9} {4:>8} {5:>8} log2-histogram"
+        .format("site", "n", "total_ms", "mean_us", "min_us", "max_us"))
+  for i in idx:
+    c = _count[i]
+    if c == 0:
+      continue
+    h = " ".join(["{0}".format(v) for v in _hist[i *N_BINS:(i+1) *N_BINS]])
+    print("{0:<20} {1:>7} {2:>10.1f} {3:>9.1f} {4:>8} {5:>8} {6}"
+          .format(_names[i], c, tot[i], tot[i] *1000 /c, _min[i], _max[i], h))
+
+# ----------------------------------------------------------------------------
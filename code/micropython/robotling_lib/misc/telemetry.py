@@ -0,0 +1,210 @@
+# ----------------------------------------------------------------------------
+# telemetry.py
+# Binary telemetry recorder; packs fixed-layout records into a preallocated
+# RAM ring and writes them to flash in complete blocks.
+#
+# File layout (all little endian):
+#   Block 0      : header; magic `RBLTLM`, version (H), file sequence number
+#                  (H), record size (H), block size (H), length of `struct`
+#                  format (H), format, length of field names (H), names
+#                  (comma-separated); zero-padded to the block size
+#   Blocks 1, ...: number of records in this block (H), block counter (H),
+#                  followed by the records
+#
+# Usage (no allocation when recording):
+#   off = tlm.begin()
+#   if off >= 0:
+#     struct.pack_into(FMT, tlm.buffer, off, a, b, c)
+#     tlm.commit()
+#   ...
+#   tlm.flush()    # when there is time, e.g. in idle windows
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+from micropython import const
+try:
+  import struct
+except ImportError:
+  import ustruct as struct
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+TLM_MAGIC      = b"RBLTLM"
+TLM_VERSION    = const(1)
+TLM_BLK_HDR    = const(4)   # Bytes of block header (count, block counter)
+TLM_FILE_EXT   = ".tlm"
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class TelemetryRecorder(object):
+  """Records fixed-layout binary records into a RAM ring of blocks and
+     flushes complete blocks to (rotating) files on flash."""
+
+  def __init__(self, fmt, names, path="tlm", n_blocks=4, block_size=512,
+               max_file_kb=256, max_files=4):
+    """ `fmt` is the `struct` format of a record, `names` a list of field
+        names; files are named `<path>_<index>.tlm`, with the index rotating
+        through `max_files`, and a new file is started when the current one
+        would exceed `max_file_kb` kilobytes.
+    """
+    self._fmt = fmt
+    self._names = names
+    self._path = path
+    self._recSize = struct.calcsize(fmt)
+    self._blkSize = block_size
+    self._recPerBlk = (block_size -TLM_BLK_HDR) //self._recSize
+    assert self._recPerBlk > 0, "Record larger than block"
+    self._nBlks = max(n_blocks, 2)
+    self._buf = bytearray(self._nBlks *block_size)
+    self._mv = memoryview(self._buf)
+    self._maxFileSize = max_file_kb *1024
+    self._maxFiles = max(max_files, 1)
+    self._iBlkWr = 0
+    self._iRec = 0
+    self._iBlkRd = 0
+    self._nRecs = 0
+    self._nDropped = 0
+    self._nBlksWritten = 0
+    self._blkCount = 0
+    self._file = None
+    self._fileSize = 0
+    self._iFile, self._seq = self._find_next_file()
+
+  def close(self):
+    """ Write all pending records (incl. the current incomplete block) and
+        close the file
+    """
+    self.flush(-1)
+    if self._iRec > 0:
+      self._write_block(self._iBlkWr, self._iRec)
+      self._iRec = 0
+    if self._file:
+      self._file.close()
+      self._file = None
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @property
+  def buffer(self):
+    return self._buf
+
+  @property
+  def record_size(self):
+    return self._recSize
+
+  @property
+  def format(self):
+    return self._fmt
+
+  @property
+  def counters(self):
+    """ Returns number of recorded and dropped records, and of blocks
+        written to flash
+    """
+    return self._nRecs, self._nDropped, self._nBlksWritten
+
+  @property
+  def pending_blocks(self):
+    """ Returns the number of complete blocks waiting to be flushed
+    """
+    return (self._iBlkWr -self._iBlkRd) %self._nBlks
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @micropython.native
+  def begin(self):
+    """ Returns the offset in `buffer` for the next record or -1, if the
+        ring is full (the record is then counted as dropped)
+    """
+    iB = self._iBlkWr
+    if self._iRec >= self._recPerBlk:
+      # Current block is complete; move on to the next, if it is free
+      iN = iB +1 if iB < self._nBlks -1 else 0
+      if iN == self._iBlkRd:
+        self._nDropped += 1
+        return -1
+      self._iBlkWr = iN
+      self._iRec = 0
+      iB = iN
+    return iB *self._blkSize +TLM_BLK_HDR +self._iRec *self._recSize
+
+  @micropython.native
+  def commit(self):
+    """ Marks the record obtained by `begin()` as complete
+    """
+    self._iRec += 1
+    self._nRecs += 1
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def flush(self, max_blocks=1):
+    """ Write up to `max_blocks` complete blocks (all, if < 0) to flash;
+        returns the number of blocks written
+    """
+    n = 0
+    while max_blocks < 0 or n < max_blocks:
+      iB = self._iBlkRd
+      if iB == self._iBlkWr:
+        break
+      self._write_block(iB, self._recPerBlk)
+      self._iBlkRd = iB +1 if iB < self._nBlks -1 else 0
+      n += 1
+    return n
+
+  def _write_block(self, iB, nRecs):
+    if self._file is None or self._fileSize +self._blkSize > self._maxFileSize:
+      self._open_next_file()
+    i0 = iB *self._blkSize
+    struct.pack_into("<HH", self._buf, i0, nRecs, self._blkCount & 0xFFFF)
+    self._file.write(self._mv[i0:i0 +self._blkSize])
+    self._file.flush()
+    self._fileSize += self._blkSize
+    self._blkCount += 1
+    self._nBlksWritten += 1
+
+  def _open_next_file(self):
+    if self._file:
+      self._file.close()
+      self._iFile = (self._iFile +1) %self._maxFiles
+    fName = "{0}_{1}{2}".format(self._path, self._iFile, TLM_FILE_EXT)
+    self._file = open(fName, "wb")
+    fmt = self._fmt.encode()
+    nms = ",".join(self._names).encode()
+    hdr = bytearray(self._blkSize)
+    hdr[0:len(TLM_MAGIC)] = TLM_MAGIC
+    i = len(TLM_MAGIC)
+    struct.pack_into("<HHHHH", hdr, i, TLM_VERSION, self._seq,
+                     self._recSize, self._blkSize, len(fmt))
+    i += 10
+    hdr[i:i +len(fmt)] = fmt
+    i += len(fmt)
+    struct.pack_into("<H", hdr, i, len(nms))
+    i += 2
+    assert i +len(nms) <= self._blkSize, "Header larger than block"
+    hdr[i:i +len(nms)] = nms
+    self._file.write(hdr)
+    self._fileSize = self._blkSize
+    self._seq += 1
+
+  def _find_next_file(self):
+    # Continue after the newest existing file of a previous session (highest
+    # sequence number), if any; returns file index and sequence number
+    iBest = -1
+    sBest = -1
+    for i in range(self._maxFiles):
+      fName = "{0}_{1}{2}".format(self._path, i, TLM_FILE_EXT)
+      try:
+        with open(fName, "rb") as f:
+          hdr = f.read(len(TLM_MAGIC) +4)
+      except OSError:
+        continue
+      if hdr[:len(TLM_MAGIC)] == TLM_MAGIC:
+        seq = struct.unpack_from("<H", hdr, len(TLM_MAGIC) +2)[0]
+        if seq > sBest:
+          sBest = seq
+          iBest = i
+    if iBest < 0:
+      return 0, 0
+    return (iBest +1) %self._maxFiles, (sBest +1) & 0xFFFF
+
+# ----------------------------------------------------------------------------
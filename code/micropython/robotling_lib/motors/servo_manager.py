@@ -14,6 +14,8 @@
 # 2022-05-08, v1.7, TRJ_LINEAR=Normal, TRJ_SINE=slow start and end move
 # 2022-06-11, v1.8, Allow setting last position after power-off
 # 2022-06-26, v1.8, Added option not to use `ulab`
+# 2022-10-18, v1.9, Optional recording of timer callback lateness,
+#                   last written servo timing available
 # ----------------------------------------------------------------------------
 import gc
 import time
@@ -30,7 +32,7 @@ except ImportError:
   ULAB = False
 
 # pylint: disable=bad-whitespace
-__version__        = "0.1.8.0"
+__version__        = "0.1.9.0"
 RATE_MS            = const(10)  # 5=hangs, 15...20=ok, 25=not continues
 HARDWARE_TIMER     = const(0)
 # pylint: enable=bad-whitespace
@@ -57,6 +59,7 @@ class ServoManager(object):
     self._servo_type = bytearray([TYPE_NONE]*n)           # Servo type
     self._servo_number = bytearray([255]*n)               # Servo number
     self._servoPos = array.array("f", [0]*n)              # Servo pos [us]
+    self._outPos = array.array("H", [0]*n)                # Last written [us]
     self._SIDList = bytearray([255]*n)                    # Servos to move next
     self._targetPosList = array.array("H", [0]*n)         # Target pos [us]
     self._currPosList = array.array("f", [-1]*n)          # Current pos [us]
@@ -70,6 +73,9 @@ class ServoManager(object):
     self._mm18 = None
     self._isMoving = False
     self._isFirstMove = True
+    self._stats = None                                    # `CycleStats` ...
+    self._statsCh = 0                                     # .. and channel
+    self._tCb_us = 0                                      # Last callback [us]
     self._Timer = Timer() if pf.isRP2 else Timer(HARDWARE_TIMER)
 
   def add_servo(self, i, servoObj, pos=0):
@@ -118,6 +124,15 @@ class ServoManager(object):
         if deinit:
           servo.deinit()
 
+  def set_stats(self, stats, ch):
+    """ Record the lateness of the timer callback (in [us], relative to
+        `RATE_MS`) in channel `ch` of a `CycleStats` instance; `None` stops
+        recording
+    """
+    self._statsCh = ch
+    self._tCb_us = 0
+    self._stats = stats
+
   def deinit(self):
     """ Clean up
     """
@@ -195,6 +210,7 @@ class ServoManager(object):
       # Just move them w/o considering timing
       for iSr in range(n):
         ser[sdl[iSr]].write_us(tpl[iSr])
+        self._outPos[sdl[iSr]] = tpl[iSr]
     else:
       # Setup timer to keep moving them in the requested time
       if self._isFirstMove:
@@ -206,6 +222,12 @@ class ServoManager(object):
   #@timed_function
   #@micropython.native
   def _cb(self, value):
+    if self._stats:
+      t_us = time.ticks_us()
+      if self._tCb_us:
+        dt_us = time.ticks_diff(t_us, self._tCb_us) -RATE_MS *1000
+        self._stats.add(self._statsCh, dt_us)
+      self._tCb_us = t_us
     if self._isMoving:
       # Update every servo in the list
       nSt = self._nSteps
@@ -219,6 +241,7 @@ class ServoManager(object):
       iSt = self._iStep
       nST = self._nStTotal
       tnl = self._trajNormList
+      out = self._outPos
       while iSr >= 0:
         if not spo[sdl[iSr]] == tpl[iSr]:
           if nSt > 0:
@@ -226,13 +249,16 @@ class ServoManager(object):
             if self._traject == TRJ_SINE:
               cpl[iSr] += ssl[iSr] *np.sin((iSt+1)/nST *np.pi) /tnl[iSr]
               ser[sdl[iSr]].write_us(cpl[iSr])
+              out[sdl[iSr]] = int(cpl[iSr])
             else:
               ser[sdl[iSr]].write_us(cpl[iSr])
+              out[sdl[iSr]] = int(cpl[iSr])
               cpl[iSr] += ssl[iSr]
           else:
             # Move has ended, therefore set servo to the target position
             spo[sdl[iSr]] = tpl[iSr]
             ser[sdl[iSr]].write_us(spo[sdl[iSr]])
+            out[sdl[iSr]] = tpl[iSr]
         iSr -= 1
       if nSt > 0:
         self._nSteps = nSt -1
@@ -248,6 +274,12 @@ class ServoManager(object):
     """
     return self._isMoving
 
+  @property
+  def positions_us(self):
+    """ Returns the timing (in [us]) last written to each servo
+    """
+    return self._outPos
+
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def calibrate(self, servos=[]):
     """ Interactive calibration of all given servos
@@ -10,13 +10,15 @@
 # 2019-12-21, v1.1 - hardware I2C bus possible
 # 2020-08-09, v1.2 - `UART` is inherited from `machine`
 # 2020-10-09, v1.3 - `I2CBus` use with `with`-statement
+# 2022-10-18, v1.4 - `readfrom_mem_into`, `writeto_mem`; `write_then_readinto`
+#                    uses memoryviews instead of copies
 # ----------------------------------------------------------------------------
 from os import uname
 from machine import SPI, Pin, I2C, SoftSPI
 from micropython import const
 from machine import UART
 
-__version__ = "0.1.2.0"
+__version__ = "0.1.3.0"
 
 # ----------------------------------------------------------------------------
 class SPIBus(object):
@@ -112,12 +114,21 @@ class I2CBus(object):
   def readfrom_into(self, addr, buf):
     self._i2c.readfrom_into(addr, buf)
 
+  def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+    self._i2c.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+
+  def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+    self._i2c.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+
   def write_then_readinto(self, addr, bufo, bufi, out_start=0, out_end=None,
                           in_start=0, in_end=None, stop_=True):
-    self._i2c.writeto(addr, bufo[out_start:out_end], stop_)
-    buf = bytearray(bufi[in_start:in_end])
-    self._i2c.readfrom_into(addr, buf)
-    bufi[in_start:in_end] = buf
+    # Partial buffers are passed as memoryviews, i.e. without copying
+    if out_start or out_end is not None:
+      bufo = memoryview(bufo)[out_start:out_end]
+    self._i2c.writeto(addr, bufo, stop_)
+    if in_start or in_end is not None:
+      bufi = memoryview(bufi)[in_start:in_end]
+    self._i2c.readfrom_into(addr, bufi)
 
   def __enter__(self):
     return self
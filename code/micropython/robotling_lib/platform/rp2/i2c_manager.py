@@ -0,0 +1,297 @@
+# ----------------------------------------------------------------------------
+# i2c_manager.py
+# Shared I2C bus with serialised transactions and per-device statistics
+# (for standard micropython, rp2)
+#
+# `I2CBusManager` wraps a `busio.I2CBus` (or a `machine.I2C`) and offers the
+# same transaction methods; drivers use it in place of the bus. Each
+# transaction runs under a (re-entrant) lock, hence devices on the same bus
+# can be used from both cores. Transactions that belong together, like a
+# register read done as `writeto(..., False)` + `readfrom_into()`, need to be
+# done with `write_then_readinto()` or inside a `with bus:` block, which
+# keeps the lock for the whole sequence. Transient `OSError`s are retried.
+#
+# Reads that are due in the same cycle can be queued into preallocated slots
+# (`add_read()`, `request()`) and are then done back-to-back with a single
+# lock acquisition (`flush()`).
+#
+# For each device address, the number of transactions, bytes, errors and
+# the time spent on the bus are counted.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# 2022-10-18, v1.1, a write without stop no longer keeps the lock (it was
+#                   not released, if no read followed); `write_then_readinto`
+# ----------------------------------------------------------------------------
+import array
+from time import ticks_us, ticks_diff, sleep_us
+from micropython import const
+from _thread import allocate_lock, get_ident
+
+# pylint: disable=bad-whitespace
+__version__    = "0.1.1.0"
+RETRIES        = const(2)      # Retries after a failed transaction
+RETRY_US       = const(200)    # Pause before a retry
+MAX_SLOTS      = const(8)      # Maximal number of queued-read slots
+STAT_TRANS     = const(0)      # Indices into the per-device statistics
+STAT_BYTES     = const(1)
+STAT_ERRORS    = const(2)
+STAT_TIME_US   = const(3)
+STAT_STRS      = ("transactions", "bytes", "errors", "time [us]")
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class I2CBusManager(object):
+  """Serialises and counts the transactions on a shared I2C bus."""
+
+  def __init__(self, i2c, retries=RETRIES, retry_us=RETRY_US,
+               max_slots=MAX_SLOTS):
+    """ `i2c` is a `busio.I2CBus` or a `machine.I2C` instance
+    """
+    self._i2cBus = i2c
+    self._bus = i2c.bus if hasattr(i2c, "bus") else i2c
+    self._retries = retries
+    self._retryUs = retry_us
+    self._lock = allocate_lock()
+    self._owner = None
+    self._depth = 0
+    self._stats = {}
+
+    # Queued-read slots
+    self._nSlots = 0
+    self._qAddr = bytearray(max_slots)
+    self._qReg = array.array("H", [0]*max_slots)
+    self._qASz = bytearray(max_slots)
+    self._qBuf = [None]*max_slots
+    self._qDue = bytearray(max_slots)
+    self._qSeq = array.array("I", [0]*max_slots)
+
+  @property
+  def bus(self):
+    """ Returns this manager, so that drivers that access `i2c.bus` (e.g.
+        `RegisterDevice`) also go through it
+    """
+    return self
+
+  @property
+  def deviceAddrList(self):
+    return getattr(self._i2cBus, "deviceAddrList", [])
+
+  def scan(self):
+    self._acquire()
+    try:
+      return self._bus.scan()
+    finally:
+      self._release()
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def __enter__(self):
+    """ Keeps the bus for a sequence of transactions
+    """
+    self._acquire()
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self._release()
+    return False
+
+  def _acquire(self):
+    me = get_ident()
+    if self._owner == me:
+      self._depth += 1
+      return
+    self._lock.acquire()
+    self._owner = me
+    self._depth = 1
+
+  def _release(self):
+    self._depth -= 1
+    if self._depth == 0:
+      self._owner = None
+      self._lock.release()
+
+  def _begin(self):
+    self._acquire()
+    return ticks_us()
+
+  def _stat(self, addr):
+    st = self._stats.get(addr)
+    if st is None:
+      st = array.array("I", [0]*len(STAT_STRS))
+      self._stats[addr] = st
+    return st
+
+  def _end(self, addr, nbytes, t0_us):
+    st = self._stat(addr)
+    st[STAT_TRANS] += 1
+    st[STAT_BYTES] += nbytes
+    st[STAT_TIME_US] += ticks_diff(ticks_us(), t0_us)
+    self._release()
+
+  def _retry(self, addr, n):
+    # Counts a failed attempt; returns False if no retries are left
+    self._stat(addr)[STAT_ERRORS] += 1
+    if n <= 0:
+      return False
+    sleep_us(self._retryUs)
+    return True
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+    t0 = self._begin()
+    n = self._retries
+    while True:
+      try:
+        self._bus.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+        break
+      except OSError:
+        if not self._retry(addr, n):
+          self._end(addr, 0, t0)
+          raise
+        n -= 1
+    self._end(addr, len(buf), t0)
+
+  def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+    buf = bytearray(nbytes)
+    self.readfrom_mem_into(addr, memaddr, buf, addrsize)
+    return buf
+
+  def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+    t0 = self._begin()
+    n = self._retries
+    while True:
+      try:
+        self._bus.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+        break
+      except OSError:
+        if not self._retry(addr, n):
+          self._end(addr, 0, t0)
+          raise
+        n -= 1
+    self._end(addr, len(buf), t0)
+
+  def readfrom_into(self, addr, buf, stop_=True):
+    t0 = self._begin()
+    n = self._retries
+    while True:
+      try:
+        self._bus.readfrom_into(addr, buf, stop_)
+        break
+      except OSError:
+        if not self._retry(addr, n):
+          self._end(addr, 0, t0)
+          raise
+        n -= 1
+    self._end(addr, len(buf), t0)
+
+  def readfrom(self, addr, nbytes, stop_=True):
+    buf = bytearray(nbytes)
+    self.readfrom_into(addr, buf, stop_)
+    return buf
+
+  def writeto(self, addr, buf, stop_=True):
+    """ A write without stop is not retried, because the following read
+        would fail anyway; to keep the bus until that read, use
+        `write_then_readinto()` or a `with bus:` block
+    """
+    t0 = self._begin()
+    try:
+      self._bus.writeto(addr, buf, stop_)
+    except OSError:
+      self._retry(addr, 0)
+      self._end(addr, 0, t0)
+      raise
+    self._end(addr, len(buf), t0)
+
+  def write_then_readinto(self, addr, bufo, bufi, out_start=0, out_end=None,
+                          in_start=0, in_end=None, stop_=True):
+    """ Writes `bufo` and then reads into `bufi`, both under one lock (as
+        `busio.I2CBus.write_then_readinto`); the pair is retried
+    """
+    if out_start or out_end is not None:
+      bufo = memoryview(bufo)[out_start:out_end]
+    if in_start or in_end is not None:
+      bufi = memoryview(bufi)[in_start:in_end]
+    t0 = self._begin()
+    n = self._retries
+    while True:
+      try:
+        self._bus.writeto(addr, bufo, stop_)
+        self._bus.readfrom_into(addr, bufi)
+        break
+      except OSError:
+        if not self._retry(addr, n):
+          self._end(addr, 0, t0)
+          raise
+        n -= 1
+    self._end(addr, len(bufo) +len(bufi), t0)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def add_read(self, addr, memaddr, buf, addrsize=8):
+    """ Reserves a slot for a register read into `buf` that is repeated
+        later via `request()` and `flush()`; returns the slot index
+    """
+    i = self._nSlots
+    if i >= len(self._qBuf):
+      raise ValueError("No free slot")
+    self._qAddr[i] = addr
+    self._qReg[i] = memaddr
+    self._qASz[i] = addrsize
+    self._qBuf[i] = buf
+    self._nSlots += 1
+    return i
+
+  def request(self, slot):
+    """ Marks the read in `slot` as due (does not touch the bus)
+    """
+    self._qDue[slot] = 1
+
+  @micropython.native
+  def flush(self):
+    """ Does all due reads back-to-back, holding the bus only once; returns
+        the number of reads; reads that fail are skipped (and counted)
+    """
+    due = self._qDue
+    n = 0
+    self._acquire()
+    try:
+      for i in range(self._nSlots):
+        if due[i]:
+          due[i] = 0
+          try:
+            self.readfrom_mem_into(self._qAddr[i], self._qReg[i],
+                                   self._qBuf[i], self._qASz[i])
+            self._qSeq[i] += 1
+            n += 1
+          except OSError:
+            pass
+    finally:
+      self._release()
+    return n
+
+  def sequence(self, slot):
+    """ Number of completed reads of `slot`; changes when there is new data
+    """
+    return self._qSeq[slot]
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def device_stats(self, addr):
+    """ Returns the statistics (`STAT_xxx`) of device `addr` as an array
+    """
+    return self._stats.get(addr)
+
+  def reset_stats(self):
+    for st in self._stats.values():
+      for i in range(len(st)):
+        st[i] = 0
+
+  def print_stats(self):
+    print("I2C bus: {0:>6} {1:>12} {2:>8} {3:>7} {4:>12}"
+          .format("addr", *STAT_STRS))
+    for addr in sorted(self._stats):
+      st = self._stats[addr]
+      print("         {0:>6} {1:>12} {2:>8} {3:>7} {4:>12}"
+            .format("0x{0:02x}".format(addr), *st))
+
+# ----------------------------------------------------------------------------
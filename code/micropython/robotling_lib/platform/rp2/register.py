@@ -0,0 +1,169 @@
+# ----------------------------------------------------------------------------
+# register.py
+# Register access for I2C devices
+# (for standard micropython, rp2)
+#
+# `RegisterDevice` reads and writes device registers with `readfrom_mem_into`
+# and `writeto_mem` (one bus transaction each, register address handled by
+# the bus driver) into per-device preallocated buffers. The descriptors
+# `Reg8`, `Reg16`, `RegBits` and `RegStruct` expose registers as attributes
+# of a driver class whose instances keep their `RegisterDevice` in `_regs`;
+# apart from the tuples returned by `RegStruct`, register I/O does not
+# allocate.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+try:
+  import struct
+except ImportError:
+  import ustruct as struct
+
+__version__ = "0.1.0.0"
+
+# ----------------------------------------------------------------------------
+class RegisterDevice(object):
+  """Register access to a single I2C device."""
+
+  def __init__(self, i2c, addr, addrsize=8):
+    """ `i2c` is a `busio.I2CBus` or a `machine.I2C` instance, `addrsize`
+        the width of the register addresses in bits (8 or 16)
+    """
+    self._bus = i2c.bus if hasattr(i2c, "bus") else i2c
+    self._addr = addr
+    self._asz = addrsize
+    self._b1 = bytearray(1)
+    self._b2 = bytearray(2)
+
+  @property
+  def address(self):
+    return self._addr
+
+  @micropython.native
+  def read_into(self, reg, buf):
+    """ Reads `len(buf)` bytes starting at register `reg` into `buf` (which
+        can be a `memoryview` of a larger buffer)
+    """
+    self._bus.readfrom_mem_into(self._addr, reg, buf, addrsize=self._asz)
+
+  @micropython.native
+  def write_from(self, reg, buf):
+    self._bus.writeto_mem(self._addr, reg, buf, addrsize=self._asz)
+
+  @micropython.native
+  def read_u8(self, reg):
+    b = self._b1
+    self._bus.readfrom_mem_into(self._addr, reg, b, addrsize=self._asz)
+    return b[0]
+
+  @micropython.native
+  def write_u8(self, reg, val):
+    b = self._b1
+    b[0] = val & 0xff
+    self._bus.writeto_mem(self._addr, reg, b, addrsize=self._asz)
+
+  @micropython.native
+  def read_u16(self, reg, big=False):
+    b = self._b2
+    self._bus.readfrom_mem_into(self._addr, reg, b, addrsize=self._asz)
+    return (b[0] << 8 | b[1]) if big else (b[1] << 8 | b[0])
+
+  def read_s16(self, reg, big=False):
+    v = self.read_u16(reg, big)
+    return v -0x10000 if v & 0x8000 else v
+
+  @micropython.native
+  def write_u16(self, reg, val, big=False):
+    b = self._b2
+    if big:
+      b[0] = (val >> 8) & 0xff
+      b[1] = val & 0xff
+    else:
+      b[0] = val & 0xff
+      b[1] = (val >> 8) & 0xff
+    self._bus.writeto_mem(self._addr, reg, b, addrsize=self._asz)
+
+# ----------------------------------------------------------------------------
+class Reg8(object):
+  """8-bit register."""
+  # pylint: disable=too-few-public-methods
+
+  def __init__(self, reg, signed=False, read_only=False):
+    self._reg = reg
+    self._signed = signed
+    self._ro = read_only
+
+  def __get__(self, obj, objtype=None):
+    v = obj._regs.read_u8(self._reg)
+    return v -0x100 if self._signed and v & 0x80 else v
+
+  def __set__(self, obj, value):
+    if self._ro:
+      raise AttributeError("Read-only register")
+    obj._regs.write_u8(self._reg, value)
+
+class Reg16(object):
+  """16-bit register (little endian, unless `big` is True)."""
+  # pylint: disable=too-few-public-methods
+
+  def __init__(self, reg, big=False, signed=False, read_only=False):
+    self._reg = reg
+    self._big = big
+    self._signed = signed
+    self._ro = read_only
+
+  def __get__(self, obj, objtype=None):
+    v = obj._regs.read_u16(self._reg, self._big)
+    return v -0x10000 if self._signed and v & 0x8000 else v
+
+  def __set__(self, obj, value):
+    if self._ro:
+      raise AttributeError("Read-only register")
+    obj._regs.write_u16(self._reg, value, self._big)
+
+class RegBits(object):
+  """Bitfield of `nbits` bits, starting at bit `lsb`, in an 8-bit register;
+     writing is read-modify-write."""
+  # pylint: disable=too-few-public-methods
+
+  def __init__(self, reg, lsb, nbits=1, read_only=False):
+    self._reg = reg
+    self._lsb = lsb
+    self._mask = ((1 << nbits) -1) << lsb
+    self._ro = read_only
+
+  def __get__(self, obj, objtype=None):
+    return (obj._regs.read_u8(self._reg) & self._mask) >> self._lsb
+
+  def __set__(self, obj, value):
+    if self._ro:
+      raise AttributeError("Read-only register")
+    regs = obj._regs
+    v = regs.read_u8(self._reg) & ~self._mask
+    regs.write_u8(self._reg, v | ((value << self._lsb) & self._mask))
+
+class RegStruct(object):
+  """Block of registers, packed/unpacked with the `struct` format `fmt`;
+     a single value is returned as such, several as a tuple."""
+  # pylint: disable=too-few-public-methods
+
+  def __init__(self, reg, fmt, read_only=False):
+    self._reg = reg
+    self._fmt = fmt
+    self._buf = bytearray(struct.calcsize(fmt))
+    self._ro = read_only
+
+  def __get__(self, obj, objtype=None):
+    obj._regs.read_into(self._reg, self._buf)
+    res = struct.unpack_from(self._fmt, self._buf)
+    return res[0] if len(res) == 1 else res
+
+  def __set__(self, obj, value):
+    if self._ro:
+      raise AttributeError("Read-only register")
+    val = value if isinstance(value, tuple) else (value,)
+    struct.pack_into(self._fmt, self._buf, 0, *val)
+    obj._regs.write_from(self._reg, self._buf)
+
+# ----------------------------------------------------------------------------
@@ -6,6 +6,9 @@
 # Copyright (c) 2018 Thomas Euler
 # 2018-09-13, v1
 # 2019-01-03, v1.1, turned into a sensor class
+# 2022-10-18, v1.2, continuous ranging w/ non-blocking `poll()`,
+#                   preallocated I2C buffers
+# 2022-10-18, v1.3, register access via `RegisterDevice`
 #
 # Based on the CircuitPython driver:
 # https://github.com/adafruit/Adafruit_CircuitPython_VL6180X
@@ -31,11 +34,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 # ----------------------------------------------------------------------------
+from time import ticks_ms, ticks_diff
 from micropython import const
 from robotling_lib.misc.helpers import timed_function
 from robotling_lib.sensors.sensor_base import SensorBase
+from robotling_lib.platform.rp2.register import RegisterDevice, Reg8, RegBits
 
-__version__ = "0.1.1.0"
+__version__ = "0.1.3.0"
 CHIP_NAME   = "VL6180X"
 
 # ----------------------------------------------------------------------------
@@ -47,6 +52,7 @@ _VL6180X_REG_SYSTEM_INTERRUPT_CONFIG       = const(0x014)
 _VL6180X_REG_SYSTEM_INTERRUPT_CLEAR        = const(0x015)
 _VL6180X_REG_SYSTEM_FRESH_OUT_OF_RESET     = const(0x016)
 _VL6180X_REG_SYSRANGE_START                = const(0x018)
+_VL6180X_REG_SYSRANGE_INTERMEAS_PERIOD     = const(0x01B)
 _VL6180X_REG_SYSALS_START                  = const(0x038)
 _VL6180X_REG_SYSALS_ANALOGUE_GAIN          = const(0x03F)
 _VL6180X_REG_SYSALS_INTEGRATION_PERIOD_HI  = const(0x040)
@@ -77,12 +83,20 @@ ERROR_RAWUFLOW     = const(12)
 ERROR_RAWOFLOW     = const(13)
 ERROR_RANGEUFLOW   = const(14)
 ERROR_RANGEOFLOW   = const(15)
+
+RANGE_NONE         = const(-1)     # No new measurement (`poll()`)
+MIN_PERIOD_MS      = const(20)     # Inter-measurement period limits in
+MAX_PERIOD_MS      = const(2550)   # continuous mode (10 ms steps)
 #pylint: enable=bad-whitespace
 
 # ----------------------------------------------------------------------------
 class AdafruitVL6180XRangingSensor(SensorBase):
   """Base class for VL6180X time-of-flight ranging sensor."""
 
+  _model_id = Reg8(_VL6180X_REG_IDENTIFICATION_MODEL_ID, read_only=True)
+  _range_error = RegBits(_VL6180X_REG_RESULT_RANGE_STATUS, 4, 4,
+                         read_only=True)
+
   def __init__(self, i2c, addr=_VL6180X_DEFAULT_I2C_ADDR):
     """ Requires an already initialised I2C bus instance.
     """
@@ -91,11 +105,18 @@ class AdafruitVL6180XRangingSensor(SensorBase):
     self._i2c = i2c
     self._i2cAddr = addr
     self._isReady = False
+    self._isCont = False
+    self._lastMM = 0
+    self._tLast = 0
+    self._nNew = 0
+
+    # Note that this device uses 16-bit register addresses
+    self._regs = RegisterDevice(i2c, addr, addrsize=16)
 
     addrList = self._i2c.deviceAddrList
     if addr in addrList:
       try:
-        if self._read_8(_VL6180X_REG_IDENTIFICATION_MODEL_ID) == 0xB4:
+        if self._model_id == 0xB4:
           self._load_settings()
           self._write_8(_VL6180X_REG_SYSTEM_FRESH_OUT_OF_RESET, 0x00)
           self._isReady = True
@@ -107,13 +128,78 @@ class AdafruitVL6180XRangingSensor(SensorBase):
                   "ok" if self._isReady else "FAILED"))
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def start_continuous(self, period_ms=100):
+    """ Start continuous ranging with a new measurement every `period_ms`
+        (20..2550 ms, 10 ms steps); then, `poll()` and `range_cm` do not
+        block anymore
+    """
+    if not self._isReady:
+      return
+    if self._isCont:
+      self.stop_continuous()
+    p = min(max(period_ms, MIN_PERIOD_MS), MAX_PERIOD_MS)
+    self._write_8(_VL6180X_REG_SYSRANGE_INTERMEAS_PERIOD, p //10 -1)
+    self._write_8(_VL6180X_REG_SYSTEM_INTERRUPT_CLEAR, 0x07)
+    self._write_8(_VL6180X_REG_SYSRANGE_START, 0x03)
+    self._isCont = True
+
+  def stop_continuous(self):
+    """ Stop continuous ranging (writing the start bit again toggles it)
+    """
+    if self._isCont:
+      self._write_8(_VL6180X_REG_SYSRANGE_START, 0x01)
+      self._isCont = False
+
+  @property
+  def is_continuous(self):
+    return self._isCont
+
+  def poll(self):
+    """ Non-blocking: returns the new range in [mm], if the interrupt status
+        shows that a measurement is ready, or RANGE_NONE, otherwise
+    """
+    if not self._isReady:
+      return RANGE_NONE
+    if not self._read_8(_VL6180X_REG_RESULT_INTERRUPT_STATUS_GPIO) & 0x04:
+      return RANGE_NONE
+    r = self._read_8(_VL6180X_REG_RESULT_RANGE_VAL)
+    self._write_8(_VL6180X_REG_SYSTEM_INTERRUPT_CLEAR, 0x07)
+    self._lastMM = r
+    self._tLast = ticks_ms()
+    self._nNew += 1
+    return r
+
+  @property
+  def range_mm(self):
+    """ Latest range in [mm] (from `poll()` or `range_cm`)
+    """
+    return self._lastMM
+
+  @property
+  def age_ms(self):
+    """ Time since the latest range measurement in [ms]
+    """
+    return ticks_diff(ticks_ms(), self._tLast)
+
+  @property
+  def count(self):
+    """ Number of measurements read so far
+    """
+    return self._nNew
+
   #@timed_function
   @property
   def range_cm(self):
-    """ Read the distance to an object in front and return it in cm.
+    """ Read the distance to an object in front and return it in cm. In
+        continuous mode, this returns the latest range w/o waiting;
+        otherwise, it starts a single-shot measurement and blocks until it
+        is finished.
     """
     if not self._isReady:
       return 0
+    if self._isCont:
+      self.poll()
+      return self._lastMM /10.
 
     # Wait for device to be ready for range measurement
     while not self._read_8(_VL6180X_REG_RESULT_RANGE_STATUS) & 0x01:
@@ -127,6 +213,9 @@ class AdafruitVL6180XRangingSensor(SensorBase):
     # Read range in mm and clear interrupt
     range_ = self._read_8(_VL6180X_REG_RESULT_RANGE_VAL)
     self._write_8(_VL6180X_REG_SYSTEM_INTERRUPT_CLEAR, 0x07)
+    self._lastMM = range_
+    self._tLast = ticks_ms()
+    self._nNew += 1
     return range_ /10.
 
   '''
@@ -190,7 +279,7 @@ class AdafruitVL6180XRangingSensor(SensorBase):
         - ERROR_RANGEUFLOW - Range underflow
         - ERROR_RANGEOFLOW - Range overflow
     """
-    return self._read_8(_VL6180X_REG_RESULT_RANGE_STATUS) >> 4
+    return self._range_error
 
   def getLux(self, gain):
     """ Read the lux (light value) from the sensor and return it.  Must
@@ -316,27 +405,13 @@ class AdafruitVL6180XRangingSensor(SensorBase):
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def _read_8(self, reg):
-    # Note that this device uses 16-bit registers.
-    adr = self._i2cAddr
-    dta = bytes([(reg >> 8) & 0xff, reg & 0xFF])
-    self._i2c.writeto(adr, dta, False)
-    buf = bytearray(1)
-    self._i2c.readfrom_into(adr, buf)
-    return buf[0]
+    return self._regs.read_u8(reg)
 
-  def _write_8(self, reg, buf):
-    # Note that this device uses 16-bit registers.
-    adr = self._i2cAddr
-    self._i2c.writeto(adr, bytes([(reg >> 8) & 0xff, reg & 0xff, buf]))
+  def _write_8(self, reg, val):
+    self._regs.write_u8(reg, val)
 
   def _read_16(self, reg):
-    # Read and return a 16-bit unsigned big endian value read from the
-    # specified 16-bit register address.
-    adr = self._i2cAddr
-    dta = bytes([(reg >> 8) & 0xff, reg & 0xFF])
-    self._i2c.writeto(adr, dta, False)
-    buf = bytearray(2)
-    self._i2c.readfrom_into(adr, buf)
-    return (buf[0] << 8) | buf[1]
+    # 16-bit unsigned big endian value
+    return self._regs.read_u16(reg, True)
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,138 @@
+# ----------------------------------------------------------------------------
+# battery_monitor.py
+# Background monitor for the supply voltage (e.g. VSYS/3 on ADC3 of the
+# Raspberry Pi Pico) and, optionally, the VBUS sense pin
+#
+# A (soft) timer samples the ADC at a low, fixed rate; each tick sums
+# `n_over` conversions (oversampling), the sum is decimated to 16 bits and
+# smoothed with an integer EMA. The filtered value is converted into [mV]
+# with a calibration factor and cached, hence reading the voltage costs no
+# ADC time. Crossing the low-battery threshold (with hysteresis) sets a flag
+# and calls an optional callback; while VBUS is present, the battery is
+# never reported as low.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+from micropython import const
+from machine import Pin, ADC, Timer
+import robotling_lib.misc.ansi_color as ansi
+
+# pylint: disable=bad-whitespace
+__version__    = "0.1.0.0"
+CHIP_NAME      = "ADC"
+RATE_HZ        = const(10)     # Timer ticks per second
+N_OVER         = const(16)     # Conversions per tick (power of 2)
+EMA_SHIFT      = const(3)      # EMA weight of a new tick is 1/2^EMA_SHIFT
+FULL_SCALE_MV  = const(9900)   # Voltage at `read_u16()` = 65535 (3x 3.3V)
+LOW_MV         = const(3800)   # Low-battery threshold
+HYST_MV        = const(100)    # ... and hysteresis for leaving "low"
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class BatteryMonitor(object):
+  """Oversampled, timer-driven battery and VBUS monitor."""
+
+  def __init__(self, adc_pin, vbus_pin=None, rate_hz=RATE_HZ, n_over=N_OVER,
+               full_scale_mV=FULL_SCALE_MV, cal=1.0, low_mV=LOW_MV,
+               hyst_mV=HYST_MV, callback=None, timer_id=-1):
+    """ `cal` is a calibration factor (measured/reported voltage);
+        `callback(monitor, is_low)` is called from the timer when the
+        low-battery state changes
+    """
+    self._adc = ADC(Pin(adc_pin))
+    self._pinVBUS = Pin(vbus_pin, Pin.IN) if vbus_pin is not None else None
+    self._nOver = max(n_over, 1)
+    self._shift = 0
+    while (1 << (self._shift +1)) <= self._nOver:
+      self._shift += 1
+    self._nOver = 1 << self._shift
+    self._scale = int(full_scale_mV *cal)
+    self._lowMV = low_mV
+    self._okMV = low_mV +hyst_mV
+    self._cb = callback
+    self._vbus = False
+    self._isLow = False
+    self._nLow = 0
+    self._nTicks = 0
+
+    # Prime the filter with a full sample, then keep sampling in the
+    # background; bind the handler only once
+    self._filt = self._sample() << EMA_SHIFT
+    self._mV = self._to_mV(self._filt >> EMA_SHIFT)
+    self._sample_vbus()
+    self._isr = self._on_tick
+    self._timer = Timer(timer_id)
+    self._timer.init(freq=rate_hz, mode=Timer.PERIODIC, callback=self._isr)
+    print(ansi.GREEN +"[{0:>12}] {1:35} ({2}): {3:.2f} V"
+          .format(CHIP_NAME, "Battery monitor", __version__, self._mV /1000)
+          +ansi.BLACK)
+
+  def deinit(self):
+    self._timer.deinit()
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @micropython.native
+  def _sample(self):
+    # Sum of `n_over` conversions, decimated to 16 bits
+    adc = self._adc
+    s = 0
+    for _ in range(self._nOver):
+      s += adc.read_u16()
+    return s >> self._shift
+
+  def _sample_vbus(self):
+    self._vbus = self._pinVBUS is not None and self._pinVBUS.value() == 1
+
+  def _to_mV(self, v):
+    return (v *self._scale) //65535
+
+  def _on_tick(self, timer):
+    # Timer callback
+    f = self._filt
+    f += self._sample() -(f >> EMA_SHIFT)
+    self._filt = f
+    mV = self._to_mV(f >> EMA_SHIFT)
+    self._mV = mV
+    self._sample_vbus()
+    self._nTicks += 1
+    if self._isLow:
+      isLow = mV < self._okMV and not self._vbus
+    else:
+      isLow = mV < self._lowMV and not self._vbus
+    if isLow != self._isLow:
+      self._isLow = isLow
+      if isLow:
+        self._nLow += 1
+      if self._cb:
+        self._cb(self, isLow)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @property
+  def voltage_mV(self):
+    """ Filtered supply voltage in [mV] (cached)
+    """
+    return self._mV
+
+  @property
+  def voltage_V(self):
+    return self._mV /1000
+
+  @property
+  def vbus(self):
+    """ True if VBUS (USB power) was present at the last tick
+    """
+    return self._vbus
+
+  @property
+  def is_low(self):
+    return self._isLow
+
+  @property
+  def counters(self):
+    """ Returns the number of timer ticks and of low-battery events
+    """
+    return self._nTicks, self._nLow
+
+# ----------------------------------------------------------------------------
@@ -23,29 +23,202 @@
 #                   and the calibration does not work yet for the LSM303 nor
 #                   the LSM9DS0.
 # 2019-12-21, native code generation added (requires MicroPython >=1.12)
+# 2022-10-18, `MagCalibration`, a streaming fit of the magnetometer ellipsoid
+#             (with a min-max fallback) in fixed memory; the result is stored
+#             in a file and applied as a precomputed combined matrix
+# 2022-10-18, fit checks axis coverage and radius ratio; if the z axis is not
+#             covered (e.g. robot turned only in the plane), only x and y are
+#             calibrated and the result is not saved
 #
 # ----------------------------------------------------------------------------
 import time
 import array
+import struct
 import robotling_lib.robotling_board as rb
 from math import pi, sin, cos, asin, acos, atan2, sqrt
+from micropython import const
 from robotling_lib.sensors.sensor_base import SensorBase
 from robotling_lib.misc.helpers import timed_function
 
-__version__ = "0.1.1.2"
+# pylint: disable=bad-whitespace
+__version__    = "0.1.2.1"
+CAL_MAGIC      = b"MAGC"
+CAL_FMT        = "<13f"      # offsets (3), matrix (9), field strength
+CAL_MIN_N      = const(50)   # Minimal number of samples for a fit
+CAL_MIN_SPREAD = 0.5         # Minimal range of an axis rel. to the largest
+CAL_MAX_RATIO  = 1.5         # Maximal ratio of the fitted radii
+_N_PAR         = const(6)    # Axis-aligned ellipsoid: x²,y²,z²,x,y,z
+_N_SUMS        = const(27)   # Upper triangle of normal matrix + rhs
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class MagCalibration(object):
+  """Streaming hard/soft-iron calibration of a magnetometer.
+
+  Readings are not buffered; `add()` only updates the sufficient statistics
+  of a least-squares fit of an axis-aligned ellipsoid
+  (a*x²+b*y²+c*z²+d*x+e*y+f*z = 1), i.e. the upper triangle of the normal
+  matrix and the right-hand side, as well as the per-axis minima/maxima.
+  `fit()` solves the 6x6 system; if that fails (e.g. too few orientations),
+  the min-max estimate is used instead. If the readings do not cover the z
+  axis as well as x and y, or the 3D fit is implausible, only x and y are
+  fitted (4x4 subsystem).
+  """
+
+  def __init__(self):
+    self._sums = array.array("f", [0]*_N_SUMS)
+    self._feat = array.array("f", [0]*_N_PAR)
+    self._min  = array.array("f", [0]*3)
+    self._max  = array.array("f", [0]*3)
+    self.reset()
+
+  def reset(self):
+    for i in range(_N_SUMS):
+      self._sums[i] = 0
+    self._n = 0
+    self._scale = 0.0
+
+  @property
+  def count(self):
+    return self._n
+
+  @micropython.native
+  def add(self, x, y, z):
+    """ Adds a reading (in any unit, e.g. [nT])
+    """
+    if self._n == 0:
+      # Scale readings to about 1 to keep the float sums well-conditioned
+      self._scale = 1 /max(sqrt(x*x +y*y +z*z), 1)
+    sc = self._scale
+    x *= sc
+    y *= sc
+    z *= sc
+    f = self._feat
+    f[0] = x*x
+    f[1] = y*y
+    f[2] = z*z
+    f[3] = x
+    f[4] = y
+    f[5] = z
+    s = self._sums
+    k = 0
+    for i in range(_N_PAR):
+      fi = f[i]
+      for j in range(i, _N_PAR):
+        s[k] += fi *f[j]
+        k += 1
+    for i in range(_N_PAR):
+      s[k +i] += f[i]
+    for i in range(3):
+      v = f[3 +i]
+      if self._n == 0 or v < self._min[i]:
+        self._min[i] = v
+      if self._n == 0 or v > self._max[i]:
+        self._max[i] = v
+    self._n += 1
+
+  def fit(self):
+    """ Returns offsets (3), soft-iron matrix (9, row-major), the mean field
+        strength and True, if all three axes were fitted, or False, if only
+        x and y were (then, the z entries are neutral and the field strength
+        is that of the x-y component); returns None, if there are too few
+        samples or the x-y plane is not covered
+    """
+    if self._n < CAL_MIN_N:
+      return None
+    spr = [self._max[i] -self._min[i] for i in range(3)]
+    lim = max(spr) *CAL_MIN_SPREAD
+    if lim <= 0 or spr[0] < lim or spr[1] < lim:
+      return None
+    if spr[2] >= lim:
+      res = self._fit_ellipsoid((0,1,2)) or self._fit_minmax((0,1,2))
+      if res:
+        return res +(True,)
+    res = self._fit_ellipsoid((0,1)) or self._fit_minmax((0,1))
+    return res +(False,) if res else None
+
+  def _fit_ellipsoid(self, axes):
+    # Build and solve the augmented normal equations for the parameters of
+    # `axes` (Gaussian elimination with partial pivoting)
+    ip = list(axes) +[3 +a for a in axes]
+    n = len(ip)
+    s = self._sums
+    m = [[0.0]*(n+1) for _ in range(n)]
+    for i in range(n):
+      for j in range(n):
+        a = min(ip[i], ip[j])
+        b = max(ip[i], ip[j])
+        m[i][j] = s[a*_N_PAR -a*(a-1)//2 +b -a]
+      m[i][n] = s[_N_SUMS -_N_PAR +ip[i]]
+    for c in range(n):
+      p = max(range(c, n), key=lambda r: abs(m[r][c]))
+      if abs(m[p][c]) < 1e-9:
+        return None
+      m[c], m[p] = m[p], m[c]
+      for r in range(c+1, n):
+        q = m[r][c] /m[c][c]
+        for j in range(c, n+1):
+          m[r][j] -= q *m[c][j]
+    p = [0.0]*n
+    for i in range(n-1, -1, -1):
+      v = m[i][n]
+      for j in range(i+1, n):
+        v -= m[i][j] *p[j]
+      p[i] = v /m[i][i]
+
+    # Center and radii
+    na = len(axes)
+    if min(p[0:na]) <= 0:
+      return None
+    off = [-p[na+i] /(2*p[i]) for i in range(na)]
+    g = 1 +sum(p[i] *off[i]*off[i] for i in range(na))
+    if g <= 0:
+      return None
+    rad = [sqrt(g /p[i]) for i in range(na)]
+    return self._result(axes, off, rad)
+
+  def _fit_minmax(self, axes):
+    off = [(self._max[a] +self._min[a]) /2 for a in axes]
+    rad = [(self._max[a] -self._min[a]) /2 for a in axes]
+    if min(rad) <= 0:
+      return None
+    return self._result(axes, off, rad)
+
+  def _result(self, axes, off, rad):
+    # Back to the units of the readings; scale the fitted axes to the mean
+    # radius; None, if the radii are implausible
+    if max(rad) > CAL_MAX_RATIO *min(rad):
+      return None
+    sc = self._scale
+    r = sum(rad) /len(rad)
+    o3 = [0.0]*3
+    mm = [1.0 if i % 4 == 0 else 0.0 for i in range(9)]
+    for i, a in enumerate(axes):
+      o3[a] = off[i] /sc
+      mm[a*4] = r /rad[i]
+    return o3, mm, r /sc
+
+# ----------------------------------------------------------------------------
 
 # ----------------------------------------------------------------------------
 class Compass(SensorBase):
   """Compass class that uses accelerometer and magnetometer data."""
 
-  def __init__(self, driver):
+  def __init__(self, driver, calib_file=None):
+    """ If `calib_file` exists, the magnetometer calibration is loaded from
+        it (see `calibrate()`)
+    """
     super().__init__(driver, 0)
+    self._calibFile = calib_file
+    self._calib = None
     if driver.is_ready:
       # Initialize
       self._acc     = array.array('i', [0,0,0])
       self._mag     = array.array('i', [0,0,0])
       self._mag_off = array.array('f', [0,0,0])
       self._mag_mm  = array.array('f', [1,0,0, 0,1,0, 0,0,1])
+      self._mag_cm  = array.array('f', [0]*9)
+      self._mag_co  = array.array('f', [0]*3)
       self._mag_fst = 50.0
       self._heading = 0.0
       self._pitch   = 0.0
@@ -73,6 +246,9 @@ class Compass(SensorBase):
           self._isCalib    = True
         except ImportError:
           pass
+      if calib_file:
+        self.load_calibration(calib_file)
+      self._combine()
 
     s = ", calibrated" if self._isCalib else ""
     print("[{0:>12}] {1:35} ({2}): {3}"
@@ -90,26 +266,18 @@ class Compass(SensorBase):
     """
     if self._driver == None:
       return rb.RBL_ERR_DEVICE_NOT_READY
-    Mag = self._mag
     Mag = self._driver.magnetometer_nT
-    MOf = self._mag_off
-    Mmm = self._mag_mm
+    Mcm = self._mag_cm
+    Mco = self._mag_co
 
-    # Apply calibration data
-    xmo = Mag[0] -MOf[0]
-    ymo = Mag[1] -MOf[1]
-    zmo = Mag[2] -MOf[2]
-    xmc = Mmm[0]*xmo +Mmm[1]*ymo +Mmm[2]*zmo
-    ymc = Mmm[3]*xmo +Mmm[4]*ymo +Mmm[5]*zmo
-    zmc = Mmm[6]*ymo +Mmm[7]*ymo +Mmm[8]*zmo
-
-    # Normalize magnetometer readings
-    norm = sqrt(xmc**2 +ymc**2 +zmc**2)
-    xmn = xmc /norm
-    ymn = ymc /norm
-    zmn = zmc /norm
-    ymn = -ymc
-    zmn = -zmc
+    # Apply calibration data and axis orientation in one step; no need to
+    # normalize, as the heading depends only on the ratios
+    xm  = Mag[0]
+    ym  = Mag[1]
+    zm  = Mag[2]
+    xmn = Mcm[0]*xm +Mcm[1]*ym +Mcm[2]*zm -Mco[0]
+    ymn = Mcm[3]*xm +Mcm[4]*ym +Mcm[5]*zm -Mco[1]
+    zmn = Mcm[6]*xm +Mcm[7]*ym +Mcm[8]*zm -Mco[2]
 
     if tilt:
       # Tilt compensate magnetic sensor measurements
@@ -170,6 +338,98 @@ class Compass(SensorBase):
       return (rb.RBL_OK, -1, self._pitch, self._roll)
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _combine(self):
+    # Precompute `S*M` and `S*M*off`, with S=diag(1,-1,-1) for the axis
+    # orientation, so that the heading needs a single affine transform
+    Mmm = self._mag_mm
+    for i in range(3):
+      s = -1 if i > 0 else 1
+      o = 0.0
+      for j in range(3):
+        v = s *Mmm[i*3 +j]
+        self._mag_cm[i*3 +j] = v
+        o += v *self._mag_off[j]
+      self._mag_co[i] = o
+
+  def calibrate(self, n=500, dt_ms=20, save=True):
+    """ Collects `n` magnetometer readings every `dt_ms` while the robot is
+        turned in all directions, fits and applies the calibration, and
+        saves it to `calib_file`, if `save` is True; returns True if a
+        calibration was found
+    """
+    self.start_calibration()
+    for _ in range(n):
+      self.add_calibration_sample()
+      time.sleep_ms(dt_ms)
+    return self.finish_calibration(save)
+
+  def start_calibration(self):
+    if self._calib is None:
+      self._calib = MagCalibration()
+    self._calib.reset()
+
+  def add_calibration_sample(self):
+    """ Feeds one magnetometer reading into the running fit; returns the
+        number of samples so far
+    """
+    Mag = self._driver.magnetometer_nT
+    self._calib.add(Mag[0], Mag[1], Mag[2])
+    return self._calib.count
+
+  def finish_calibration(self, save=True):
+    """ Applies the fit; returns False, if there was none or if it covers
+        only x and y (then, only these axes are corrected and the result is
+        not saved)
+    """
+    res = self._calib.fit() if self._calib else None
+    if res is None:
+      return False
+    off, mm, fst, full = res
+    na = 3 if full else 2
+    for i in range(na):
+      self._mag_off[i] = off[i]
+      for j in range(na):
+        self._mag_mm[i*3 +j] = mm[i*3 +j]
+    if full:
+      self._mag_fst = fst
+    self._isCalib = True
+    self._combine()
+    if full and save and self._calibFile:
+      self.save_calibration(self._calibFile)
+    return full
+
+  def save_calibration(self, fname):
+    """ Writes offsets, soft-iron matrix and field strength to file `fname`
+    """
+    with open(fname, "wb") as f:
+      f.write(CAL_MAGIC)
+      f.write(struct.pack(CAL_FMT, *self._mag_off, *self._mag_mm,
+                          self._mag_fst))
+
+  def load_calibration(self, fname):
+    """ Loads a calibration from file `fname`; returns False, if there is
+        no (valid) calibration
+    """
+    try:
+      with open(fname, "rb") as f:
+        if f.read(len(CAL_MAGIC)) != CAL_MAGIC:
+          return False
+        v = struct.unpack(CAL_FMT, f.read(struct.calcsize(CAL_FMT)))
+    except (OSError, ValueError):
+      return False
+    for i in range(3):
+      self._mag_off[i] = v[i]
+    for i in range(9):
+      self._mag_mm[i] = v[3 +i]
+    self._mag_fst = v[12]
+    self._isCalib = True
+    self._combine()
+    return True
+
+  @property
+  def is_calibrated(self):
+    return self._isCalib
+
   def stream_calibration_data(self, n=1000):
     # Initialize
     xg = 0
@@ -5,6 +5,7 @@
 # The MIT License (MIT)
 # Copyright (c) 2018 Thomas Euler
 # 2020-09-20, v1
+# 2022-10-18, v1.1, calibration profile restored at start, if available
 # ----------------------------------------------------------------------------
 from math import radians
 from robotling_lib.misc.helpers import timed_function
@@ -13,17 +14,19 @@ from robotling_lib.driver.bno055 import BNO055, ADDRESS_BNO055
 import robotling_lib.misc.ansi_color as ansi
 import robotling_lib.robotling_board as rb
 
-__version__ = "0.1.0.0"
+__version__ = "0.1.1.0"
 CHIP_NAME   = "BNO055"
 
 # ----------------------------------------------------------------------------
 class Compass(SensorBase):
   """Compass class that uses the 9-DoF MNU BNO055 breakout."""
 
-  def __init__(self, i2c):
-    """ Requires already initialized I2C bus instance.
+  def __init__(self, i2c, calib_file=None):
+    """ Requires already initialized I2C bus instance. If `calib_file` holds
+        a calibration profile, it is restored (see `save_calibration()`).
     """
     self._i2c = i2c
+    self._calibFile = calib_file
     self._BNO055 = None
     self._isReady = False
     super().__init__(None, 0)
@@ -32,7 +35,7 @@ class Compass(SensorBase):
     if (ADDRESS_BNO055 in addrList):
       # Initialize
       try:
-        self._BNO055 = BNO055(i2c)
+        self._BNO055 = BNO055(i2c, calib_file=calib_file)
         self._version = 1
         self._type = "Compass w/ tilt-compensation"
         self._isReady = True
@@ -81,6 +84,18 @@ class Compass(SensorBase):
     else:
       return (rb.RBL_OK, -1, pit, rol)
 
+  def save_calibration(self, force=False):
+    """ Saves the calibration profile to `calib_file`, once the sensor is
+        fully calibrated; returns True if saved
+    """
+    if not self._isReady or not self._calibFile:
+      return False
+    return self._BNO055.save_calibration(self._calibFile, force)
+
+  @property
+  def is_calibrated(self):
+    return self._isReady and self._BNO055.calibrated
+
   @property
   def is_ready(self):
     return self._isReady
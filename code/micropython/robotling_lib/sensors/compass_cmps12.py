@@ -10,20 +10,29 @@
 #             position 1 to be compatible with the data format returned
 #             by `getHeading3D`
 # 2019-12-21, native code generation added (requires MicroPython >=1.12)
+# 2022-10-18, one preallocated burst read into a cached record, refreshed
+#             at most once per interval; getters do not allocate;
+#             register access via `RegisterDevice`
+# 2022-10-18, burst covers only bearing, pitch and roll; calibration state
+#             is read on demand; results are kept in preallocated lists that
+#             are updated in place instead of new tuples per read
 # ----------------------------------------------------------------------------
 try:
   import struct
 except ImportError:
   import ustruct as struct
-from math import radians
+from math import pi
+from time import ticks_ms, ticks_diff
 from micropython import const
 import robotling_lib.misc.ansi_color as ansi
 from robotling_lib.misc.helpers import timed_function
 from robotling_lib.sensors.sensor_base import SensorBase
 import robotling_lib.robotling_board as rb
+from robotling_lib.platform.rp2.register import RegisterDevice
 
-__version__ = "0.1.1.0"
+__version__ = "0.1.3.1"
 CHIP_NAME   = "CMPS12"
+CHAN_COUNT  = const(1)
 
 # pylint: disable=bad-whitespace
 _ADDRESS_CMPS12            = const(0x60)  # (0xD0 >> 1)
@@ -61,28 +70,45 @@ _REG_PITCH_16BIT_ANGLE_HB  = const(0x1C) # 16bit signed int, +/- 180°, w/next
 _REG_PITCH_16BIT_ANGLE_LB  = const(0x1D)
 _REG_CALIB_STATE           = const(0x1E) # Calibration state, 0=not, 3=fully
 
+# Record of registers 0x01..0x05 (bearing, pitch, roll), read in one burst
+_REC_FIRST                 = _REG_BEARING_8BIT
+_REC_LEN                   = const(5)
+INTERVAL_MS                = const(20)   # Default minimal refresh interval
+_DEG2RAD                   = pi /180
+# pylint: enable=bad-whitespace
+
 # ----------------------------------------------------------------------------
 class Compass(SensorBase):
   """Compass class that uses the tilt-compensated CMPS12 breakout."""
 
-  def __init__(self, i2c):
-    """ Requires already initialized I2C bus instance.
+  def __init__(self, i2c, interval_ms=INTERVAL_MS):
+    """ Requires already initialized I2C bus instance. The sensor is read at
+        most once per `interval_ms`; in between, the getters return the
+        cached values.
     """
     self._i2c = i2c
     self._isReady = False
-    self._type = "Compass w/ tilt-compensation"
     super().__init__(None, 0)
+    self._type = "Compass w/ tilt-compensation"
+    self._interval = interval_ms
+    self._regs = RegisterDevice(i2c, _ADDRESS_CMPS12)
+    self._rec = bytearray(_REC_LEN)
+    self._tRec = 0
+    self._nReads = 0
+    self._heading = 0.0
+    self._heading8 = 0.0
+    self._pitch = 0
+    self._roll = 0
+    self._res3D = [rb.RBL_ERR_DEVICE_NOT_READY, 0, 0, 0]
+    self._resPR = [rb.RBL_ERR_DEVICE_NOT_READY, -1, 0, 0]
+    self._resPRRad = [rb.RBL_ERR_DEVICE_NOT_READY, -1, 0., 0.]
 
     addrList = self._i2c.deviceAddrList
     if (_ADDRESS_CMPS12 in addrList):
       # Get version and initialize
-      buf = bytearray(1)
-      self._read_bytes(_ADDRESS_CMPS12, _REG_CMD, buf)
-      self._version = buf[0]
-      self._heading = 0.0
-      self._pitch = 0.0
-      self._roll = 0.0
+      self._version = self._regs.read_u8(_REG_CMD)
       self._isReady = True
+      self._refresh(True)
 
     cn =  "{0}_v{1}".format(CHIP_NAME, self._version)
     c = ansi.GREEN if self._isReady else ansi.RED
@@ -91,8 +117,36 @@ class Compass(SensorBase):
                   "ok" if self._isReady else "NOT FOUND") +ansi.BLACK)
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  #@timed_function
   @micropython.native
+  def _refresh(self, force=False):
+    # Read bearing, pitch and roll in one burst, if the record is older
+    # than the interval, and update the cached results in place
+    if not force and ticks_diff(ticks_ms(), self._tRec) < self._interval:
+      return
+    rec = self._rec
+    self._regs.read_into(_REC_FIRST, rec)
+    self._tRec = ticks_ms()
+    self._nReads += 1
+    hd, pit, rol = struct.unpack_from(">Hbb", rec, 1)
+    self._heading = hd /10
+    self._heading8 = rec[0] /255 *360
+    self._pitch = pit
+    self._roll = rol
+    r = self._res3D
+    r[0] = rb.RBL_OK
+    r[1] = self._heading
+    r[2] = pit
+    r[3] = rol
+    r = self._resPR
+    r[0] = rb.RBL_OK
+    r[2] = pit
+    r[3] = rol
+    r = self._resPRRad
+    r[0] = rb.RBL_OK
+    r[2] = pit *_DEG2RAD
+    r[3] = rol *_DEG2RAD
+
+  #@timed_function
   def get_heading(self, tilt=False, calib=False, hires=True):
     """ Returns heading with or w/o tilt compensation and/or calibration,
         if available.
@@ -103,56 +157,48 @@ class Compass(SensorBase):
     """
     if not self._isReady:
       return rb.RBL_ERR_DEVICE_NOT_READY
-    hd = self._heading
-    if hires:
-      buf = bytearray(1)
-      self._read_bytes(_ADDRESS_CMPS12, _REG_BEARING_8BIT, buf)
-      hd  = buf[0]/255 *360
-    else:
-      buf = bytearray(2)
-      self._read_bytes(_ADDRESS_CMPS12, _REG_BEARING_16BIT_HB, buf)
-      hd  = ((buf[0] << 8) | buf[1]) /10
-    return hd
-
+    self._refresh()
+    return self._heading if hires else self._heading8
 
   #@timed_function
-  @micropython.native
   def get_heading_3d(self, calib=False):
     """ Returns heading, pitch and roll in [°] with or w/o calibration,
         if available.
         NOTE: The CMPS12 has built-in tilt compensation and is pre-calibra-
         ted, therefore the parameter "calib" exists only for compatibility
         reasons and has no effect.
+        NOTE: Returns a list that is updated in place by the next read;
+        copy it, if the values need to be kept.
     """
     if not self._isReady:
       return (rb.RBL_ERR_DEVICE_NOT_READY, 0, 0, 0)
-    hd  = self._heading
-    pit = self._pitch
-    rol = self._roll
-    buf = bytearray(4)
-    self._read_bytes(_ADDRESS_CMPS12, _REG_BEARING_16BIT_HB, buf)
-    hd, pit, rol = struct.unpack_from('>Hbb', buf[0:4])
-    hd /= 10
-    return (rb.RBL_OK, hd, pit, rol)
-
+    self._refresh()
+    return self._res3D
 
   #@timed_function
-  @micropython.native
   def get_pitch_roll(self, radians=False):
-    """ Returns error code, pitch and roll in [°] as a tuple
+    """ Returns error code, -1, pitch and roll in [°] (or radians) as a
+        list that is updated in place by the next read
     """
     if not self._isReady:
       return  (rb.RBL_ERR_DEVICE_NOT_READY, 0, 0)
-    pit = self._pitch
-    rol = self._roll
-    buf = bytearray(2)
-    self._read_bytes(_ADDRESS_CMPS12, _REG_PITCH_8BIT_ANGLE, buf)
-    pit, rol = struct.unpack_from('>bb', buf[0:2])
-    if radians:
-      return (rb.RBL_OK, -1, radians(pit), radians(rol))
-    else:
-      return (rb.RBL_OK, -1, pit, rol)
+    self._refresh()
+    return self._resPRRad if radians else self._resPR
 
+  @property
+  def calibration_state(self):
+    """ Calibration state (0=not, 3=fully calibrated); read on demand, not
+        part of the burst
+    """
+    if not self._isReady:
+      return 0
+    return self._regs.read_u8(_REG_CALIB_STATE)
+
+  @property
+  def read_count(self):
+    """ Number of burst reads so far
+    """
+    return self._nReads
 
   @property
   def is_ready(self):
@@ -162,11 +208,4 @@ class Compass(SensorBase):
   def channel_count(self):
     return CHAN_COUNT
 
-  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def _read_bytes(self, i2cAddr, regAddr, buf):
-    cmd    = bytearray(1)
-    cmd[0] = regAddr & 0xff
-    self._i2c.bus.writeto(i2cAddr, cmd, False)
-    self._i2c.bus.readfrom_into(i2cAddr, buf)
-
 # ----------------------------------------------------------------------------
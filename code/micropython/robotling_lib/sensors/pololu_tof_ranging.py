@@ -8,8 +8,9 @@
 # 2021-02-12, v1.1
 # 2022-04-08, v1.2, improve sensor performance
 # 2022-04-15, v1.3, back to simple `time_pulse_us`, PIO in a different file
+# 2022-10-18, v1.4, no re-reads; smoothing is left to the caller (see
+#                   `FilterBank` in `helpers.py`)
 # ----------------------------------------------------------------------------
-from time import ticks_diff, ticks_us
 from micropython import const
 from machine import Pin, time_pulse_us
 from robotling_lib.sensors.sensor_base import SensorBase
@@ -17,11 +18,10 @@ import robotling_lib.misc.ansi_color as ansi
 from robotling_lib.misc.helpers import timed_function
 
 # pylint: disable=bad-whitespace
-__version__    = "0.1.3.0"
+__version__    = "0.1.4.0"
 CHIP_NAME      = "IRS16A"
 TIMEOUT_US     = const(20_000)
-N_REREADS      = const(2)
-N_AVG          = const(1)
+MIN_PULSE_US   = const(1000)
 ERR_TIMEOUT    = const(-1)
 # pylint: enable=bad-whitespace
 
@@ -49,17 +49,11 @@ class PololuTOFRangingSensor(SensorBase):
   @micropython.native
   @property
   def range_cm(self):
-    tavg = 0              
-    p = self._pin
-    t = 0
-    for i in range(N_AVG):
-      n = N_REREADS
-      while (t := time_pulse_us(p, 1, TIMEOUT_US)) < 1000 and n > 0:
-        n -= 1
-      if t < 0 or n == 0:
-        return ERR_TIMEOUT
-      tavg += t
-    tavg /= N_AVG
-    return 0.75 *(tavg -1000) /10
-  
+    # One reading; timeouts and glitches (too short pulses) are reported as
+    # `ERR_TIMEOUT` instead of being re-read
+    t = time_pulse_us(self._pin, 1, TIMEOUT_US)
+    if t < MIN_PULSE_US:
+      return ERR_TIMEOUT
+    return 0.75 *(t -1000) /10
+
 # ----------------------------------------------------------------------------
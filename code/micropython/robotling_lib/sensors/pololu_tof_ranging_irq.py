@@ -0,0 +1,113 @@
+# ----------------------------------------------------------------------------
+# pololu_tof_ranging_irq.py
+# Pololu time-of-flight distance ranging sensors w/ PWM output
+# (pin interrupt version)
+#
+# Rising and falling edges are time-stamped with `ticks_us()` in a (hard)
+# pin interrupt; the pulse widths go into a small ring buffer per sensor.
+# Reading a range is therefore non-blocking: it returns the latest pulse,
+# unless that is older than `max_age_us` (stale, e.g. no sensor).
+#
+# The MIT License (MIT)
+# Copyright (c) 2021-2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+from time import ticks_diff, ticks_us, ticks_ms, sleep_ms
+from array import array
+from micropython import const
+from machine import Pin
+from robotling_lib.sensors.sensor_base import SensorBase
+import robotling_lib.misc.ansi_color as ansi
+
+# pylint: disable=bad-whitespace
+__version__    = "0.1.0.0"
+CHIP_NAME      = "IRS16A"
+N_RING         = const(4)        # Ring buffer size (power of 2)
+RING_MASK      = const(N_RING -1)
+MIN_PULSE_US   = const(1000)     # Shorter pulses are glitches
+MAX_AGE_US     = const(50_000)   # Older pulses are stale
+INIT_WAIT_MS   = const(100)      # Wait this long for a first pulse
+CNT_MASK       = const(0x3FFFFFFF)
+ERR_TIMEOUT    = const(-1)
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class PololuTOFRangingSensor(SensorBase):
+  """Class for pulse-width Pololu time-of-flight ranging sensor, using pin
+     interrupts."""
+
+  def __init__(self, pin, max_age_us=MAX_AGE_US):
+    super().__init__(driver=None, chan=1)
+    self._pin = Pin(pin, Pin.IN)
+    self._type = "time-of-flight range"
+    self._maxAge = max_age_us
+    self._tRise = 0
+    self._isHigh = False
+    self._widths = array("i", [0]*N_RING)
+    self._times = array("i", [0]*N_RING)
+    self._iNext = 0
+    self._nPulses = 0
+
+    # Bind the handler only once, the interrupt must not allocate memory
+    self._isr = self._on_edge
+    self._pin.irq(self._isr, Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+    t0 = ticks_ms()
+    while self._nPulses == 0 and ticks_diff(ticks_ms(), t0) < INIT_WAIT_MS:
+      sleep_ms(5)
+    self._isReady = self._nPulses > 0
+    c = ansi.GREEN if self._isReady else ansi.RED
+    print(c +"[{0:>12}] {1:35} ({2}): {3}"
+          .format(CHIP_NAME, "Pololu time-of-flight w/IRQ", __version__,
+                  "ok" if self._isReady else "NOT FOUND") +ansi.BLACK)
+
+  def deinit(self):
+    self._pin.irq(None)
+
+  def _on_edge(self, pin):
+    # Pin interrupt handler
+    t = ticks_us()
+    if pin.value():
+      self._tRise = t
+      self._isHigh = True
+    elif self._isHigh:
+      self._isHigh = False
+      w = ticks_diff(t, self._tRise)
+      if w >= MIN_PULSE_US:
+        i = self._iNext
+        self._widths[i] = w
+        self._times[i] = t
+        self._iNext = (i +1) & RING_MASK
+        self._nPulses = (self._nPulses +1) & CNT_MASK
+
+  @property
+  def age_us(self):
+    """ Age of the latest pulse in [us] or ERR_TIMEOUT, if there was none
+    """
+    if self._nPulses == 0:
+      return ERR_TIMEOUT
+    return ticks_diff(ticks_us(), self._times[(self._iNext -1) & RING_MASK])
+
+  @property
+  def pulse_count(self):
+    return self._nPulses
+
+  @micropython.native
+  @property
+  def range_raw(self):
+    """ Width of the latest pulse in [us] or ERR_TIMEOUT, if it is stale
+    """
+    i = (self._iNext -1) & RING_MASK
+    if (self._nPulses == 0 or
+        ticks_diff(ticks_us(), self._times[i]) > self._maxAge):
+      return ERR_TIMEOUT
+    return self._widths[i]
+
+  @micropython.native
+  @property
+  def range_cm(self):
+    t = self.range_raw
+    if t < 0:
+      return ERR_TIMEOUT
+    return 0.75 *(t -1000) /10
+
+# ----------------------------------------------------------------------------
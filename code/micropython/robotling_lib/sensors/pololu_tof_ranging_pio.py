@@ -8,8 +8,16 @@
 # 2021-02-12, v1.1
 # 2022-04-08, v1.2, improve sensor performance
 # 2022-04-14, v1.3, alternate PIO version
+# 2022-10-18, v1.4, `PololuTOFCapture`, all channels w/ one state machine
+#
+# `PololuTOFCapture` samples up to three consecutive pins every 12 cycles
+# (= 1 us at `CAP_FREQ`) and counts down. Whenever the pins change, it pushes
+# the pin levels (bits 29..27) and the counter (bits 26..0) and raises an
+# IRQ, in which the FIFO is drained; reading a range does not block.
 # ----------------------------------------------------------------------------
 import rp2
+from array import array
+from time import ticks_diff, ticks_us, ticks_ms, sleep_ms
 from micropython import const
 from machine import Pin, freq
 from rp2 import PIO, StateMachine, asm_pio
@@ -18,12 +26,21 @@ import robotling_lib.misc.ansi_color as ansi
 from robotling_lib.misc.helpers import timed_function
 
 # pylint: disable=bad-whitespace
-__version__    = "0.1.3.0"
+__version__    = "0.1.4.0"
 CHIP_NAME      = "IRS16A"
 TIMEOUT_US     = const(20_000)
 N_REREADS      = const(1)
 N_AVG          = const(1)
 ERR_TIMEOUT    = const(-1)
+N_CAP_PINS     = const(3)
+CAP_CNT_BITS   = const(27)
+CAP_CNT_MASK   = const(0x7FFFFFF)
+CAP_FREQ       = const(12_000_000)
+MIN_PULSE_US   = const(1000)     # Pulses outside this range are rejected
+MAX_PULSE_US   = const(10_000)
+MAX_AGE_US     = const(50_000)   # Older pulses are stale
+INIT_WAIT_MS   = const(100)      # Wait this long for first pulses
+CNT_MASK       = const(0x3FFFFFFF)
 # pylint: enable=bad-whitespace
 
 @rp2.asm_pio(set_init=rp2.PIO.IN_LOW, autopush=True, push_thresh=32)
@@ -38,6 +55,30 @@ def pulse():
   jmp(pin, 'low_high')    # while pin is high
   in_(x, 32)              # Auto push: SM stalls if FIFO full
   wrap()
+
+@rp2.asm_pio(in_shiftdir=rp2.PIO.SHIFT_LEFT, fifo_join=rp2.PIO.JOIN_RX)
+def capture():
+  wrap_target()
+  label('sample')
+  mov(isr, null)
+  in_(pins, 3)            # Pin levels ...
+  mov(y, isr)
+  jmp(x_not_y, 'change')  # ... changed? (x holds the previous levels)
+  mov(y, osr)             # Counter is kept in OSR
+  jmp(y_dec, 'count')
+  label('count')
+  mov(osr, y) [5]         # Both branches take 12 cycles
+  wrap()
+  label('change')
+  mov(x, y)
+  mov(y, osr)
+  in_(y, 27)              # ISR = levels << 27 | counter
+  push(noblock)           # Never stall; if the FIFO is full, the word is lost
+  irq(rel(0))
+  jmp(y_dec, 'count_ch')
+  label('count_ch')
+  mov(osr, y)
+  jmp('sample')
     
 # ----------------------------------------------------------------------------
 class PololuTOFRangingSensor(SensorBase):
@@ -78,3 +119,148 @@ class PololuTOFRangingSensor(SensorBase):
     return 0.75 *(tavg -1000) /10
   
 # ----------------------------------------------------------------------------
+class PololuTOFCapture(object):
+  """Pulse capture for up to three Pololu time-of-flight sensors at
+     consecutive pins with a single state machine."""
+
+  def __init__(self, pins, sm_ID=0, max_age_us=MAX_AGE_US, use_irq=True):
+    """ With `use_irq`, the FIFO is drained in the state machine's interrupt,
+        otherwise, when a range is read (then, ranges need to be read at
+        least every ~10 ms, or pulse edges are lost)
+    """
+    base = min(pins)
+    assert max(pins) -base < N_CAP_PINS, "Pins must be 3 consecutive GPIOs"
+    assert sm_ID in range(8), "State machine ID must be 0..7"
+    self._n = len(pins)
+    self._masks = array("i", [1 << (p -base) for p in pins])
+    self._tRise = array("i", [0]*self._n)
+    self._widths = array("i", [0]*self._n)
+    self._times = array("i", [0]*self._n)
+    self._levels = 0
+    self._maxAge = max_age_us
+    self._nWords = 0
+    self._nRejected = 0
+    self._useIRQ = use_irq
+    self._isActive = True
+    for p in pins:
+      Pin(p, Pin.IN)
+    self._sm = rp2.StateMachine(sm_ID, capture, freq=CAP_FREQ,
+                                in_base=Pin(base))
+    if use_irq:
+      # Bind the handler only once, the interrupt must not allocate memory
+      self._isr = self._on_irq
+      self._sm.irq(self._isr, hard=True)
+    self._sm.active(1)
+    self.sensors = [PololuTOFChannel(self, i) for i in range(self._n)]
+
+    t0 = ticks_ms()
+    while ticks_diff(ticks_ms(), t0) < INIT_WAIT_MS:
+      sleep_ms(5)
+      if not use_irq:
+        self._drain()
+      if min(self._widths) > 0:
+        break
+    nOk = sum(1 for i in range(self._n) if self.range_raw(i) > 0)
+    self._isReady = nOk > 0
+    c = ansi.GREEN if nOk == self._n else ansi.RED
+    print(c +"[{0:>12}] {1:35} ({2}): {3}/{4} ok"
+          .format(CHIP_NAME, "Pololu time-of-flight w/PIO capture",
+                  __version__, nOk, self._n) +ansi.BLACK)
+
+  def deinit(self):
+    if self._isActive:
+      self._isActive = False
+      self._sm.active(0)
+      if self._useIRQ:
+        self._sm.irq(None)
+
+  def _on_irq(self, sm):
+    self._drain()
+
+  @micropython.native
+  def _drain(self):
+    """ Processes the words in the FIFO, keeping the latest pulse width of
+        each channel; never blocks
+    """
+    sm = self._sm
+    n = sm.rx_fifo()
+    self._nWords = (self._nWords +n) & CNT_MASK
+    while n > 0:
+      n -= 1
+      w = sm.get()
+      c = w & CAP_CNT_MASK
+      lev = w >> CAP_CNT_BITS
+      dif = lev ^ self._levels
+      self._levels = lev
+      t = ticks_us()
+      for i in range(self._n):
+        m = self._masks[i]
+        if dif & m:
+          if lev & m:
+            self._tRise[i] = c
+          else:
+            # Counter runs backwards
+            dt = (self._tRise[i] -c) & CAP_CNT_MASK
+            if dt >= MIN_PULSE_US and dt <= MAX_PULSE_US:
+              self._widths[i] = dt
+              self._times[i] = t
+            else:
+              self._nRejected = (self._nRejected +1) & CNT_MASK
+
+  @property
+  def counters(self):
+    """ Returns the number of words read from the FIFO and the number of
+        pulses rejected as implausible
+    """
+    return self._nWords, self._nRejected
+
+  def age_us(self, i):
+    """ Age of the latest pulse of channel `i` in [us] or ERR_TIMEOUT, if
+        there was none
+    """
+    if self._widths[i] == 0:
+      return ERR_TIMEOUT
+    return ticks_diff(ticks_us(), self._times[i])
+
+  @micropython.native
+  def range_raw(self, i):
+    """ Width of the latest pulse of channel `i` in [us] or ERR_TIMEOUT, if
+        it is stale
+    """
+    if not self._useIRQ:
+      self._drain()
+    if (self._widths[i] == 0 or
+        ticks_diff(ticks_us(), self._times[i]) > self._maxAge):
+      return ERR_TIMEOUT
+    return self._widths[i]
+
+# ----------------------------------------------------------------------------
+class PololuTOFChannel(SensorBase):
+  """One sensor of a `PololuTOFCapture`; same interface as
+     `PololuTOFRangingSensor`."""
+
+  def __init__(self, capture, i):
+    super().__init__(driver=None, chan=i)
+    self._cap = capture
+    self._type = "time-of-flight range"
+
+  def deinit(self):
+    self._cap.deinit()
+
+  @property
+  def age_us(self):
+    return self._cap.age_us(self._chan)
+
+  @property
+  def range_raw(self):
+    return self._cap.range_raw(self._chan)
+
+  @micropython.native
+  @property
+  def range_cm(self):
+    t = self._cap.range_raw(self._chan)
+    if t < 0:
+      return ERR_TIMEOUT
+    return 0.75 *(t -1000) /10
+
+# ----------------------------------------------------------------------------
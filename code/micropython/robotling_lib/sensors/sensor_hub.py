@@ -0,0 +1,178 @@
+# ----------------------------------------------------------------------------
+# sensor_hub.py
+# Scheduler for sensor reads with per-sensor rates, priorities and a time
+# budget per cycle
+#
+# Sensors are registered with a read function, a target rate and a priority;
+# `update()` is called once per hardware loop cycle and reads, in order of
+# priority, the sensors that are due, as long as the (estimated) duration of
+# the next read still fits into the budget. A sensor that does not fit stays
+# due for the next cycle, hence slow sensors do not hold back fast ones. The
+# latest value, its timestamp and the validity of the last read are kept in
+# preallocated arrays that consumers read without locking.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# 2022-10-18, v1.1, `set_rate()` applies a higher rate immediately
+# ----------------------------------------------------------------------------
+import array
+from time import ticks_ms, ticks_us, ticks_diff, ticks_add
+from micropython import const
+
+# pylint: disable=bad-whitespace
+__version__    = "0.1.1.0"
+MAX_SENSORS    = const(8)
+BUDGET_US      = const(3000)   # Time for sensor reads per cycle
+DATA_NONE      = const(-1)     # Returned by a read function, if invalid
+COST_SHIFT     = const(2)      # EMA weight of the read duration 1/2^n
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class SensorHub(object):
+  """Reads registered sensors at their own rates within a time budget."""
+
+  def __init__(self, max_sensors=MAX_SENSORS, budget_us=BUDGET_US):
+    self._budget = budget_us
+    self._n = 0
+    self._sensors = [None]*max_sensors
+    self._reads = [None]*max_sensors
+    self._order = []
+    self._prio = bytearray(max_sensors)
+    self._period = array.array("i", [0]*max_sensors)
+    self._tDue = array.array("i", [0]*max_sensors)
+    self._cost = array.array("i", [0]*max_sensors)
+    self._values = array.array("i", [DATA_NONE]*max_sensors)
+    self._tStamp = array.array("i", [0]*max_sensors)
+    self._valid = bytearray(max_sensors)
+    self._nReads = array.array("I", [0]*max_sensors)
+    self._seq = array.array("I", [0]*max_sensors)
+    self._nDefer = array.array("I", [0]*max_sensors)
+    self._tReset = ticks_ms()
+
+  def add(self, sensor, read, rate_hz, priority=0):
+    """ Registers `sensor`; `read(sensor)` returns its value as an integer
+        or DATA_NONE, if the reading is invalid. Sensors with a higher
+        `priority` are read first. Returns the sensor's index.
+    """
+    i = self._n
+    if i >= len(self._sensors):
+      raise ValueError("Too many sensors")
+    self._sensors[i] = sensor
+    self._reads[i] = read
+    self._prio[i] = priority
+    self.set_rate(i, rate_hz)
+    self._tDue[i] = ticks_ms()
+    self._n += 1
+    self._order = sorted(range(self._n), key=lambda j: -self._prio[j])
+    if hasattr(sensor, "auto_update"):
+      sensor.auto_update = True
+    return i
+
+  def set_rate(self, i, rate_hz):
+    """ Changes the target rate of sensor `i`; a higher rate takes effect
+        immediately (the next read is moved forward), a lower one after the
+        next read. Cheap if the rate does not change.
+    """
+    p = max(1000 //max(rate_hz, 1), 1)
+    p0 = self._period[i]
+    if p == p0:
+      return
+    if p < p0 and i < self._n:
+      due = ticks_add(self._tDue[i], p -p0)
+      if ticks_diff(due, self._tDue[i]) < 0:
+        self._tDue[i] = due
+    self._period[i] = p
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @micropython.native
+  def update(self):
+    """ Reads the sensors that are due and fit into the budget; returns the
+        number of reads
+    """
+    t = ticks_ms()
+    t0 = ticks_us()
+    n = 0
+    for i in self._order:
+      if ticks_diff(t, self._tDue[i]) < 0:
+        continue
+      if n > 0 and ticks_diff(ticks_us(), t0) +self._cost[i] > self._budget:
+        self._nDefer[i] += 1
+        continue
+      ts = ticks_us()
+      v = self._reads[i](self._sensors[i])
+      c = self._cost[i]
+      self._cost[i] = c +((ticks_diff(ticks_us(), ts) -c) >> COST_SHIFT)
+      if v < 0:
+        self._valid[i] = 0
+      else:
+        self._values[i] = v
+        self._tStamp[i] = t
+        self._valid[i] = 1
+      self._nReads[i] += 1
+      self._seq[i] += 1
+
+      # Next read one period later, but do not catch up missed ones
+      due = ticks_add(self._tDue[i], self._period[i])
+      if ticks_diff(due, t) <= 0:
+        due = ticks_add(t, self._period[i])
+      self._tDue[i] = due
+      n += 1
+    return n
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  @property
+  def count(self):
+    return self._n
+
+  @property
+  def values(self):
+    """ Latest valid values (DATA_NONE, if there was none yet)
+    """
+    return self._values
+
+  @property
+  def timestamps(self):
+    """ Times of the latest valid values (`ticks_ms()`)
+    """
+    return self._tStamp
+
+  @property
+  def valid(self):
+    """ 1, if the latest read of a sensor was valid, otherwise 0
+    """
+    return self._valid
+
+  @property
+  def sequences(self):
+    """ Number of completed reads per sensor (not reset); a change means
+        that the sensor was read
+    """
+    return self._seq
+
+  def age_ms(self, i):
+    return ticks_diff(ticks_ms(), self._tStamp[i])
+
+  def rate_hz(self, i):
+    """ Achieved read rate of sensor `i` since the last `reset_counters()`
+    """
+    dt = ticks_diff(ticks_ms(), self._tReset)
+    return self._nReads[i] *1000 /dt if dt > 0 else 0
+
+  def reset_counters(self):
+    for i in range(self._n):
+      self._nReads[i] = 0
+      self._nDefer[i] = 0
+    self._tReset = ticks_ms()
+
+  def print_rates(self):
+    """ Print target and achieved rates, read durations and deferrals
+    """
+    print("{0:>6} {1:>8} {2:>8} {3:>8} {4:>8}"
+          .format("sensor", "target", "rate_hz", "read_us", "deferred"))
+    for i in range(self._n):
+      print("{0:>6} {1:>8.1f} {2:>8.1f} {3:>8} {4:>8}"
+            .format(i, 1000 /self._period[i], self.rate_hz(i), self._cost[i],
+                    self._nDefer[i]))
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,543 @@
+# ----------------------------------------------------------------------------
+# sensor_replay.py
+# Recording of raw sensor streams into a compact trace file and replay drivers
+# that offer the interfaces of the respective sensor classes:
+#
+#   Stream        Recorded                   Replay class
+#   TRC_TOF       `range_raw` (pulse, [us])  `ReplayTOFRangingSensor`
+#   TRC_UART      received UART bytes        `ReplayUART`, `ReplayTeraRangerEvoMini`
+#   TRC_COMPASS   heading, pitch, roll       `ReplayCompass`
+#                 (pitch, roll NaN, if only the heading was read)
+#
+# Replay follows a clock, which can be virtual (`VirtualClock`), such that a
+# trace can be run through the decision logic much faster than real time.
+#
+# File layout (all little endian):
+#   Header : magic `RBLTRC`, version (H), number of streams (B), stream kinds
+#            (B each)
+#   Records: time since start in [ms] (I), stream index (B), payload length
+#            (B), payload
+#
+# Usage on the robot:
+#   rec = TraceRecorder("run.trc", [TRC_TOF, TRC_TOF, TRC_TOF])
+#   tofL = RecordingTOF(tofL, rec, 0)
+#   ...
+#   rec.flush()       # when there is time, e.g. in idle windows
+#   rec.close()
+#
+# Usage on the host:
+#   clk = VirtualClock()
+#   trc = TraceReader("run.trc", clk)
+#   tofL = ReplayTOFRangingSensor(trc, 0)    # `as_float=True` for PIO driver
+#   clk.sleep_ms(25)
+#   d = tofL.range_cm
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# 2022-10-18, v1.1, ToF pulse widths are recorded as integers (the PIO driver
+#                   returns floats); `ReplayTOFRangingSensor` can return floats
+# 2022-10-18, v1.2, `RecordingCompass.get_heading` forwards the call and
+#                   records its result
+# ----------------------------------------------------------------------------
+try:
+  import struct
+except ImportError:
+  import ustruct as struct
+try:
+  from micropython import const
+except ImportError:
+  const = lambda x: x
+import time
+import array
+from robotling_lib.sensors.sensor_base import SensorBase
+from robotling_lib.sensors.teraranger_frame import TeraFrameParser
+
+__version__ = "0.1.2.0"
+
+# pylint: disable=bad-whitespace
+TRC_MAGIC      = b"RBLTRC"
+TRC_VERSION    = const(1)
+TRC_REC_HDR    = const(6)
+
+TRC_TOF        = const(0)   # payload: pulse width in [us] (i)
+TRC_UART       = const(1)   # payload: up to 255 received bytes
+TRC_COMPASS    = const(2)   # payload: heading, pitch, roll in [°] (fff)
+
+ERR_TIMEOUT    = const(-1)  # same as in `pololu_tof_ranging.py`
+RBL_OK         = const(0)
+_NAN           = float("nan")
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class VirtualClock(object):
+  """Time source that only advances when asked to; offers the `time`
+     functions used by the robot code (`ticks_ms`, `ticks_us`, `ticks_diff`,
+     `sleep_ms`, `sleep_us`)."""
+
+  def __init__(self, t0_us=0):
+    self._t_us = t0_us
+
+  def ticks_us(self):
+    return self._t_us
+
+  def ticks_ms(self):
+    return self._t_us //1000
+
+  @staticmethod
+  def ticks_diff(t1, t0):
+    return t1 -t0
+
+  @staticmethod
+  def ticks_add(t, dt):
+    return t +dt
+
+  def sleep_us(self, dt_us):
+    self._t_us += max(int(dt_us), 0)
+
+  def sleep_ms(self, dt_ms):
+    self._t_us += max(int(dt_ms *1000), 0)
+
+  def sleep(self, dt_s):
+    self._t_us += max(int(dt_s *1_000_000), 0)
+
+  advance_us = sleep_us
+  advance_ms = sleep_ms
+
+
+class SystemClock(object):
+  """Time source based on the `time` module (MicroPython or CPython)."""
+
+  def ticks_ms(self):
+    if hasattr(time, "ticks_ms"):
+      return time.ticks_ms()
+    return int(time.monotonic() *1000)
+
+  def ticks_diff(self, t1, t0):
+    if hasattr(time, "ticks_diff"):
+      return time.ticks_diff(t1, t0)
+    return t1 -t0
+
+# ----------------------------------------------------------------------------
+class TraceRecorder(object):
+  """Collects records of raw sensor streams in a preallocated buffer and
+     appends them to a trace file when `flush()` is called."""
+
+  def __init__(self, fname, kinds, buf_size=2048, clock=None):
+    """ `kinds` is a list with the kind (`TRC_xxx`) of each stream; the index
+        in this list is the stream index used in `record()`
+    """
+    self._clock = clock if clock else SystemClock()
+    self._buf = bytearray(buf_size)
+    self._mv = memoryview(self._buf)
+    self._n = 0
+    self._nDropped = 0
+    self._t0 = self._clock.ticks_ms()
+    self._file = open(fname, "wb")
+    self._file.write(TRC_MAGIC)
+    self._file.write(struct.pack("<HB", TRC_VERSION, len(kinds)))
+    self._file.write(bytes(kinds))
+
+  def close(self):
+    if self._file:
+      self.flush()
+      self._file.close()
+      self._file = None
+
+  @property
+  def dropped(self):
+    """ Number of records dropped because the buffer was full
+    """
+    return self._nDropped
+
+  def record(self, sid, payload):
+    """ Add a record with the bytes in `payload` for stream `sid`
+    """
+    n = len(payload)
+    i = self._n
+    if i +TRC_REC_HDR +n > len(self._buf):
+      self._nDropped += 1
+      return
+    t = self._clock.ticks_diff(self._clock.ticks_ms(), self._t0)
+    struct.pack_into("<IBB", self._buf, i, t, sid, n)
+    i += TRC_REC_HDR
+    self._buf[i:i +n] = payload
+    self._n = i +n
+
+  def record_int(self, sid, v):
+    i = self._n
+    if i +TRC_REC_HDR +4 > len(self._buf):
+      self._nDropped += 1
+      return
+    t = self._clock.ticks_diff(self._clock.ticks_ms(), self._t0)
+    struct.pack_into("<IBBi", self._buf, i, t, sid, 4, v)
+    self._n = i +TRC_REC_HDR +4
+
+  def record_floats3(self, sid, a, b, c):
+    i = self._n
+    if i +TRC_REC_HDR +12 > len(self._buf):
+      self._nDropped += 1
+      return
+    t = self._clock.ticks_diff(self._clock.ticks_ms(), self._t0)
+    struct.pack_into("<IBBfff", self._buf, i, t, sid, 12, a, b, c)
+    self._n = i +TRC_REC_HDR +12
+
+  def flush(self):
+    """ Append the buffered records to the file
+    """
+    if self._n > 0 and self._file:
+      self._file.write(self._mv[:self._n])
+      self._file.flush()
+      self._n = 0
+
+# ----------------------------------------------------------------------------
+class RecordingTOF(object):
+  """Wraps a Pololu time-of-flight sensor and records every raw reading."""
+
+  def __init__(self, sensor, recorder, sid):
+    self._sens = sensor
+    self._rec = recorder
+    self._sid = sid
+
+  def deinit(self):
+    self._sens.deinit()
+
+  @property
+  def range_raw(self):
+    # The PIO driver returns the pulse width as float; the trace stores it
+    # rounded to [us]
+    v = self._sens.range_raw
+    self._rec.record_int(self._sid, int(v +0.5) if v >= 0 else int(v))
+    return v
+
+  @property
+  def range_cm(self):
+    return _tof_raw_to_cm(self.range_raw)
+
+
+class RecordingUART(object):
+  """Wraps a UART and records all bytes read from it."""
+
+  def __init__(self, uart, recorder, sid):
+    self._uart = uart
+    self._rec = recorder
+    self._sid = sid
+
+  def deinit(self):
+    self._uart.deinit()
+
+  def any(self):
+    return self._uart.any()
+
+  def write(self, buf):
+    return self._uart.write(buf)
+
+  def read(self, n=-1):
+    buf = self._uart.read(n) if n >= 0 else self._uart.read()
+    if buf:
+      self._rec.record(self._sid, buf)
+    return buf
+
+  def readinto(self, buf, n=-1):
+    k = self._uart.readinto(buf, n) if n >= 0 else self._uart.readinto(buf)
+    if k:
+      self._rec.record(self._sid, memoryview(buf)[:k])
+    return k
+
+
+class RecordingCompass(object):
+  """Wraps a compass and records heading, pitch and roll of every
+     `get_heading_3d()` call, and the heading of every `get_heading()` call
+     (with pitch and roll as NaN)."""
+
+  def __init__(self, compass, recorder, sid):
+    self._comp = compass
+    self._rec = recorder
+    self._sid = sid
+
+  def get_heading(self, tilt=False, calib=False, hires=True):
+    res = self._comp.get_heading(tilt, calib, hires)
+    if res >= 0:
+      self._rec.record_floats3(self._sid, res, _NAN, _NAN)
+    return res
+
+  def get_heading_3d(self, calib=False):
+    res = self._comp.get_heading_3d(calib=calib)
+    if res[0] == RBL_OK:
+      self._rec.record_floats3(self._sid, res[1], res[2], res[3])
+    return res
+
+  def get_pitch_roll(self, radians=False):
+    return self._comp.get_pitch_roll(radians=radians)
+
+# ----------------------------------------------------------------------------
+class TraceReader(object):
+  """Loads a trace file and serves the records of each stream according to
+     the time given by `clock` (relative to the creation of the reader or
+     the last call of `rewind()`)."""
+
+  def __init__(self, fname, clock=None):
+    self._clock = clock if clock else SystemClock()
+    with open(fname, "rb") as f:
+      d = f.read()
+    if d[:len(TRC_MAGIC)] != TRC_MAGIC:
+      raise ValueError("Not a sensor trace file")
+    i = len(TRC_MAGIC)
+    ver, nStr = struct.unpack_from("<HB", d, i)
+    if ver != TRC_VERSION:
+      raise ValueError("Unsupported trace version {0}".format(ver))
+    i += 3
+    self._kinds = list(d[i:i +nStr])
+    i += nStr
+    self._t = [[] for _ in range(nStr)]
+    self._p = [[] for _ in range(nStr)]
+    while i +TRC_REC_HDR <= len(d):
+      t, sid, n = struct.unpack_from("<IBB", d, i)
+      i += TRC_REC_HDR
+      if sid >= nStr or i +n > len(d):
+        break
+      self._t[sid].append(t)
+      self._p[sid].append(bytes(d[i:i +n]))
+      i += n
+    self._iNext = [0]*nStr
+    self.rewind()
+
+  def rewind(self):
+    """ Restart replay at the current time of the clock
+    """
+    self._t0 = self._clock.ticks_ms()
+    self._iNext = [0]*len(self._kinds)
+
+  @property
+  def clock(self):
+    return self._clock
+
+  @property
+  def kinds(self):
+    return self._kinds
+
+  @property
+  def duration_ms(self):
+    return max([ts[-1] for ts in self._t if len(ts) > 0] or [0])
+
+  @property
+  def finished(self):
+    """ True if the clock has passed the last record of all streams
+    """
+    return self._now() > self.duration_ms
+
+  def count(self, sid):
+    return len(self._t[sid])
+
+  def _now(self):
+    return self._clock.ticks_diff(self._clock.ticks_ms(), self._t0)
+
+  def latest(self, sid):
+    """ Returns the payload of the newest record of stream `sid` that is not
+        in the future, or None, if there is none yet
+    """
+    ts = self._t[sid]
+    i = self._iNext[sid]
+    now = self._now()
+    while i < len(ts) and ts[i] <= now:
+      i += 1
+    self._iNext[sid] = i
+    return self._p[sid][i -1] if i > 0 else None
+
+  def pending(self, sid):
+    """ Returns the payloads of all records of stream `sid` that are due and
+        have not yet been returned, concatenated
+    """
+    ts = self._t[sid]
+    i0 = i = self._iNext[sid]
+    now = self._now()
+    while i < len(ts) and ts[i] <= now:
+      i += 1
+    self._iNext[sid] = i
+    return b"".join(self._p[sid][i0:i])
+
+  def peek_count(self, sid):
+    """ Returns the number of bytes in due but not yet returned records
+    """
+    ts = self._t[sid]
+    i = self._iNext[sid]
+    now = self._now()
+    n = 0
+    while i < len(ts) and ts[i] <= now:
+      n += len(self._p[sid][i])
+      i += 1
+    return n
+
+# ----------------------------------------------------------------------------
+def _tof_raw_to_cm(t):
+  if t < 1000:
+    return ERR_TIMEOUT
+  return 0.75 *(t -1000) /10
+
+
+class ReplayTOFRangingSensor(SensorBase):
+  """Replays `range_raw` of a Pololu time-of-flight sensor; same interface as
+     `PololuTOFRangingSensor`."""
+
+  def __init__(self, trace, sid, as_float=False):
+    """ With `as_float`, `range_raw` returns floats, like the PIO driver
+        (`pololu_tof_ranging_pio.PololuTOFRangingSensor`) does
+    """
+    super().__init__(driver=None, chan=1)
+    self._trc = trace
+    self._sid = sid
+    self._asFloat = as_float
+    self._type = "time-of-flight range (replay)"
+    self._isReady = True
+
+  def deinit(self):
+    pass
+
+  @property
+  def range_raw(self):
+    p = self._trc.latest(self._sid)
+    v = struct.unpack("<i", p)[0] if p else ERR_TIMEOUT
+    return float(v) if self._asFloat and v >= 0 else v
+
+  @property
+  def range_cm(self):
+    return _tof_raw_to_cm(self.range_raw)
+
+
+class ReplayUART(object):
+  """Replays received bytes; offers the part of the `machine.UART` interface
+     used by the drivers (`any`, `read`, `readinto`, `write`)."""
+
+  def __init__(self, trace, sid):
+    self._trc = trace
+    self._sid = sid
+    self._buf = b""
+
+  def deinit(self):
+    pass
+
+  def _fetch(self):
+    self._buf += self._trc.pending(self._sid)
+
+  def any(self):
+    self._fetch()
+    return len(self._buf)
+
+  def read(self, n=-1):
+    self._fetch()
+    if len(self._buf) == 0:
+      return None
+    n = len(self._buf) if n < 0 else min(n, len(self._buf))
+    res = self._buf[:n]
+    self._buf = self._buf[n:]
+    return res
+
+  def readinto(self, buf, n=-1):
+    self._fetch()
+    n = len(buf) if n < 0 else min(n, len(buf))
+    n = min(n, len(self._buf))
+    if n == 0:
+      return None
+    buf[:n] = self._buf[:n]
+    self._buf = self._buf[n:]
+    return n
+
+  def write(self, buf):
+    # Commands to the sensor are ignored
+    return len(buf)
+
+
+class ReplayTeraRangerEvoMini(object):
+  """Replays the UART byte stream of a TeraRanger Evo Mini and decodes it with
+     the same parser as `TeraRangerEvoMini`; same interface as that class."""
+  # pylint: disable=bad-whitespace
+  TERA_DIST_NEG_INF   = const(0x0000)
+  TERA_DIST_POS_INF   = const(0xFFFF)
+  TERA_DIST_INVALID   = const(0x0001)
+  # pylint: enable=bad-whitespace
+
+  def __init__(self, trace, sid, nPix=4):
+    self._uart = ReplayUART(trace, sid)
+    self._clock = trace.clock
+    self._nPix = nPix if nPix in [1, 2, 4] else 1
+    self._dist = array.array("i", [0]*self._nPix)
+    self._tLast = array.array("I", [0]*self._nPix)
+    self._rxBuf = bytearray(64)
+    self._parser = TeraFrameParser(self._nPix)
+    self._isReady = True
+
+  def __deinit__(self):
+    pass
+
+  def update(self, raw=True):
+    """ Update distance reading(s)
+    """
+    nNew = 0
+    while True:
+      k = self._uart.readinto(self._rxBuf)
+      if not k:
+        break
+      nNew += self._parser.feed(self._rxBuf, 0, k)
+    if nNew == 0:
+      return
+    d = self._parser.values
+    t = self._clock.ticks_ms()
+    for i in range(self._nPix):
+      if raw:
+        self._dist[i] = d[i]
+      elif d[i] != self.TERA_DIST_INVALID:
+        self._dist[i] = d[i]
+        self._tLast[i] = t
+
+  @property
+  def counters(self):
+    return self._parser.counters
+
+  @property
+  def distances(self):
+    return self._dist
+
+  @property
+  def last_valid_ms(self):
+    return self._tLast
+
+
+class ReplayCompass(SensorBase):
+  """Replays heading, pitch and roll; same interface as `Compass`."""
+
+  def __init__(self, trace, sid):
+    super().__init__(None, 0)
+    self._trc = trace
+    self._sid = sid
+    self._type = "Compass (replay)"
+    self._heading = 0.0
+    self._pitch = 0.0
+    self._roll = 0.0
+
+  def _update(self):
+    # Pitch and roll are NaN in records of `get_heading()` calls; then, the
+    # previous values are kept
+    p = self._trc.latest(self._sid)
+    if p:
+      hd, pit, rol = struct.unpack("<fff", p)
+      self._heading = hd
+      if pit == pit:
+        self._pitch = pit
+        self._roll = rol
+
+  def get_heading(self, tilt=False, calib=False, hires=True):
+    self._update()
+    return self._heading
+
+  def get_heading_3d(self, calib=False):
+    self._update()
+    return (RBL_OK, self._heading, self._pitch, self._roll)
+
+  def get_pitch_roll(self, radians=False):
+    self._update()
+    if radians:
+      from math import radians as rad
+      return (RBL_OK, -1, rad(self._pitch), rad(self._roll))
+    return (RBL_OK, -1, self._pitch, self._roll)
+
+# ----------------------------------------------------------------------------
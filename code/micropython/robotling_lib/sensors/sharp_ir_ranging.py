@@ -7,26 +7,83 @@
 # 2018-09-23, v1
 # 2019-08-03, new type of Sharp sensor added (GP2Y0AF15X, 1.5-15 cm)
 # 2019-12-21, native code generation added (requires MicroPython >=1.12)
+# 2022-10-18, lookup table w/ linear interpolation instead of `exp()` calls;
+#             fix for the default coefficients (5 are needed)
+#
+# The range is taken from a table of `LUT_N` distances (in 0.1 mm) for the
+# 12-bit A/D range, which is computed once per sensor model from the
+# coefficients (or loaded from flash, see `save_lut()`), and linearly
+# interpolated.
 # ----------------------------------------------------------------------------
 import array
 from math import exp
+from micropython import const
 from robotling_lib.sensors.sensor_base import SensorBase
 
 # pylint: disable=bad-whitespace
-__version__    = "0.1.1.0"
+__version__    = "0.1.2.0"
 CHIP_NAME_0    = "GP2Y0A41SK0F"  # 4 to 30 cm
 CHIP_NAME_1    = "GP2Y0AF15X"    # 1.5 to 15 cm
+
+LUT_SHIFT      = const(6)        # 64 A/D counts per table entry
+LUT_STEP       = const(64)
+LUT_MASK       = const(63)
+LUT_N          = const(65)       # 4096 /LUT_STEP +1
+LUT_MAX        = const(65535)
 # pylint: enable=bad-whitespace
 
 # ----------------------------------------------------------------------------
 class SharpIRRangingSensor(SensorBase):
   """Base class for analog Sharp IR ranging sensors."""
+  # Lookup tables per sensor model (class name)
+  _luts = {}
 
   def __init__(self, driver, chan):
     super().__init__(driver, chan)
     self._type = "IR range"
-    self._coef = array.array('f', [1,1,1,1])
+    self._coef = array.array('f', [0,0,0,0,0])
     self._maxV = driver.max_value
+    self._lut = None
+
+  def _init_lut(self, lut_file=None):
+    """ Gets the lookup table of this sensor model; it is loaded from
+        `lut_file`, if given and valid, or computed from the coefficients
+        (only once for all sensors of a model)
+    """
+    key = type(self).__name__
+    lut = SharpIRRangingSensor._luts.get(key)
+    if lut is None and lut_file:
+      lut = self._load_lut(lut_file)
+    if lut is None:
+      lut = array.array('H', [0]*LUT_N)
+      for i in range(LUT_N):
+        v = int(self._to_mm(min(i *LUT_STEP, 4095)) *10 +0.5)
+        lut[i] = min(max(v, 0), LUT_MAX)
+    SharpIRRangingSensor._luts[key] = lut
+    self._lut = lut
+
+  @staticmethod
+  def _load_lut(fname):
+    lut = array.array('H', [0]*LUT_N)
+    try:
+      with open(fname, "rb") as f:
+        if f.readinto(lut) == LUT_N *2:
+          return lut
+    except OSError:
+      pass
+    return None
+
+  def save_lut(self, fname):
+    """ Writes the lookup table to a file, from which it can be loaded
+        instead of being computed
+    """
+    with open(fname, "wb") as f:
+      f.write(self._lut)
+
+  def _to_mm(self, x):
+    # Double exponential fit of the range in [cm] for 12-bit A/D values
+    cf = self._coef
+    return (cf[0] +cf[1]*exp(-cf[2]*x) +cf[3]*exp(-cf[4]*x)) *10
 
   @property
   def range_raw(self):
@@ -35,15 +92,27 @@ class SharpIRRangingSensor(SensorBase):
     return self._driver.data[self._chan]
 
   @micropython.native
-  @property
-  def range_cm(self):
+  def _lookup(self):
+    # Range in [0.1 mm], linearly interpolated from the table
     if self._autoUpdate:
       self._driver.update()
-    cf = self._coef
     mx = self._maxV
     x = self._driver.data[self._chan]
-    x = x if mx == 4095 else (x/mx)*4095
-    return cf[0]+ cf[1]*exp(-cf[2]*x)+cf[3]*exp(-cf[4]*x)
+    x = x if mx == 4095 else (x *4095) //mx
+    lut = self._lut
+    i = x >> LUT_SHIFT
+    v0 = lut[i]
+    return v0 +(((lut[i +1] -v0) *(x & LUT_MASK)) >> LUT_SHIFT)
+
+  @property
+  def range_mm(self):
+    """ Range in [mm] (integer)
+    """
+    return (self._lookup() +5) //10
+
+  @property
+  def range_cm(self):
+    return self._lookup() /100
 
 # The following interface classes require an already initialised sensor driver
 # instance and the channel assigned to this sensor instance.
@@ -53,10 +122,11 @@ class SharpIRRangingSensor(SensorBase):
 class GP2Y0A41SK0F(SharpIRRangingSensor):
   """Interface class for Sharp GP2Y0A41SK0F IR ranging sensors (4-30 cm)."""
 
-  def __init__(self, driver, chan):
+  def __init__(self, driver, chan, lut_file=None):
     super().__init__(driver, chan)
     self._type = "IR ranging (Sharp)"
     self._coef = array.array('f', [-1.995,12.9, 0.000329958, 93.928, 0.003793])
+    self._init_lut(lut_file)
     tx = "{0}, A/D channel #{1}".format(self._type, chan)
     print("[{0:>12}] {1:35} ({2}): ok"
           .format(CHIP_NAME_0, tx, __version__))
@@ -64,10 +134,11 @@ class GP2Y0A41SK0F(SharpIRRangingSensor):
 class GP2Y0AF15X(SharpIRRangingSensor):
   """Interface class for Sharp GP2Y0AF15X IR ranging sensors (1.5-15 cm)."""
 
-  def __init__(self, driver, chan):
+  def __init__(self, driver, chan, lut_file=None):
     super().__init__(driver, chan)
     self._type = "IR ranging (Sharp)"
     self._coef = array.array('f', [1.3249, 20.436, 0.0021805, 24.613, 0.064151])
+    self._init_lut(lut_file)
     tx = "{0}, A/D channel #{1}".format(self._type, chan)
     print("[{0:>12}] {1:35} ({2}): ok"
           .format(CHIP_NAME_1, tx, __version__))
@@ -9,16 +9,14 @@
 # 2021-03-14, v1.2, Compatibility w/ rp2
 # 2021-03-14, v1.3, Instead of counting invalid readings, give the time when
 #                   the last valid measurement was taken
+# 2022-10-18, v1.4, Incremental, allocation-free frame parser w/ CRC check
+# 2022-10-18, v1.5, Optional interrupt-driven reception (`use_irq`)
 # ----------------------------------------------------------------------------
 import array
 from micropython import const
 import robotling_lib.misc.ansi_color as ansi
 from robotling_lib.misc.helpers import timed_function
-
-try:
-  import struct
-except ImportError:
-  import ustruct as struct
+from robotling_lib.sensors.teraranger_frame import TeraFrameParser
 
 from robotling_lib.platform.platform import platform as pf
 if pf.languageID == pf.LNG_MICROPYTHON:
@@ -35,7 +33,7 @@ else:
   print("ERROR: No matching hardware libraries in `platform`.")
 
 # pylint: disable=bad-whitespace
-__version__ = "0.1.3.0"
+__version__ = "0.1.5.0"
 
 CHIP_NAME   = "tera_evomini"
 CHAN_COUNT  = const(4)
@@ -48,7 +46,9 @@ TERA_POLL_WAIT_MS   = const(5)
 # Internal constants and register values:
 _TERA_BAUD          = 115200
 _TERA_CMD_WAIT_MS   = const(10)
-_TERA_START_CHR     = b'T'
+_TERA_RX_BUF_SIZE   = const(32)
+_TERA_RING_SIZE     = const(128)  # power of 2
+_TERA_RING_MASK     = const(_TERA_RING_SIZE -1)
 _TERA_OUT_MODE_TEXT = bytearray([0x00, 0x11, 0x01, 0x45])
 _TERA_OUT_MODE_BIN  = bytearray([0x00, 0x11, 0x02, 0x4C])
 _TERA_PIX_MODE_1    = bytearray([0x00, 0x21, 0x01, 0xBC])
@@ -68,13 +68,15 @@ class TeraRangerEvoMini:
   TERA_DIST_INVALID   = const(0x0001)
   # pylint: enable=bad-whitespace
 
-  def __init__(self, id, tx, rx, nPix=4, short=True):
-    """ Requires pins and channel for unused UART
+  def __init__(self, id, tx, rx, nPix=4, short=True, use_irq=False):
+    """ Requires pins and channel for unused UART; with `use_irq`, received
+        bytes are moved into a ring buffer by the UART's RX idle interrupt
+        and `update()` only decodes what is buffered (falls back to polling,
+        if the firmware does not support UART interrupts)
     """
     self._uart = UART(id, tx=tx, rx=rx, baudrate=_TERA_BAUD)
     self._nPix = nPix
     self._short = short
-    self._nInvalData = 0
 
     # Set pixel mode and prepare buffer
     if self._nPix == 4:
@@ -85,10 +87,10 @@ class TeraRangerEvoMini:
       self._nPix = 1
       self._uart.write(_TERA_PIX_MODE_1)
     sleep_ms(_TERA_CMD_WAIT_MS)
-    self._nBufExp = self._nPix*2 +2
     self._dist = array.array("i", [0]*self._nPix)
     self._tLast = array.array("I", [0]*self._nPix)
-    self._sInBuf = b""
+    self._rxBuf = bytearray(_TERA_RX_BUF_SIZE)
+    self._parser = TeraFrameParser(self._nPix)
 
     # Set binary mode for results
     self._uart.write(_TERA_OUT_MODE_BIN)
@@ -101,9 +103,23 @@ class TeraRangerEvoMini:
       self._uart.write(_TERA_RANGE_LONG)
     sleep_ms(_TERA_CMD_WAIT_MS)
 
-    # Prepare polling construct, if available
+    # Use interrupt, if requested and available ...
+    self._useIRQ = False
+    self._nOverrun = 0
+    if use_irq:
+      self._ring = bytearray(_TERA_RING_SIZE)
+      self._iHead = 0
+      self._iTail = 0
+      self._isr = self._on_rx
+      try:
+        self._uart.irq(self._isr, UART.IRQ_RXIDLE, False)
+        self._useIRQ = True
+      except (AttributeError, ValueError, TypeError):
+        pass
+
+    # ... otherwise, prepare polling construct, if available
     self._poll = None
-    if pf.ID in [pf.ENV_ESP32_UPY, pf.ENV_MPY_RP2]:
+    if not self._useIRQ and pf.ID in [pf.ENV_ESP32_UPY, pf.ENV_MPY_RP2]:
       self._poll = select.poll()
       self._poll.register(self._uart, select.POLLIN)
 
@@ -111,81 +127,110 @@ class TeraRangerEvoMini:
     c = ansi.GREEN if self._isReady else ansi.RED
     print(c +"[{0:>12}] {1:35} ({2}): {3}"
           .format(CHIP_NAME, "TeraRanger Evo Mini", __version__,
-                  "ok" if self._isReady else "NOT FOUND") +ansi.BLACK)
+                  ("ok" +(" (IRQ)" if self._useIRQ else ""))
+                  if self._isReady else "NOT FOUND") +ansi.BLACK)
 
   def __deinit__(self):
     if self._uart is not None:
+      if self._useIRQ:
+        self._uart.irq(None)
       self._uart.deinit()
       self._isReady == False
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _on_rx(self, uart):
+    # UART interrupt: move the received bytes into the ring buffer
+    u = self._uart
+    buf = self._rxBuf
+    ring = self._ring
+    n = u.any()
+    while n > 0:
+      k = u.readinto(buf, min(n, _TERA_RX_BUF_SIZE))
+      if not k:
+        break
+      n -= k
+      h = self._iHead
+      for i in range(k):
+        hNext = (h +1) & _TERA_RING_MASK
+        if hNext == self._iTail:
+          # Ring buffer full, drop the rest
+          self._nOverrun += k -i
+          break
+        ring[h] = buf[i]
+        h = hNext
+      self._iHead = h
+
   def update(self, raw=True):
     """ Update distance reading(s)
     """
-    if self._uart is not None:
+    if self._useIRQ:
+      # Decode what the interrupt has buffered
+      h = self._iHead
+      t = self._iTail
+      if h == t:
+        return
+      if h > t:
+        nNew = self._parser.feed(self._ring, t, h)
+      else:
+        nNew = self._parser.feed(self._ring, t, _TERA_RING_SIZE)
+        nNew += self._parser.feed(self._ring, 0, h)
+      self._iTail = h
+      if nNew > 0:
+        self._store(raw)
+
+    elif self._uart is not None:
       # Check if any new data arrived ...
       if self._poll:
         self._poll.poll(TERA_POLL_WAIT_MS)
-      if self._uart.any() == 0:
+      n = self._uart.any()
+      if n == 0:
         # No new data
         return
 
-      # Data are waiting; add them to the buffer
-      nExp = self._nBufExp
-      sBuf = bytes()
-      '''
-      sBuf = self._uart.readline()
-      if not sBuf:
-        # UART returns None?!
-        self.__logError("UART returns `None`")
-        return
-      '''
-      while self._uart.any() > 0:
-        sBuf += self._uart.read(1)
+      # Feed the waiting data to the parser, which keeps incomplete frames
+      nNew = 0
+      buf = self._rxBuf
+      while n > 0:
+        k = self._uart.readinto(buf, min(n, _TERA_RX_BUF_SIZE))
+        if not k:
+          break
+        nNew += self._parser.feed(buf, 0, k)
+        n -= k
+      if nNew > 0:
+        self._store(raw)
+
+  def _store(self, raw):
+    # Copy the values of the latest frame
+    d = self._parser.values
+    if raw:
+      # Just copy new values to `dist`
+      for i in range(self._nPix):
+        self._dist[i] = d[i]
+    else:
+      # Check if values are valid and keep track of last valid reading
+      t = ticks_ms()
+      for i in range(self._nPix):
+        if d[i] != TERA_DIST_INVALID:
+          self._dist[i] = d[i]
+          self._tLast[i] = t
 
-      self._sInBuf += bytearray(sBuf)
-      if len(self._sInBuf) < nExp:
-        # (Still) too few characters for a complete message
-        return
+  @property
+  def counters(self):
+    """ Returns the number of good frames, of frames with a CRC error and of
+        re-synchronizations
+    """
+    return self._parser.counters
 
-      # Should contain a complete reading
-      tmp = self._sInBuf.split(_TERA_START_CHR)
-      nDt = len(tmp)
-      if nDt == 0:
-        self._nInvalData += 1
-        return
+  @property
+  def overruns(self):
+    """ Returns the number of bytes lost, because the ring buffer was full
+        (only with `use_irq`)
+    """
+    return self._nOverrun
 
-      if len(tmp[nDt -1]) < nExp -1:
-        # Incomplete dataset at the end; keep characters
-        self._sInBuf = _TERA_START_CHR +tmp[nDt -1]
-        iDt = nDt -2
-        if len(tmp[iDt]) < nExp -1:
-          self._nInvalData += 1
-          return
-      else:
-        # Ends with a complete dataset or is only one dataset
-        self._sInBuf = bytes()
-        iDt = nDt -1
-
-      # Decode reading
-      self._nInvalData = 0
-      np = self._nPix
-      if np == 4:
-        d = struct.unpack_from('>HHHH', tmp[iDt][0:8]) #buf[1:9])
-      elif np == 2:
-        d = struct.unpack_from('>HH', tmp[iDt][0:4]) #buf[1:5])
-      else:
-        d = struct.unpack_from('>H',  tmp[iDt][0:2]) #buf[1:3])
-      if raw:
-        # Just copy new values to `dist`
-        self._dist = d
-      else:
-        # Check if values are valid and keep track of last valid reading
-        t = ticks_ms()
-        for iv,v in enumerate(d):
-          if v is not TERA_DIST_INVALID:
-            self._dist[iv] = v
-            self._tLast[iv] = t
+  @property
+  def uses_irq(self):
+    return self._useIRQ
 
   @property
   def distances(self):
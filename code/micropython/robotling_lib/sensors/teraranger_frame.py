@@ -0,0 +1,124 @@
+# ----------------------------------------------------------------------------
+# teraranger_frame.py
+# Incremental parser for the binary frames of TeraRanger sensors (e.g. Evo
+# Mini): 'T', n 16-bit big-endian distances, CRC-8 (polynomial 0x07) over
+# all preceding bytes of the frame.
+#
+# Bytes are fed in as they arrive (`feed()`); complete frames with a valid
+# CRC are decoded into an `array("i")` without allocating memory. A frame
+# with a wrong CRC is dropped and the parser re-synchronizes on the next 'T'
+# within the dropped bytes, as a 0x54 in the data may have been mistaken for
+# the start of a frame.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# ----------------------------------------------------------------------------
+import array
+try:
+  from micropython import const
+except ImportError:
+  const = lambda x: x
+
+__version__ = "0.1.0.0"
+
+# pylint: disable=bad-whitespace
+TERA_START     = const(0x54)  # 'T'
+TERA_CRC_POLY  = const(0x07)
+# pylint: enable=bad-whitespace
+
+def _make_crc_table():
+  tab = bytearray(256)
+  for i in range(256):
+    c = i
+    for _ in range(8):
+      c = ((c << 1) ^ TERA_CRC_POLY) & 0xFF if c & 0x80 else (c << 1) & 0xFF
+    tab[i] = c
+  return tab
+
+CRC8_TABLE = _make_crc_table()
+
+def crc8(buf, n):
+  """ CRC-8 of the first `n` bytes of `buf`
+  """
+  c = 0
+  tab = CRC8_TABLE
+  for i in range(n):
+    c = tab[c ^ buf[i]]
+  return c
+
+# ----------------------------------------------------------------------------
+class TeraFrameParser(object):
+  """Frame-sync state machine for frames with `nVal` distance values."""
+
+  def __init__(self, nVal):
+    self._nVal = nVal
+    self._nFrame = nVal *2 +2
+    self._frame = bytearray(self._nFrame)
+    self._pos = 0
+    self._inSync = False
+    self.values = array.array("i", [0]*nVal)
+    self._nGood = 0
+    self._nCRCErr = 0
+    self._nResync = 0
+
+  @property
+  def counters(self):
+    """ Returns the number of good frames, of (presumed) frames with a CRC
+        error and of re-synchronizations; after a CRC error, a 0x54 in the
+        data may count as another erroneous frame
+    """
+    return self._nGood, self._nCRCErr, self._nResync
+
+  def reset(self):
+    self._pos = 0
+    self._inSync = False
+
+  def feed(self, buf, i0, i1):
+    """ Processes the bytes `buf[i0:i1]`; returns the number of complete
+        frames, the values of the last one are in `values`
+    """
+    frm = self._frame
+    nFrm = self._nFrame
+    pos = self._pos
+    nNew = 0
+    i = i0
+    while i < i1:
+      b = buf[i]
+      i += 1
+      if pos == 0:
+        if b != TERA_START:
+          if self._inSync:
+            # Expected the start of a frame
+            self._inSync = False
+            self._nResync += 1
+          continue
+      frm[pos] = b
+      pos += 1
+      if pos < nFrm:
+        continue
+
+      # Complete frame
+      if crc8(frm, nFrm -1) == frm[nFrm -1]:
+        v = self.values
+        for j in range(self._nVal):
+          v[j] = (frm[1 +2*j] << 8) | frm[2 +2*j]
+        self._nGood += 1
+        self._inSync = True
+        nNew += 1
+        pos = 0
+      else:
+        # Drop the frame and continue with the next 'T' in it, if any
+        self._nCRCErr += 1
+        self._nResync += 1
+        self._inSync = False
+        k = 1
+        while k < nFrm and frm[k] != TERA_START:
+          k += 1
+        pos = nFrm -k
+        for j in range(pos):
+          frm[j] = frm[k +j]
+    self._pos = pos
+    return nNew
+
+# ----------------------------------------------------------------------------
@@ -8,6 +8,8 @@
 # 2021-03-03, v1.0
 # 2021-04-05, v1.1 - D21 instead of D9, because the latter shows irrative
 #                    behaviour when used together with picodisplay
+# 2022-10-18, v1.2 - VL53L0X timing budget and continuous mode period,
+#                    calibration cache
 # ----------------------------------------------------------------------------
 from micropython import const
 from robotling_lib.platform.rp2 import board_rp2 as board
@@ -58,6 +60,11 @@ TOFL_SHUT_1    = board.D3
 TOFL_SHUT_2    = board.D22
 TOF_MAX_MM     = const(200)
 TOF_MIN_MM     = const(80)
+TOFL_BUDGET_US = const(40000) # Timing budget per measurement
+TOFL_PERIOD_MS = const(0)   # Continuous mode: 0=back-to-back, else period
+TOFL_PRE_VCSEL = const(12)  # VCSEL pulse periods (pre-range, final range)
+TOFL_FIN_VCSEL = const(8)
+TOFL_CAL_FILE  = "tofl_cal.bin" # Calibration cache (None=always calibrate)
 
 # pylint: enable=bad-whitespace
 
@@ -6,6 +6,10 @@
 # The MIT License (MIT)
 # Copyright (c) 2021 Thomas Euler
 # 2021-04-03, v1.0
+# 2022-10-18, v1.1, VL53L0X sensors range continuously, results are collected
+#                   in the hardware loop; optional calibration cache
+# 2022-10-18, v1.2, VL53L0X bus shared via `I2CBusManager` (serialised
+#                   transactions, retries, per-device statistics)
 # ----------------------------------------------------------------------------
 import time
 import array
@@ -14,14 +18,16 @@ from machine import Pin, I2C, ADC
 import micropython
               
 from robotling_lib.platform.rp2 import board_rp2 as board
-from vl53l0x import setup_tofl_device, TBOOT
+from robotling_lib.platform.rp2.i2c_manager import I2CBusManager
+from vl53l0x import setup_tofl_device, TBOOT, CAL_SIZE
+from tofl_manager import VL53L0XManager, VL53L0XCalCache
 import rbl2_gui
 import rbl2_config as cfg
 import rbl2_global as glb
 import rbl2_gait as gait
 
 # pylint: disable=bad-whitespace
-__version__  = "0.1.0.0"
+__version__  = "0.1.2.0"
 
 # Global variables to communicate with task on core 1
 # (Do not access other than via the `RobotBase` instance!!)
@@ -30,6 +36,9 @@ g_state      = glb.STATE_NONE
 g_cmd        = glb.CMD_NONE
 g_counter    = 0
 g_dist_evo   = None
+g_dist_tof   = None
+g_tofl       = None
+g_i2c        = None
 g_move_dir   = 0.
 g_move_vel   = 2
 g_do_exit    = False
@@ -43,7 +52,7 @@ class Robot(object):
 
   def __init__(self, core=1, use_gui=True, verbose=False):
     global g_state
-    global g_dist_tof
+    global g_dist_tof, g_tofl, g_i2c
     global tofl0, tofl1, tofl2
     global g_gui
     global g_gait
@@ -78,34 +87,42 @@ class Robot(object):
         device_1_xshut.value(1)
         device_2_xshut.value(1)
         utime.sleep_us (TBOOT)
-        i2c = I2C(id=cfg.TOFL_I2C, sda=Pin(cfg.TOFL_SDA), scl=Pin(cfg.TOFL_SCL))
+        i2c = I2CBusManager(
+            I2C(id=cfg.TOFL_I2C, sda=Pin(cfg.TOFL_SDA), scl=Pin(cfg.TOFL_SCL))
+          )
+        g_i2c = i2c
+
+        # Calibrations and addresses from the cache file, if any
+        cache = None
+        if cfg.TOFL_CAL_FILE:
+            cache = VL53L0XCalCache(cfg.TOFL_CAL_FILE, CAL_SIZE)
+        addr0 = cache.address(0, 0x31) if cache else 0x31
+        addr1 = cache.address(1, 0x33) if cache else 0x33
 
         addresses =i2c.scan()
-        if (not (0x31 in addresses)):
+        if (not (addr0 in addresses)):
 #            print("Setting up device 0")
             device_1_xshut.value(0)
             device_2_xshut.value(0)
-            tofl0 = setup_tofl_device(i2c, 40000, 12, 8)
-            tofl0.set_address(0x31)
+            tofl0 = _setup_tofl(i2c, cache, 0, addr0, False)
         else:
 #            print("Reconnect device 0")
             device_1_xshut.value(0)
             device_2_xshut.value(0)
-            tofl0 = setup_tofl_device(i2c, 40000, 12, 8, 0x31)
+            tofl0 = _setup_tofl(i2c, cache, 0, addr0, True)
 
-        if (not (0x33 in addresses)):
+        if (not (addr1 in addresses)):
 #            print("Setting up device 1")
             device_1_xshut.value(1)
             device_2_xshut.value(0)
             utime.sleep_us(TBOOT)
-            tofl1 = setup_tofl_device(i2c, 40000, 12, 8)
-            tofl1.set_address(0x33)
+            tofl1 = _setup_tofl(i2c, cache, 1, addr1, False)
         else:
 #            print("Reconnect device 1")
             device_1_xshut.value(1)
             device_2_xshut.value(0)
             utime.sleep_us(TBOOT)
-            tofl1 = setup_tofl_device(i2c, 40000, 12, 8, 0x33)
+            tofl1 = _setup_tofl(i2c, cache, 1, addr1, True)
 
         if (0x29 in addresses):
 #            print("Now setting up device 2")
@@ -113,12 +130,24 @@ class Robot(object):
             device_1_xshut.value(1)
             device_2_xshut.value(1)
             utime.sleep_us(TBOOT)
-            tofl2 = setup_tofl_device(i2c, 40000, 12, 8)
+            tofl2 = _setup_tofl(i2c, cache, 2, 0x29, True)
         else:
             print("!!!!Fehler!!!")
-            
+
+        # All three sensors range continuously; the hardware loop collects
+        # the results
+        g_tofl = VL53L0XManager([tofl2, tofl0, tofl1])
+        g_tofl.start(cfg.TOFL_PERIOD_MS)
         g_dist_tof = True
 
+        # Keep new calibrations; if a sensor does not range with a restored
+        # one, drop the cache to calibrate fully on the next boot
+        if cache:
+            if not g_tofl.all_valid():
+                cache.invalidate()
+            else:
+                cache.save()
+
     # Depending on `core`, the thread that updates the hardware either runs
     # on the second core (`core` == 1) or on the same core as the main program
     # (`core` == 0). In the latter case, the classes `sleep_ms()` function
@@ -145,6 +174,7 @@ class Robot(object):
       g_gui.deinit()
       g_gui.LED.RGB = (60,0,0)
     if g_dist_tof:
+      g_tofl.stop()
       tofl0.set_address(0x29)
       tofl1.set_address(0x29)
     if g_state is not glb.STATE_OFF:
@@ -175,15 +205,17 @@ class Robot(object):
         depends on the sensor: e.g. the vl53l0x reports 1 value, 3 times.
     """
     if g_dist_tof:
-        _d = array.array('i', (0 for _ in range(3)))
-        _d[0] = tofl2.ping()
-        _d[1] = tofl0.ping()
-        _d[2] = tofl1.ping()
-#        _d = [150, 150, 150]
-        return _d
+        # Latest frame, collected by the hardware loop
+        return array.array('i', g_tofl.distances)
     else:
         return []
 
+  def print_bus_stats(self):
+    """ Print the transactions, bytes, errors and bus time per I2C device
+    """
+    if g_i2c:
+      g_i2c.print_stats()
+
   @property
   def is_connected_via_usb(self):
     """ Returns True if connected via USB cable (and VSYS is present)
@@ -222,7 +254,7 @@ class Robot(object):
           vbus, pw_V
         )
       if g_dist_tof:
-        g_gui.show_distance_tof(self.distances_mm)
+        g_gui.show_distance_tof(g_tofl.distances)
 
   def show_message(self, msg):
     """ Show a message on the display
@@ -382,6 +414,8 @@ class Robot(object):
       g_state_gait = g_gait.state
       if g_dist_evo:
         g_dist_evo.update(raw=True)
+      if g_tofl:
+        g_tofl.update()
       if g_gui:
         g_gui.spin()
       g_counter += 1
@@ -448,6 +482,8 @@ class Robot(object):
           g_state_gait = g_gait.state
           if g_dist_evo:
             g_dist_evo.update(raw=False)
+          if g_tofl:
+            g_tofl.update()
           g_gui.spin()
           g_counter += 1
           g_led.value(0)
@@ -464,6 +500,22 @@ class Robot(object):
       glb.toLog("Hardware thread ended.")
       g_state = glb.STATE_OFF
 
+# ----------------------------------------------------------------------------
+def _setup_tofl(i2c, cache, slot, addr, reconnect):
+  """ Set up VL53L0X sensor `slot` w/ its calibration from `cache`, if any
+      (otherwise, calibrate fully and add it); the sensor is at `addr` if
+      `reconnect` is True, otherwise at 0x29 and it gets address `addr`
+  """
+  par = (cfg.TOFL_BUDGET_US, cfg.TOFL_PRE_VCSEL, cfg.TOFL_FIN_VCSEL)
+  cal = cache.get(slot, *par) if cache else None
+  tofl = setup_tofl_device(i2c, *par, address=addr if reconnect else 0x29,
+                           cal=cal)
+  if not reconnect and addr != 0x29:
+    tofl.set_address(addr)
+  if cache and cal is None:
+    cache.put(slot, addr, *par, tofl.get_calibration())
+  return tofl
+
 # ----------------------------------------------------------------------------
 if __name__ == "__main__":
 # Initialize robot
@@ -534,6 +586,7 @@ if __name__ == "__main__":
 
   except KeyboardInterrupt:
     # Clean up
+    Robot.print_bus_stats()
     Robot.deinit()
 
 # ----------------------------------------------------------------------------
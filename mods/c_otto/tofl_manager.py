@@ -0,0 +1,194 @@
+# ----------------------------------------------------------------------------
+# tofl_manager.py
+# Round-robin manager for several VL53L0X time-of-flight sensors
+#
+# All sensors range continuously (back-to-back, or with a fixed
+# inter-measurement period); `update()` is called once per hardware cycle and
+# collects, without waiting, the results of whichever sensors are ready.
+# The last frame is cached, hence reading the distances costs no I2C time
+# and all sensors are about one timing budget old instead of their sum.
+#
+# `VL53L0XCalCache` keeps the calibration (SPAD map, reference calibration,
+# timing configuration; see `VL53L0X.get_calibration()`) and the assigned I2C
+# address of each sensor in a small file, to skip the full calibration on
+# later boots.
+#
+# The MIT License (MIT)
+# Copyright (c) 2022 Thomas Euler
+# 2022-10-18, v1.0
+# 2022-10-18, v1.1, results counted per sensor; `all_valid()` (a scalar `in`
+#                   test on an `array` is not supported by MicroPython)
+# ----------------------------------------------------------------------------
+import array
+import os
+import struct
+from time import ticks_ms, ticks_diff, sleep_ms
+from micropython import const
+
+# pylint: disable=bad-whitespace
+__version__    = "0.1.1.0"
+FIRST_WAIT_MS  = const(250)   # Wait this long for a first complete frame
+DIST_NONE      = const(-1)
+CAL_MAGIC      = b"VLCC"
+CAL_VERSION    = const(1)
+CAL_HDR_FMT    = "<4sBB"       # magic, version, number of records
+CAL_REC_FMT    = "<BBIBB"      # slot, address, budget [us], pre, final VCSEL
+# pylint: enable=bad-whitespace
+
+# ----------------------------------------------------------------------------
+class VL53L0XManager(object):
+  """Collects the ranges of several VL53L0X sensors in continuous mode."""
+
+  def __init__(self, sensors):
+    """ `sensors` is a list of initialized `VL53L0X` objects, in the order
+        of the distances to report
+    """
+    self._sensors = sensors
+    n = len(sensors)
+    self._dist = array.array("i", [DIST_NONE]*n)
+    self._tLast = array.array("i", [0]*n)
+    self._nRes = array.array("I", [0]*n)
+    self._nNew = 0
+    self._nErr = 0
+    self._isRunning = False
+
+  def start(self, period=0):
+    """ Start all sensors in continuous mode, back-to-back (`period`=0) or
+        every `period` ms, and wait for the first complete frame
+    """
+    for s in self._sensors:
+      s.start(period)
+    self._isRunning = True
+    t0 = ticks_ms()
+    while (not self.all_valid() and
+           ticks_diff(ticks_ms(), t0) < FIRST_WAIT_MS):
+      self.update()
+      sleep_ms(5)
+
+  def stop(self):
+    if self._isRunning:
+      for s in self._sensors:
+        s.stop()
+      self._isRunning = False
+
+  def update(self):
+    """ Collect the results of all sensors that are ready; returns the number
+        of new results (non-blocking)
+    """
+    if not self._isRunning:
+      return 0
+    n = 0
+    d = self._dist
+    for i, s in enumerate(self._sensors):
+      try:
+        v = s.poll()
+      except OSError:
+        self._nErr += 1
+        continue
+      if v >= 0:
+        d[i] = v
+        self._tLast[i] = ticks_ms()
+        self._nRes[i] += 1
+        n += 1
+    self._nNew += n
+    return n
+
+  @property
+  def distances(self):
+    """ Latest distances in [mm] (cached; DIST_NONE, if there was none yet)
+    """
+    return self._dist
+
+  def all_valid(self):
+    """ Returns True, if every sensor has delivered at least one result
+    """
+    for n in self._nRes:
+      if n == 0:
+        return False
+    return True
+
+  def age_ms(self, i):
+    """ Time since the latest result of sensor `i` in [ms]
+    """
+    return ticks_diff(ticks_ms(), self._tLast[i])
+
+  @property
+  def counters(self):
+    """ Returns the number of results and of I2C errors so far
+    """
+    return self._nNew, self._nErr
+
+# ----------------------------------------------------------------------------
+class VL53L0XCalCache(object):
+  """Calibration cache for VL53L0X sensors, stored on flash."""
+
+  def __init__(self, fname, cal_size):
+    """ `cal_size` is the length of a calibration (`vl53l0x.CAL_SIZE`); a
+        cache with a different format is ignored (stale)
+    """
+    self._fname = fname
+    self._calSize = cal_size
+    self._recs = {}
+    self._isDirty = False
+    self._load()
+
+  def _load(self):
+    nHdr = struct.calcsize(CAL_HDR_FMT)
+    nRec = struct.calcsize(CAL_REC_FMT)
+    try:
+      with open(self._fname, "rb") as f:
+        magic, ver, n = struct.unpack(CAL_HDR_FMT, f.read(nHdr))
+        if magic != CAL_MAGIC or ver != CAL_VERSION:
+          return
+        for _ in range(n):
+          rec = struct.unpack(CAL_REC_FMT, f.read(nRec))
+          cal = f.read(self._calSize)
+          if len(cal) < self._calSize:
+            break
+          self._recs[rec[0]] = (rec[1:], cal)
+    except (OSError, ValueError):
+      self._recs = {}
+
+  def get(self, slot, budget_us, pre, final):
+    """ Returns the calibration of sensor `slot`, if it was taken with the
+        same timing budget and VCSEL periods, otherwise None
+    """
+    r = self._recs.get(slot)
+    if r and r[0][1:] == (budget_us, pre, final):
+      return r[1]
+    return None
+
+  def address(self, slot, default):
+    """ Returns the I2C address assigned to sensor `slot`
+    """
+    r = self._recs.get(slot)
+    return r[0][0] if r else default
+
+  def put(self, slot, addr, budget_us, pre, final, cal):
+    self._recs[slot] = ((addr, budget_us, pre, final), bytes(cal))
+    self._isDirty = True
+
+  def save(self):
+    """ Writes the cache, if it was changed
+    """
+    if not self._isDirty:
+      return
+    with open(self._fname, "wb") as f:
+      f.write(struct.pack(CAL_HDR_FMT, CAL_MAGIC, CAL_VERSION,
+                          len(self._recs)))
+      for slot, (rec, cal) in self._recs.items():
+        f.write(struct.pack(CAL_REC_FMT, slot, *rec))
+        f.write(cal)
+    self._isDirty = False
+
+  def invalidate(self):
+    """ Removes the cache file, e.g. if a restored sensor does not range
+    """
+    self._recs = {}
+    self._isDirty = False
+    try:
+      os.remove(self._fname)
+    except OSError:
+      pass
+
+# ----------------------------------------------------------------------------
@@ -105,17 +105,33 @@ ALGO_PHASECAL_LIM = const(0x30)
 ALGO_PHASECAL_CONFIG_TIMEOUT = const(0x30)
 TBOOT = 1200 # microseconds
 
+# Calibration cache (see `get_calibration()`): SPAD map (6 bytes at 0xB0),
+# VHV and phase reference calibration, and the timing budget and VCSEL
+# period configuration as bursts of consecutive registers (page 0) plus
+# ALGO_PHASECAL_LIM (page 1)
+_CAL_SPAD = const(0)
+_CAL_REF = const(6)
+_CAL_CONF = const(8)
+_CAL_CONFIG_RUNS = ((0x30, 1), (0x32, 1), (0x46, 3), (0x50, 3), (0x56, 2),
+                    (0x70, 3))
+CAL_SIZE = _CAL_CONF + sum(n for _, n in _CAL_CONFIG_RUNS) + 1
+
 class TimeoutError(RuntimeError):
     pass
 
 
 class VL53L0X:
     vcsel_period_type = ["VcselPeriodPreRange", "VcselPeriodFinalRange"]
-    def __init__(self, i2c, address=0x29):
+    def __init__(self, i2c, address=0x29, cal=None):
+        """ `cal` is an optional calibration from `get_calibration()`; with
+            it, the SPAD info read and reference calibrations are skipped
+        """
         self.i2c = i2c
         self.address = address
+        self._buf1 = bytearray(1)
+        self._buf2 = bytearray(2)
         utime.sleep_ms(100) # give the I2C time to init
-        self.init()
+        self.init(cal=cal)
         self._started = False
         self.measurement_timing_budget_us = 0
         self.set_measurement_timing_budget(self.measurement_timing_budget_us)
@@ -173,7 +189,7 @@ class VL53L0X:
         for register, value in config:
             self._register(register, value)
 
-    def init(self, power2v8=True):
+    def init(self, power2v8=True, cal=None):
         # validate in the same way the adafruit code does
         if (
             self._register(0xC0) != 0xEE
@@ -211,8 +227,9 @@ class VL53L0X:
 
         self._register(_SYSTEM_SEQUENCE, 0xff)
 
-        spad_count, is_aperture = self._spad_info()
-        spad_map = bytearray(self._registers(_SPAD_ENABLES, struct='6B'))
+        if cal is None:
+            spad_count, is_aperture = self._spad_info()
+            spad_map = bytearray(self._registers(_SPAD_ENABLES, struct='6B'))
 
         # set reference spads
         self._config(
@@ -223,12 +240,15 @@ class VL53L0X:
             (_REF_EN_START_SELECT, 0xb4),
         )
 
-        spads_enabled = 0
-        for i in range(48):
-            if i < 12 and is_aperture or spads_enabled >= spad_count:
-                spad_map[i // 8] &= ~(1 << (i >> 2))
-            elif spad_map[i // 8] & (1 << (i >> 2)):
-                spads_enabled += 1
+        if cal is None:
+            spads_enabled = 0
+            for i in range(48):
+                if i < 12 and is_aperture or spads_enabled >= spad_count:
+                    spad_map[i // 8] &= ~(1 << (i >> 2))
+                elif spad_map[i // 8] & (1 << (i >> 2)):
+                    spads_enabled += 1
+        else:
+            spad_map = cal[_CAL_SPAD:_CAL_SPAD + 6]
 
         self._registers(_SPAD_ENABLES, spad_map, struct='6B')
 
@@ -337,10 +357,13 @@ class VL53L0X:
         # self._register(_SYSTEM_SEQUENCE, 0xe8)
         # self._timing_budget(budget)
 
-        self._register(_SYSTEM_SEQUENCE, 0x01)
-        self._calibrate(0x40)
-        self._register(_SYSTEM_SEQUENCE, 0x02)
-        self._calibrate(0x00)
+        if cal is None:
+            self._register(_SYSTEM_SEQUENCE, 0x01)
+            self._calibrate(0x40)
+            self._register(_SYSTEM_SEQUENCE, 0x02)
+            self._calibrate(0x00)
+        else:
+            self._ref_calibration(cal[_CAL_REF], cal[_CAL_REF + 1])
 
         self._register(_SYSTEM_SEQUENCE, 0xe8)
 
@@ -403,6 +426,49 @@ class VL53L0X:
         self._register(_INTERRUPT_CLEAR, 0x01)
         self._register(_SYSRANGE_START, 0x00)
 
+    def _ref_calibration(self, vhv=None, phase=None):
+        # Read (w/o arguments) or write the VHV and phase calibration values
+        self._config((0xFF, 0x01), (0x00, 0x00), (0xFF, 0x00))
+        if vhv is None:
+            vhv = self._register(0xCB) & 0x7F
+            phase = self._register(0xEE) & 0xEF
+        else:
+            self._register(0xCB, (self._register(0xCB) & 0x80) | vhv)
+            self._register(0xEE, (self._register(0xEE) & 0x80) | phase)
+        self._config((0xFF, 0x01), (0x00, 0x01), (0xFF, 0x00))
+        return vhv, phase
+
+    def get_calibration(self):
+        """ Returns the SPAD map, the reference calibration and the timing
+            configuration (`CAL_SIZE` bytes), to be restored with `cal` of
+            `__init__()` and `set_timing_config()`
+        """
+        cal = bytearray(CAL_SIZE)
+        cal[_CAL_SPAD:_CAL_SPAD + 6] = self.i2c.readfrom_mem(
+            self.address, _SPAD_ENABLES, 6)
+        cal[_CAL_REF], cal[_CAL_REF + 1] = self._ref_calibration()
+        i = _CAL_CONF
+        for reg, n in _CAL_CONFIG_RUNS:
+            cal[i:i + n] = self.i2c.readfrom_mem(self.address, reg, n)
+            i += n
+        self._register(0xFF, 0x01)
+        cal[i] = self._register(ALGO_PHASECAL_LIM)
+        self._register(0xFF, 0x00)
+        return bytes(cal)
+
+    def set_timing_config(self, cal, budget_us):
+        """ Restores the timing budget and VCSEL period configuration from
+            a calibration (instead of `set_measurement_timing_budget()` and
+            `set_Vcsel_pulse_period()`)
+        """
+        mv = memoryview(cal)
+        i = _CAL_CONF
+        for reg, n in _CAL_CONFIG_RUNS:
+            self.i2c.writeto_mem(self.address, reg, mv[i:i + n])
+            i += n
+        self._config((0xFF, 0x01), (ALGO_PHASECAL_LIM, cal[i]), (0xFF, 0x00))
+        self.measurement_timing_budget_us = budget_us
+
     def start(self, period=0):
         self._config(
             (0x80, 0x01),
@@ -462,6 +528,20 @@ class VL53L0X:
         self._register(_INTERRUPT_CLEAR, 0x01)
         return value
 
+    def poll(self):
+        """ Non-blocking read for continuous mode (see `start()`): returns the
+            range in mm, if a new measurement is ready, otherwise -1
+        """
+        self.i2c.readfrom_mem_into(self.address, _RESULT_INTERRUPT_STATUS,
+                                   self._buf1)
+        if not self._buf1[0] & 0x07:
+            return -1
+        buf = self._buf2
+        self.i2c.readfrom_mem_into(self.address, _RESULT_RANGE_STATUS + 10, buf)
+        self._buf1[0] = 0x01
+        self.i2c.writeto_mem(self.address, _INTERRUPT_CLEAR, self._buf1)
+        return (buf[0] << 8) | buf[1]
+
     def set_signal_rate_limit(self, limit_Mcps):
         if limit_Mcps < 0 or limit_Mcps > 511.99:
             return False
@@ -687,7 +767,14 @@ class VL53L0X:
         self._register(SYSRANGE_START, 0x00)
         return True
 
-def setup_tofl_device(i2c, timing_budget, pre_range, final_range, address=0x29):
+def setup_tofl_device(i2c, timing_budget, pre_range, final_range, address=0x29,
+                      cal=None):
+    # With a calibration from `VL53L0X.get_calibration()` for the same
+    # parameters, only restore the registers
+    if cal is not None and len(cal) == CAL_SIZE:
+        tofl = VL53L0X(i2c, address, cal)
+        tofl.set_timing_config(cal, timing_budget)
+        return tofl
     tofl = VL53L0X(i2c, address)
     # initialise timing budget
     # the measuring_timing_budget is a value in ms, the longer the budget, the more accurate the reading.